@@ -8,6 +8,7 @@ import glob
 import struct
 import select
 import os
+import sys
 import inspect
 import robot.libraries.OperatingSystem as ROS
 import json
@@ -17,6 +18,9 @@ import unicodedata
 import subprocess
 import psutil
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libraries'))
+from DebugLogIndex import DebugLogIndex
+
 
 VERSION = 0.02
 
@@ -98,7 +102,12 @@ class ArbCommands(object):
                 find_file_txt = glob.glob('%s/*_debug.log' % (path))
                 find_file_gz = glob.glob('%s/*_debug.log.gz' % (path))
 
-                if len(find_file_txt) == 1:
+                find_file = find_file_txt or find_file_gz
+                if len(find_file) == 1 and os.path.exists(find_file[0] + '.idx'):
+                    # Indexed, only the end of the log needs reading
+                    debug('Using debug log index')
+                    ret = DebugLogIndex(find_file[0]).tail(length, offset)
+                elif len(find_file_txt) == 1:
                     debug('Using debug log txt format')
                     ret = _tail_file(find_file_txt[0], length, offset)
                 elif len(find_file_gz) == 1:
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""     Benchmark the Debug capture path with replayed logs
+
+Starts a _utils/debug_replay.py per port, each replaying a recorded debug
+log into its own pty, and captures every port with Debug exactly as
+`Capture Debug` would: reader thread (or the shared DebugHub reader),
+terminal handling, listeners and the log writer.
+
+The replays run in their own processes and insert a timestamped probe line
+every --probe lines, so the figures are for the capture path alone:
+    - throughput   bytes/sec read, over all ports and per port
+    - latency      time from a probe being written to its listener firing
+    - CPU          capture CPU time as a percentage of one core, per port
+
+Usage:
+    _utils/debug_capture_bench.py [--ports N] [--speed X] [--shared] [--emulation MODE]
+                                  [--listeners N] [--compressed] LOG
+
+Example:
+    $ _utils/debug_capture_bench.py --ports 16 --speed 0 --shared --emulation fast boot_ax5x.log.gz
+"""
+
+import argparse
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'libraries'))
+
+import Debug
+from debug_replay import PROBE
+
+PROBE_TIME = re.compile(PROBE + r' (\d+\.\d+)')
+
+
+class ProbeTimer(object):
+    """     Listener callback noting how long after being sent each probe was heard
+    """
+
+    def __init__(self):
+        self.latencies = []
+
+    def __call__(self, hit):
+        now = time.time()
+        match = PROBE_TIME.search(hit.line)
+        if match:
+            self.latencies.append(now - float(match.group(1)))
+
+
+def _cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def _emulation(value):
+    return {'true': True, 'false': False}.get(value.lower(), value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--ports', type=int, default=1,
+                        help='ports captured at once (default 1)')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='replay speed, 0 for as fast as possible (default 0)')
+    parser.add_argument('--probe', type=int, default=100,
+                        help='lines between latency probes (default 100)')
+    parser.add_argument('--shared', action='store_true',
+                        help='read every port from the shared DebugHub thread')
+    parser.add_argument('--emulation', default='true',
+                        help='terminal emulation: true, false or fast (default true)')
+    parser.add_argument('--listeners', type=int, default=10,
+                        help='extra listeners that never match (default 10)')
+    parser.add_argument('--compressed', action='store_true',
+                        help='write gzip compressed logs')
+    parser.add_argument('log', help='recorded debug log (.log or .log.gz)')
+    args = parser.parse_args()
+
+    outdir = tempfile.mkdtemp(prefix='debug_bench_')
+    replays = []
+    ports = []
+    captures = []
+    timers = []
+
+    try:
+        for n in range(args.ports):
+            replay = subprocess.Popen([sys.executable, os.path.join(HERE, 'debug_replay.py'),
+                                       '--speed', str(args.speed), '--probe', str(args.probe),
+                                       '--wait', args.log],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            ports.append(replay.stdout.readline().strip())
+            replays.append(replay)
+
+            debug = Debug.Debug(appendsuffix='bench%d' % n, shared_reader=args.shared,
+                                terminal_emulation=_emulation(args.emulation))
+            debug._outputpath = os.path.join(outdir, 'bench%d_debug.log' % n)
+            timer = ProbeTimer()
+            debug.subscribe(PROBE, callback=timer)
+            timers.append(timer)
+            for extra in range(args.listeners):
+                debug.add_listener('DEBUG-BENCH-NEVER-%d' % extra)
+            captures.append(debug)
+
+        for debug, port in zip(captures, ports):
+            debug.open_connection(port, compressed=args.compressed)
+
+        start = time.time()
+        cpu_start = _cpu()
+        for replay in replays:
+            replay.stdin.write('\n')
+            replay.stdin.flush()
+
+        written = []
+        for replay in replays:
+            done = replay.stdout.readline().split()
+            written.append(int(done[1]) if len(done) == 2 else 0)
+
+        # Let the readers catch up with the last of the output
+        while any(debug.get_time_since_last_read() < 0.5 for debug in captures):
+            time.sleep(0.1)
+        end = max(debug._lastread for debug in captures)
+        cpu = _cpu() - cpu_start
+
+    finally:
+        for debug in captures:
+            if debug._connected:
+                debug.close()
+        for replay in replays:
+            replay.stdin.close()
+            replay.wait()
+        shutil.rmtree(outdir, ignore_errors=True)
+
+    elapsed = end - start
+    total = sum(written)
+    latencies = [latency for timer in timers for latency in timer.latencies]
+
+    print "%d port(s), %s, emulation=%s, %d listeners, %s" % (
+        args.ports, "shared reader" if args.shared else "reader per port",
+        args.emulation, args.listeners + 2, "gzip" if args.compressed else "plain")
+    print "  elapsed    %8.2fs" % elapsed
+    print "  throughput %12d bytes/sec total, %d bytes/sec per port" % (
+        total / elapsed, total / elapsed / args.ports)
+    if latencies:
+        print "  latency    median %.2fms  p95 %.2fms  max %.2fms  (%d probes)" % (
+            _percentile(latencies, 50) * 1000, _percentile(latencies, 95) * 1000,
+            max(latencies) * 1000, len(latencies))
+    else:
+        print "  latency    no probes heard"
+    print "  CPU        %.1f%% of a core per port" % (cpu / elapsed / args.ports * 100)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""     Compare the throughput of the Debug library's terminal handling modes
+
+Feeds a recorded debug log through the pyte based TerminalEmulator (the
+default, terminal_emulation=True) and the streaming AnsiFilter
+(terminal_emulation=fast) in serial-read sized chunks, and reports the
+bytes/sec each one manages.
+
+Logs can be plain or gzipped.  Raw recordings (e.g. from
+_utils/debug_replay.py or `cat /dev/ttyUSB0 > boot.log`) give the most
+realistic figures since they still contain the escape sequences.
+
+Usage:
+    _utils/debug_filter_bench.py [--chunk BYTES] [--repeat N] LOG [LOG ...]
+
+Example:
+    $ _utils/debug_filter_bench.py --chunk 256 --repeat 3 boot_ax5x.log boot_a160.log.gz
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libraries'))
+
+import Debug
+
+
+def _read_log(path):
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _run(filt, chunks):
+    start = time.time()
+    for chunk in chunks:
+        filt.feed(chunk)
+        filt.read()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--chunk', type=int, default=256,
+                        help='bytes per simulated serial read (default 256)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='passes over each log, best time is reported (default 1)')
+    parser.add_argument('logs', nargs='+', help='recorded debug logs (.log or .log.gz)')
+    args = parser.parse_args()
+
+    modes = [('fast', lambda: Debug.AnsiFilter())]
+    if Debug.pyte:
+        modes.insert(0, ('emulator', lambda: Debug.TerminalEmulator()))
+    else:
+        print "pyte is not installed, only the fast filter will be measured"
+
+    for path in args.logs:
+        data = _read_log(path)
+        chunks = _chunks(data, args.chunk)
+        print "%s: %d bytes in %d chunks" % (os.path.basename(path), len(data), len(chunks))
+
+        baseline = None
+        for name, make in modes:
+            best = min(_run(make(), chunks) for _ in range(args.repeat))
+            rate = len(data) / best if best else 0
+            if baseline is None:
+                baseline = best
+                print "  %-10s %8.3fs %12d bytes/sec" % (name, best, rate)
+            else:
+                print "  %-10s %8.3fs %12d bytes/sec   (%.1fx)" % (name, best, rate, baseline / best)
+
+
+if __name__ == '__main__':
+    main()
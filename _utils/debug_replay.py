@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""     Replay a captured debug log into a pseudo-terminal
+
+Stands in for an STB on a USB serial adapter.  Opens a pty, prints the name
+of its serial end (e.g. /dev/pts/7) and writes the log into it, so Debug,
+`Capture Debug`, `Wait For Debug Listener` and `Wait For Debug Inactivity`
+can be exercised without a box.  e.g. in a suite:
+
+    | Capture debug | debugport=/dev/pts/7 |
+
+Pacing, in order of preference:
+    - the host receive timestamps Debug adds with timestamps=${True}
+      (these are stripped, the pty sees the original output)
+    - STB syslog timestamps ("Mar  1 10:22:41.327 ...")
+    - the serial baud rate, for logs with no timestamps at all
+
+--speed scales the original timing (2 = twice as fast), --speed 0 writes as
+fast as the reader takes it.  --max-gap caps idle periods in the log.
+
+--wait holds off writing until a line is read from stdin, so the reader
+can open the port first.
+
+--probe N inserts a "DEBUG-REPLAY-PROBE <send time>" line every N lines,
+which _utils/debug_capture_bench.py uses to measure listener latency.
+
+Once the log has been written "done <bytes>" is printed and the pty is held
+open until stdin is closed (or Ctrl-C), so a slow reader still gets all of
+the output.
+
+Usage:
+    _utils/debug_replay.py [--speed X] [--baud N] [--max-gap S] [--probe N] [--loop N] [--wait] LOG
+
+Example:
+    $ _utils/debug_replay.py --speed 10 Soak_STB1_debug.log.gz
+    /dev/pts/7
+"""
+
+import argparse
+import datetime
+import gzip
+import os
+import pty
+import re
+import sys
+import time
+import tty
+
+# Host receive timestamp added by Debug(line_timestamps=True)
+HOST_STAMP = re.compile(r'^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{3})\] ')
+
+# STB syslog timestamp, as used by PostProcessing
+SYSLOG_STAMP = re.compile(r'^([A-Z][a-z]{2} +\d{1,2} \d\d:\d\d:\d\d(?:\.\d+)?)')
+
+PROBE = "DEBUG-REPLAY-PROBE"
+
+# Bytes written to the pty at a time when not pacing by line
+WRITE_SIZE = 4096
+
+
+def _open_log(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _host_time(line):
+    match = HOST_STAMP.match(line)
+    if not match:
+        return None, line
+    ts = datetime.datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S.%f")
+    return time.mktime(ts.timetuple()) + ts.microsecond / 1000000.0, line[match.end():]
+
+
+def _syslog_time(line):
+    match = SYSLOG_STAMP.match(line)
+    if not match:
+        return None
+    stamp = " ".join(match.group(1).split())
+    try:
+        if '.' in stamp:
+            ts = datetime.datetime.strptime(stamp, "%b %d %H:%M:%S.%f")
+        else:
+            ts = datetime.datetime.strptime(stamp, "%b %d %H:%M:%S")
+    except ValueError:
+        return None
+    # No year in syslog, only the differences matter
+    return (ts - datetime.datetime(1900, 1, 1)).total_seconds()
+
+
+def _timestamp_style(path):
+    with _open_log(path) as f:
+        for count, line in enumerate(f):
+            if _host_time(line)[0] is not None:
+                return "host"
+            if _syslog_time(line) is not None:
+                return "syslog"
+            if count > 1000:
+                break
+    return None
+
+
+class LogReplay(object):
+    """     Writes a debug log into a pty with the log's original timing
+
+    'speed' scales the timing, 0 writes as fast as the pty will take it.
+    'baud' paces logs without timestamps.  'max_gap' caps the wait between
+    two lines.  'probe' inserts a timestamped probe line every 'probe'
+    lines.
+    """
+
+    def __init__(self, path, speed=1.0, baud=115200, max_gap=None, probe=0):
+        self._path = path
+        self._speed = speed
+        self._baud = baud
+        self._max_gap = max_gap
+        self._probe = probe
+        self._style = _timestamp_style(path)
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.written = 0
+
+    def run(self):
+        if self._speed == 0 and not self._probe:
+            self._run_unpaced()
+        else:
+            self._run_lines()
+
+    def close(self):
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _write(self, data):
+        while data:
+            sent = os.write(self._master, data)
+            data = data[sent:]
+            self.written += sent
+
+    def _run_unpaced(self):
+        with _open_log(self._path) as f:
+            while True:
+                data = f.read(WRITE_SIZE)
+                if not data:
+                    return
+                self._write(data)
+
+    def _run_lines(self):
+        start = time.time()
+        offset = None       # log time - replay time, for the lines seen so far
+        last = None
+
+        with _open_log(self._path) as f:
+            for count, line in enumerate(f):
+                if self._style == "host":
+                    logtime, line = _host_time(line)
+                elif self._style == "syslog":
+                    logtime = _syslog_time(line)
+                else:
+                    # Baud pacing: 10 bits a character on the wire
+                    logtime = self.written * 10.0 / self._baud
+
+                if self._speed and logtime is not None:
+                    if last is not None and self._max_gap is not None and logtime - last > self._max_gap:
+                        offset += logtime - last - self._max_gap
+                    if offset is None or (last is not None and logtime < last):
+                        # First line, or the box rebooted and its clock went back
+                        offset = logtime - (time.time() - start) * self._speed
+                    last = logtime
+                    delay = start + (logtime - offset) / self._speed - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if self._probe and count % self._probe == 0:
+                    self._write("%s %.6f\r\n" % (PROBE, time.time()))
+                self._write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed relative to the original, 0 for as fast as possible (default 1)')
+    parser.add_argument('--baud', type=int, default=115200,
+                        help='pacing for logs with no timestamps (default 115200)')
+    parser.add_argument('--max-gap', type=float, default=None,
+                        help='longest pause between two lines, in seconds of log time')
+    parser.add_argument('--probe', type=int, default=0,
+                        help='insert a latency probe line every N lines')
+    parser.add_argument('--loop', type=int, default=1,
+                        help='times to replay the log (default 1)')
+    parser.add_argument('--wait', action='store_true',
+                        help='wait for a line on stdin before starting')
+    parser.add_argument('log', help='captured debug log (.log or .log.gz)')
+    args = parser.parse_args()
+
+    replay = LogReplay(args.log, speed=args.speed, baud=args.baud,
+                       max_gap=args.max_gap, probe=args.probe)
+    print replay.port
+    sys.stdout.flush()
+
+    try:
+        if args.wait:
+            sys.stdin.readline()
+        for _ in range(args.loop):
+            replay.run()
+        print "done %d" % replay.written
+        sys.stdout.flush()
+        # Hold the pty open until whoever started us has read everything
+        sys.stdin.read()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        replay.close()
+
+
+if __name__ == '__main__':
+    main()
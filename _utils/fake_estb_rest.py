@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""     Fake ESTB REST API for testing the REST keywords without an STB
+
+Serves a small, in memory version of the API the ESTB libraries use, on
+port --port (10080, as the STB) of each address given:
+
+    GET    /player                 ["1", "2"]
+    POST   /player                 creates a player from the JSON body, {"id": "3"}
+    GET    /player/N               the player's properties
+    GET    /player/N?audio         just its "audio" property
+    PUT    /player/N               merges the JSON body into its properties
+    POST   /player/N/ACTION        records ACTION (open, play...) and the JSON body
+    DELETE /player/N               removes it
+
+and the same for /recorder and /tuner.  /system is a single object, GET
+and PUT as a player, /system/hdmi returns its supported resolutions.
+
+Connections are kept alive.  --latency adds a delay to every request, to
+stand in for the STB's web server.
+
+Usage:
+    _utils/fake_estb_rest.py [--port PORT] [--latency MS] ADDRESS [ADDRESS...]
+
+Example:
+    $ _utils/fake_estb_rest.py 127.0.0.2
+"""
+
+import argparse
+import BaseHTTPServer
+import json
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+
+COLLECTIONS = ("player", "recorder", "tuner")
+
+PLAYER = {"audio": {"info": [{"lang": "eng"}, {"lang": "fre"}]},
+          "subtitle": {"info": [{"lang": "eng"}]},
+          "closed_caption": {"enable": 0}}
+
+SYSTEM = {"subtitle": {"enable": 0},
+          "hdmi": {"supported_resolution": ["480p", "576p", "720p", "1080i", "1080p"]}}
+
+
+class FakeESTBRestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        server = self.server
+        length = int(self.headers.getheader("Content-Length") or 0)
+        body = self.rfile.read(length) if length else ""
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlparse.urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            self._reply(400, {"error": "body is not json"})
+            return
+        with server.lock:
+            code, reply = server.dispatch(method, parts, url.query, data)
+        self._reply(code, reply)
+
+    def _reply(self, code, reply):
+        body = json.dumps(reply)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeESTBRestServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, port=10080, latency=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (address, port), FakeESTBRestHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.objects = dict((name, {}) for name in COLLECTIONS)
+        self.next_id = dict((name, 1) for name in COLLECTIONS)
+        self.system = json.loads(json.dumps(SYSTEM))
+        self.requests = 0
+
+    def dispatch(self, method, parts, query, data):
+        self.requests += 1
+        if not parts:
+            return 404, {"error": "not found"}
+        if parts[0] == "system":
+            target = self.system
+            for part in parts[1:]:
+                if part not in target:
+                    return 404, {"error": "not found"}
+                target = target[part]
+            if method == "PUT":
+                target.update(data)
+            return (200, target) if method in ("GET", "PUT") else (405, {"error": "not allowed"})
+        if parts[0] not in COLLECTIONS:
+            return 404, {"error": "not found"}
+
+        objects = self.objects[parts[0]]
+        if len(parts) == 1:
+            if method == "GET":
+                return 200, sorted(objects, key=int)
+            if method == "POST":
+                new_id = str(self.next_id[parts[0]])
+                self.next_id[parts[0]] += 1
+                objects[new_id] = dict(json.loads(json.dumps(PLAYER)) if parts[0] == "player" else {}, **data)
+                return 200, {"id": new_id}
+            return 405, {"error": "not allowed"}
+
+        if parts[1] not in objects:
+            return 404, {"error": "no %s %s" % (parts[0], parts[1])}
+        properties = objects[parts[1]]
+        if len(parts) > 2:
+            if method != "POST":
+                return 405, {"error": "not allowed"}
+            properties.update(data)
+            properties["last_command"] = parts[2]
+            return 200, {"result": "ok"}
+        if method == "GET":
+            if query:
+                return 200, dict((key, properties[key]) for key in query.split("&") if key in properties)
+            return 200, properties
+        if method == "PUT":
+            properties.update(data)
+            return 200, properties
+        if method == "DELETE":
+            del objects[parts[1]]
+            return 200, {"result": "ok"}
+        return 405, {"error": "not allowed"}
+
+
+def start_servers(addresses, port=10080, latency=0):
+    servers = []
+    for address in addresses:
+        server = FakeESTBRestServer(address, port, latency)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip())
+    parser.add_argument('addresses', nargs='+', metavar='ADDRESS',
+                        help='address to serve a fake REST API on')
+    parser.add_argument('--port', type=int, default=10080,
+                        help='port to serve on (default 10080)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every request (default 0)')
+    args = parser.parse_args()
+
+    start_servers(args.addresses, args.port, args.latency / 1000.0)
+    print "%d fake ESTB REST API(s) on port %d, Ctrl-C to stop" % (len(args.addresses), args.port)
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""     Fake netbooter power switches for testing power cycling without a rack
+
+Serves the two pages the STB libraries use, on port --port of each address
+given, with basic authentication (admin:admin):
+
+    /status.xml         <response><rly0>1</rly0>...<rly7>1</rly7></response>
+    /cmd.cgi?rly=N      toggles outlet N
+
+Every outlet starts on.  --latency adds a delay to every request, to stand
+in for the netbooter's slow web server.  Each switch is printed with the
+time, so the stagger between outlets can be checked.
+
+Usage:
+    _utils/fake_netbooter.py [--port PORT] [--outlets N] [--latency MS] ADDRESS [ADDRESS...]
+
+Example (port 80, as the libraries expect, needs root):
+    $ sudo _utils/fake_netbooter.py 127.0.0.2 127.0.0.3
+"""
+
+import argparse
+import base64
+import BaseHTTPServer
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+
+AUTH = "Basic " + base64.b64encode("admin:admin")
+
+
+class FakeNetbooterHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if self.headers.getheader("Authorization") != AUTH:
+            self._reply(401, "Unauthorised", {"WWW-Authenticate": 'Basic realm="netbooter"'})
+            return
+        url = urlparse.urlparse(self.path)
+        if url.path == "/status.xml":
+            with server.lock:
+                body = "<response>%s</response>" % "".join(
+                    "<rly%d>%d</rly%d>" % (n, state, n) for n, state in enumerate(server.outlets))
+            self._reply(200, body, {"Content-Type": "text/xml"})
+        elif url.path == "/cmd.cgi":
+            query = urlparse.parse_qs(url.query)
+            try:
+                outlet = int(query["rly"][0])
+                with server.lock:
+                    server.outlets[outlet] ^= 1
+                    state = server.outlets[outlet]
+            except (KeyError, ValueError, IndexError):
+                self._reply(400, "Bad request")
+                return
+            print "%.3f %s outlet %d %s" % (time.time(), server.server_address[0], outlet,
+                                            "on" if state else "off")
+            sys.stdout.flush()
+            self._reply(200, "Success! %d" % state)
+        else:
+            self._reply(404, "Not found")
+
+    def _reply(self, code, body, headers={}):
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeNetbooterServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, port=80, outlets=8, latency=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (address, port), FakeNetbooterHandler)
+        self.outlets = [1] * outlets
+        self.latency = latency
+        self.lock = threading.Lock()
+
+
+def start_servers(addresses, port=80, outlets=8, latency=0):
+    servers = []
+    for address in addresses:
+        server = FakeNetbooterServer(address, port, outlets, latency)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip())
+    parser.add_argument('addresses', nargs='+', metavar='ADDRESS',
+                        help='address to serve a fake netbooter on')
+    parser.add_argument('--port', type=int, default=80,
+                        help='port to serve on (default 80)')
+    parser.add_argument('--outlets', type=int, default=8,
+                        help='outlets per netbooter (default 8)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every request (default 0)')
+    args = parser.parse_args()
+
+    start_servers(args.addresses, args.port, args.outlets, args.latency / 1000.0)
+    print "%d fake netbooter(s) on port %d, Ctrl-C to stop" % (len(args.addresses), args.port)
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""     Fake STB telnet servers for testing stats collection without a rack
+
+Listens on --boxes consecutive ports from --port, each behaving enough like
+an Aminet STB's telnet shell for Capture STB Statistics, StatSampler and
+StatCollector: a login and password prompt, the "[root@AMINET]# " prompt,
+echo of the command line, and made up but plausible output for:
+
+    echo (with $?), date, top -n 1 | head -n 2 | tail -n 1, cat /proc/meminfo,
+    grep wlan0 /proc/net/wireless, qoemon (-sP, -sV, -sA, or left running
+    with -c N until Ctrl-C), libconfig-get, libconfig-set,
+    libconfig-dump (to a file), cat and rm of that file
+
+Commands can be chained with ';'.  --latency adds a delay to every
+command, to stand in for a busy box.  --rtt delays everything the box
+sends without holding up the commands after it, to stand in for the
+network round trip.
+
+Usage:
+    _utils/fake_stb_telnet.py [--boxes N] [--port PORT] [--latency MS] [--rtt MS]
+
+Example:
+    $ _utils/fake_stb_telnet.py --boxes 40 --port 2300 --latency 20
+"""
+
+import argparse
+import Queue
+import random
+import select
+import shlex
+import SocketServer
+import sys
+import threading
+import time
+
+PROMPT = "[root@AMINET]# "
+
+# Seconds between the samples of a qoemon left running
+STREAM_TICK = 0.2
+
+MEMINFO = """MemTotal:         %(total)d kB
+MemFree:          %(free)d kB
+Buffers:          %(buffers)d kB
+Cached:           %(cached)d kB
+SwapCached:              0 kB
+Active:           %(active)d kB
+Inactive:         %(inactive)d kB
+SwapTotal:               0 kB
+SwapFree:                0 kB
+"""
+
+LIBCONFIG = {
+    "NORFLASH.TVSYSTEM": "PAL",
+    "NORFLASH.TIME_ZONE": "GMT",
+    "NORFLASH.WIRELESS_SSID": "TestSSID01",
+    "SETTINGS.OUTPUT_RESOLUTION": "HD720P",
+    "SETTINGS.AUDIO_OUTPUT": "STEREO",
+}
+
+
+class FakeShell(object):
+    """     Just enough of a busybox shell to answer the stats commands
+    """
+
+    def __init__(self, latency=0):
+        self._latency = latency
+        self._free = random.randint(60000, 120000)
+        self._status = 0
+        self._config = dict(LIBCONFIG)
+        self._files = {}
+        self._started = time.time()
+
+    def run(self, line):
+        if self._latency:
+            time.sleep(self._latency)
+        output = []
+        for command in line.split(';'):
+            command = command.strip()
+            if command:
+                text = self._command(command)
+                self._status = 127 if text.startswith("sh: ") else 0
+                output.append(text)
+        return ''.join(output)
+
+    def _command(self, command):
+        if command.startswith("echo "):
+            words = [word.replace("$?", str(self._status)) for word in shlex.split(command)[1:]]
+            return " ".join(words) + "\r\n"
+        if command.startswith("date"):
+            return time.strftime("%Y%m%d%H%M%S") + "\r\n"
+        if command.startswith("top"):
+            usr, sys = random.randint(0, 40), random.randint(0, 20)
+            return "CPU: %3d%% usr %3d%% sys   0%% nic %3d%% idle   0%% io   0%% irq   0%% sirq\r\n" % (
+                usr, sys, 100 - usr - sys)
+        if command == "cat /proc/meminfo":
+            self._free = max(1000, self._free + random.randint(-500, 500))
+            text = MEMINFO % {'total': 250000, 'free': self._free, 'buffers': 4000,
+                              'cached': 50000, 'active': 90000, 'inactive': 40000}
+            return text.replace("\n", "\r\n")
+        if command.startswith("grep wlan0 /proc/net/wireless"):
+            return " wlan0: 0000   %d.  -%d.  -256        0      0      0      0      0        0\r\n" % (
+                random.randint(40, 70), random.randint(40, 70))
+        if command.startswith("libconfig-"):
+            return self._libconfig(shlex.split(command))
+        if command.startswith("cat ") and command[4:].strip() in self._files:
+            return self._files[command[4:].strip()]
+        if command.startswith("rm ") and command[3:].strip() in self._files:
+            del self._files[command[3:].strip()]
+            return ""
+        if command.startswith("qoemon"):
+            return self._qoemon(command)
+        return "sh: %s: not found\r\n" % command.split()[0]
+
+
+    def _qoemon(self, command):
+        # PTS counts go up at 25 a second from when the box was logged in to
+        pts = int((time.time() - self._started) * 25)
+        if "-sP" in command:
+            return "V: %d A: %d\r\n" % (pts, pts + random.randint(-2, 2))
+        if "-sV" in command or "-sA" in command:
+            return "LastPTS: %d\r\n" % (pts * 3600)
+        return "Skips: 0  Discontinuities: %d  Buffer: %d%%\r\n" % (
+            random.randint(0, 2), random.randint(20, 90))
+
+    def streams(self, line):
+        # qoemon asked for more than one sample prints one a tick until interrupted
+        words = line.split()
+        return (words[:1] == ["qoemon"] and "-c" in words[:-1] and
+                words[words.index("-c") + 1] not in ("0", "1"))
+
+    def _libconfig(self, words):
+        if words[0] == "libconfig-get" and len(words) == 2 and words[1] in self._config:
+            return self._config[words[1]] + "\r\n"
+        if words[0] == "libconfig-set" and len(words) == 3:
+            current = self._config.get(words[1], "")
+            self._config[words[1]] = words[2]
+            return "Setting '%s'=%s\r\n%s currently %s\r\n" % (words[1], words[2], words[1], current)
+        if words[0] == "libconfig-dump" and len(words) in (2, 3):
+            group = words[2] + "." if len(words) == 3 else ""
+            self._files[words[1]] = "".join("%s=%s\r\n" % (key, value)
+                                            for key, value in sorted(self._config.items())
+                                            if key.startswith(group))
+            return ""
+        return "sh: %s: not found\r\n" % words[0]
+
+
+class FakeSTBHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        shell = FakeShell(self.server.latency)
+        if self.server.rtt:
+            self._delayed = Queue.Queue()
+            sender = threading.Thread(target=self._send_delayed)
+            sender.daemon = True
+            sender.start()
+        self._send("\r\nAmino Aminet\r\nlogin: ")
+        if not self.rfile.readline():
+            return
+        self._send("Password: ")
+        if not self.rfile.readline():
+            return
+        self._send("\r\n" + PROMPT)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.rstrip("\r\n")
+            # A telnet shell echoes the command back
+            if shell.streams(line):
+                self._send(line + "\r\n")
+                self._stream(shell, line)
+                continue
+            self._send(line + "\r\n" + shell.run(line) + PROMPT)
+
+    def _stream(self, shell, line):
+        # Until Ctrl-C arrives
+        while True:
+            if not select.select([self.request], [], [], STREAM_TICK)[0]:
+                self._send(shell.run(line))
+                continue
+            data = self.request.recv(1024)
+            if not data:
+                return
+            if "\x03" in data:
+                self._send("^C\r\n" + PROMPT)
+                return
+
+    def _send(self, text):
+        if self.server.rtt:
+            self._delayed.put((time.time() + self.server.rtt, text))
+        else:
+            self.wfile.write(text)
+
+    def _send_delayed(self):
+        while True:
+            due, text = self._delayed.get()
+            time.sleep(max(due - time.time(), 0))
+            try:
+                self.wfile.write(text)
+                self.wfile.flush()
+            except Exception:
+                return
+
+
+class FakeSTBServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port, latency=0, rtt=0):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', port), FakeSTBHandler)
+        self.latency = latency
+        self.rtt = rtt
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-session is normal here
+        pass
+
+
+def start_servers(boxes, port, latency=0, rtt=0):
+    servers = []
+    for n in range(boxes):
+        server = FakeSTBServer(port + n, latency, rtt)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--boxes', type=int, default=1,
+                        help='number of fake STBs, one port each (default 1)')
+    parser.add_argument('--port', type=int, default=2300,
+                        help='port of the first fake STB (default 2300)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every command (default 0)')
+    parser.add_argument('--rtt', type=float, default=0,
+                        help='network round trip in milliseconds (default 0)')
+    args = parser.parse_args()
+
+    start_servers(args.boxes, args.port, args.latency / 1000.0, args.rtt / 1000.0)
+    print "%d fake STB(s) on 127.0.0.1 ports %d-%d, Ctrl-C to stop" % (
+        args.boxes, args.port, args.port + args.boxes - 1)
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""     Compare thread-per-STB stats capture with the shared StatCollector
+
+Starts _utils/fake_stb_telnet.py with --boxes fake STBs, then samples them
+for --duration seconds at --interval two ways:
+
+    threads     a thread and Robot Telnet session per box, as
+                Capture STB Statistics does by default (without terminal
+                emulation, so the real thing costs more)
+    collector   every box from the one StatCollector thread, as
+                Capture STB Statistics shared=${True} does
+
+and reports, for each:
+    - CPU       this process's CPU time as a percentage of one core
+    - samples   samples collected against the number expected
+    - spread    within each interval, the gap between the first and last
+                box being sampled (median and worst), i.e. how far out of
+                step the fleet's samples are
+
+Usage:
+    _utils/stats_collector_bench.py [--boxes N] [--interval S] [--duration S] [--latency MS]
+
+Example:
+    $ _utils/stats_collector_bench.py --boxes 40 --interval 1 --duration 30
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'libraries'))
+
+import robot.libraries.Telnet as Telnet
+
+import StatCollector
+import StatSampler
+from fake_stb_telnet import PROMPT
+
+PORT = 2300
+
+
+def _cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _thread_box(port, interval, abort, sent):
+    conn = Telnet.Telnet(newline="\n")
+    conn.open_connection('127.0.0.1', port=port, prompt=PROMPT, terminal_emulation=False,
+                         window_size='400x100')
+    conn.login("root", "root2root", login_prompt="login: ", password_prompt="Password: ",
+               login_timeout="2 seconds")
+    sampler = StatSampler.StatSampler()
+    command = sampler.command()
+    clock = StatSampler.SampleClock(interval, abort)
+    while not abort.is_set():
+        start = time.time()
+        sampler.parse(conn.execute_command(command))
+        sent.append(start)
+        if not clock.wait():
+            break
+    conn.close_connection()
+
+
+def run_threads(args):
+    abort = threading.Event()
+    sent = [[] for _ in range(args.boxes)]
+    threads = [threading.Thread(target=_thread_box, args=(PORT + n, args.interval, abort, sent[n]))
+               for n in range(args.boxes)]
+    cpu = _cpu()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    abort.set()
+    for thread in threads:
+        thread.join()
+    return _cpu() - cpu, sent
+
+
+def run_collector(args):
+    collector = StatCollector.StatCollector.get_collector()
+    sent = [[] for _ in range(args.boxes)]
+    cpu = _cpu()
+    for n in range(args.boxes):
+        collector.add("box%d" % n, '127.0.0.1', StatSampler.StatSampler(), args.interval,
+                      callback=lambda sample, n=n: sent[n].append(sample["sent"]),
+                      port=PORT + n, prompt=PROMPT)
+    time.sleep(args.duration)
+    for n in range(args.boxes):
+        collector.remove("box%d" % n)
+    return _cpu() - cpu, sent
+
+
+def _report(name, args, cpu, sent):
+    buckets = {}
+    for times in sent:
+        for when in times:
+            buckets.setdefault(int(when / args.interval), []).append(when)
+    spreads = sorted(max(times) - min(times) for times in buckets.values()
+                     if len(times) == args.boxes)
+    expected = args.boxes * int(args.duration / args.interval)
+    print "%-10s CPU %5.1f%%   samples %5d/%-5d" % (
+        name, cpu / args.duration * 100, sum(len(times) for times in sent), expected),
+    if spreads:
+        print "  spread median %.1fms  worst %.1fms" % (
+            spreads[len(spreads) // 2] * 1000, spreads[-1] * 1000)
+    else:
+        print "  spread n/a (no interval had a sample from every box)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--boxes', type=int, default=20,
+                        help='number of fake STBs (default 20)')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between samples (default 1)')
+    parser.add_argument('--duration', type=float, default=20.0,
+                        help='seconds to sample for, per model (default 20)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds the fake STBs take per command (default 0)')
+    args = parser.parse_args()
+
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'fake_stb_telnet.py'),
+                               '--boxes', str(args.boxes), '--port', str(PORT),
+                               '--latency', str(args.latency)],
+                              stdout=subprocess.PIPE)
+    server.stdout.readline()
+
+    try:
+        print "%d boxes, %.1fs interval, %.0fs each" % (args.boxes, args.interval, args.duration)
+        _report("threads", args, *run_threads(args))
+        _report("collector", args, *run_collector(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
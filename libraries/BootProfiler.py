@@ -0,0 +1,200 @@
+"""
+Classes:
+    BootProfiler - Times the milestones of each boot from an STB's debug output
+    BootTimeline - The milestone times of one boot
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import csv
+import math
+import os
+import threading
+import time
+
+__version__ = "0.1 beta"
+
+# Milestones timed by default, in boot order, as (name, regular expression
+# matched against the debug output).  Boxes and builds differ, so these can
+# be replaced with `Set Boot Milestones`
+DEFAULT_MILESTONES = (
+    ("bootloader", r"CFE version|U-Boot \d"),
+    ("kernel", r"Linux version \d"),
+    ("rootfs", r"VFS: Mounted root"),
+    ("app", r"Starting (?:application|browser|middleware)|init: starting"),
+    ("network", r"udhcpc: lease of|Link is Up|link becomes ready"),
+    ("video", r"[Ff]irst (?:video )?(?:frame|picture)|VIDEO_DECODER_FIRST"),
+)
+
+
+class BootTimeline(object):
+    """     When each milestone of one boot was first seen
+
+    'start' is the host time the boot was started (reboot sent, or power
+    on) and 'milestones' a list of (name, seconds after start, or None if
+    it wasn't seen), in the order the milestones were configured.  Marks
+    added by the caller (e.g. the first ping reply) follow them.
+    """
+
+    def __init__(self, label, start, milestones):
+        self.label = label
+        self.start = start
+        self.milestones = milestones
+
+    def as_dict(self):
+        return dict(self.milestones)
+
+    def __str__(self):
+        times = []
+        for name, seconds in self.milestones:
+            if seconds is None:
+                times.append("%s -" % name)
+            else:
+                times.append("%s %.3fs" % (name, seconds))
+        return "%s: %s" % (self.label, ", ".join(times))
+
+
+class BootProfiler(object):
+    """     Times boot milestones from the debug output, and keeps statistics across boots
+
+    `start` subscribes to the debug capture (see Debug.subscribe) for every
+    milestone's regular expression, before the reboot or power on, and
+    records the receive time of the first line matching each.  `finish`
+    unsubscribes and returns a BootTimeline of the times relative to the
+    start, which is also kept so `statistics` can summarise every boot
+    profiled, e.g. to compare boot times between builds.
+
+    If 'path' is set each timeline is also appended to it as a CSV row:
+
+    | Boot | Label | Start | <milestone>(s) ... |
+    """
+
+    def __init__(self, milestones=DEFAULT_MILESTONES, path=None):
+        self._milestones = list(milestones)
+        self._path = path
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._seen = {}
+        self._marks = []
+        self._debug = None
+        self._label = None
+        self._start = None
+        self.timelines = []
+
+    def set_milestones(self, milestones):
+        self._milestones = list(milestones)
+
+    def milestone_names(self):
+        return [name for name, pattern in self._milestones]
+
+    def set_path(self, path):
+        self._path = path
+
+    def is_running(self):
+        return self._debug is not None
+
+    def start(self, debug, label, start=None):
+        """     Starts timing a boot from 'start' (default now) on 'debug', a Debug capture
+        """
+        if self._debug is not None:
+            self.finish()
+        self._debug = debug
+        self._label = label
+        self._start = start if start is not None else time.time()
+        self._seen = {}
+        self._marks = []
+        self._subscriptions = [debug.subscribe(pattern, callback=self._heard(name), regex=True)
+                               for name, pattern in self._milestones]
+
+    def restart_from(self, start):
+        """     Measures from 'start' instead, e.g. once the reboot has actually been sent
+        """
+        self._start = start
+
+    def mark(self, name, when):
+        """     Adds a milestone seen some other way, e.g. the first ping reply
+        """
+        with self._lock:
+            self._marks.append((name, when))
+
+    def finish(self):
+        """     Stops timing and returns the BootTimeline, or None if no boot was being timed
+        """
+        if self._debug is None:
+            return None
+        for subscription in self._subscriptions:
+            self._debug.unsubscribe(subscription)
+        self._subscriptions = []
+        self._debug = None
+
+        with self._lock:
+            milestones = []
+            for name, pattern in self._milestones:
+                seen = self._seen.get(name)
+                milestones.append((name, None if seen is None else max(seen - self._start, 0)))
+            for name, when in self._marks:
+                milestones.append((name, max(when - self._start, 0)))
+
+        timeline = BootTimeline(self._label, self._start, milestones)
+        self.timelines.append(timeline)
+        logger.info("Boot timeline %s" % timeline)
+        if self._path is not None:
+            try:
+                self._write(timeline)
+            except (IOError, OSError) as e:
+                logger.warn("Unable to write boot timeline: %s" % e)
+        return timeline
+
+    def statistics(self):
+        """     Returns a dictionary of milestone name to statistics across every boot timed
+
+        Each is a dictionary of count (boots it was seen in), min, mean,
+        median, max and stdev, in seconds.
+        """
+        times = {}
+        order = []
+        for timeline in self.timelines:
+            for name, seconds in timeline.milestones:
+                if name not in times:
+                    times[name] = []
+                    order.append(name)
+                if seconds is not None:
+                    times[name].append(seconds)
+        ret = {}
+        for name in order:
+            ret[name] = _summarise(times[name])
+        return ret
+
+    def _heard(self, name):
+        def callback(hit):
+            with self._lock:
+                if name not in self._seen and hit.time >= self._start:
+                    self._seen[name] = hit.time
+        return callback
+
+    def _write(self, timeline):
+        new = not os.path.isfile(self._path)
+        with open(self._path, 'ab') as ofile:
+            writer = csv.writer(ofile)
+            if new:
+                writer.writerow(["Boot", "Label", "Start"] +
+                                ["%s(s)" % name for name, seconds in timeline.milestones])
+            writer.writerow([len(self.timelines), timeline.label, "%.3f" % timeline.start] +
+                            ["" if seconds is None else "%.3f" % seconds
+                             for name, seconds in timeline.milestones])
+
+
+def _summarise(values):
+    if not values:
+        return {"count": 0, "min": None, "mean": None, "median": None, "max": None, "stdev": None}
+    values = sorted(values)
+    count = len(values)
+    mean = sum(values) / count
+    if count % 2:
+        median = values[count // 2]
+    else:
+        median = (values[count // 2 - 1] + values[count // 2]) / 2.0
+    stdev = math.sqrt(sum((value - mean) ** 2 for value in values) / count)
+    return {"count": count, "min": values[0], "mean": mean, "median": median,
+            "max": values[-1], "stdev": stdev}
@@ -0,0 +1,112 @@
+"""
+Classes:
+    CommandBatch - Wraps a list of shell commands in sentinels so they can be sent without waiting on each
+"""
+# Standard libraries
+import random
+import re
+
+__version__ = "0.1 beta"
+
+# Starts each sentinel line.  The shell prints it from two quoted halves so
+# the echoed command line can never be mistaken for it
+MARK = "@@CMD@@"
+
+# The end of a shell prompt that an echoed line can follow, e.g. "/root # "
+PROMPT_END = re.compile(r'[#$>] ?$')
+
+
+class CommandBatch(object):
+    """     Sends a list of commands to a shell in one go and splits the output back up
+
+    `Send Commands` used to wait for the prompt after every command and
+    then again after a separate `echo $?`.  Here each command is sent as
+
+    | echo '@@C''MD@@' <batch> <n> begin |
+    | <command>                          |
+    | echo '@@C''MD@@' <batch> <n> end $? |
+
+    so the commands can be written without waiting for the prompt, and
+    `parse` picks each command's output and exit status out of the stream
+    by its sentinels.  <batch> is random, so output left over from an
+    earlier batch is never taken for this one's.
+
+    Each command is on its own line, so commands ending in '&' or a
+    comment work as they would typed in.  Commands that read from stdin
+    would read the commands queued after them, so don't batch those.
+    """
+
+    def __init__(self, commands, newline="\n"):
+        self._commands = [str(command) for command in commands]
+        self._newline = newline
+        self._token = "%08x" % random.getrandbits(32)
+
+    def __len__(self):
+        return len(self._commands)
+
+    def script(self, index):
+        """     Returns the text to send for command 'index', ending in a newline
+        """
+        lines = [self._sentinel(index, "begin"), self._commands[index], self._sentinel(index, "end $?")]
+        return self._newline.join(lines) + self._newline
+
+    def end_pattern(self, index):
+        """     Returns a regular expression matching command 'index''s end sentinel
+        """
+        return r'%s %s %d end \d+\s' % (re.escape(MARK), self._token, index)
+
+    def parse(self, output):
+        """     Returns a (return code, output) tuple per command found in 'output'
+
+        Return codes are strings, as from `echo $?`.  Echoes of the sent
+        lines are left out of the output.
+        """
+        prefix = "%s %s " % (MARK, self._token)
+        results = []
+        current = None
+        lines = []
+        echoes = self._echoes()
+        for line in output.splitlines():
+            line = line.rstrip('\r')
+            if self._echo(line, echoes):
+                continue
+            if line.startswith(prefix):
+                fields = line[len(prefix):].split()
+                if len(fields) == 2 and fields[1] == "begin":
+                    current = fields[0]
+                    lines = []
+                elif len(fields) == 3 and fields[1] == "end" and fields[0] == current:
+                    results.append((fields[2], "\n".join(lines)))
+                    current = None
+            elif current is not None:
+                lines.append(line)
+        return results
+
+    def _sentinel(self, index, text):
+        half = len(MARK) // 2
+        return "echo '%s''%s' %s %d %s" % (MARK[:half], MARK[half:], self._token, index, text)
+
+    def _echoes(self):
+        # Every line sent, in order, as the shell will echo them back
+        echoes = []
+        for index, command in enumerate(self._commands):
+            echoes += [self._sentinel(index, "begin"), command, self._sentinel(index, "end $?")]
+        return [text for text in echoes if text]
+
+    def _echo(self, line, echoes):
+        """     Returns True, and takes it off 'echoes', if 'line' is the echo of a sent line
+
+        The shell echoes the sent lines back, possibly after the prompt, and
+        without line editing those queued behind a command can be echoed
+        before its output.  So a line is an echo if it is the next sent line
+        not yet echoed, or one after the prompt.  Output that is the same as
+        a later line, e.g. `ls` from `echo ls` then `ls`, is kept.
+        """
+        if echoes and line == echoes[0]:
+            del echoes[0]
+            return True
+        for position, text in enumerate(echoes):
+            if line.endswith(text) and len(line) > len(text) and PROMPT_END.search(line[:len(line) - len(text)]):
+                del echoes[position]
+                return True
+        return False
@@ -6,9 +6,16 @@ import os.path
 import os
 import gzip
 import re
+import select
+import Queue
+import codecs
+import zlib
+from collections import namedtuple, deque
 
 from robot.libraries.BuiltIn import BuiltIn
 
+import DebugHub
+
 try:
     import pyte
 except ImportError:
@@ -18,6 +25,46 @@ from robot.api import logger
 from robot import utils
 import time
 
+# Longest a blocking read will wait before re-checking if the capture is closing
+READ_TIMEOUT = 0.5
+
+# Longest partial line carried between reads while matching listeners
+MAX_LISTENER_LINE = 4096
+
+# Most hits a subscription without a callback keeps for `wait`, the oldest
+# being dropped, so one left open through a long soak cannot grow forever
+MAX_HEARD = 1000
+
+# How often a regex prompt wait pokes the console with a newline
+PROMPT_NUDGE_INTERVAL = 0.5
+
+# Before sending a command for its output, the console is drained until it
+# has been silent for DRAIN_QUIET seconds (or for at most DRAIN_TIMEOUT), so
+# prompts answering earlier nudges are not taken for the command's own
+DRAIN_QUIET = 0.2
+DRAIN_TIMEOUT = 2.0
+
+# The log writer flushes once this many characters are pending, or after
+# WRITER_FLUSH_INTERVAL seconds, whichever comes first
+WRITER_BATCH_SIZE = 64 * 1024
+WRITER_FLUSH_INTERVAL = 1.0
+
+# The debug log index gets an entry at least every INDEX_LINES lines or
+# INDEX_INTERVAL seconds
+INDEX_LINES = 10000
+INDEX_INTERVAL = 10.0
+
+# Most characters kept while waiting for a prompt or command output
+RX_BUFFER_SIZE = 2 * 1024 * 1024
+
+# Escape sequences removed by AnsiFilter: CSI, OSC, charset selection and
+# the other two character ESC sequences
+ANSI_SEQUENCE = re.compile(u'\x1b(?:\\[[0-?]*[ -/]*[@-~]|\\][^\x07\x1b]*(?:\x07|\x1b\\\\)|[()*+][0-9A-Za-z]|[ -/]*[0-Z^-~])')
+ANSI_CONTROL = re.compile(u'[\x00-\x07\x0b\x0c\x0e-\x1f\x7f]')
+ANSI_BACKSPACE = re.compile(u'[^\x08\n]\x08')
+
+ListenerHit = namedtuple("ListenerHit", "listener line time")
+
 class Debug(object):
     def __init__(self, timeout='3 seconds', newline='\r\n',
                  prompt=None, prompt_is_regexp=False,
@@ -25,7 +72,9 @@ class Debug(object):
                  default_log_level='INFO', window_size='400x100',
                  environ_user=None, terminal_emulation=True,
                  terminal_type="vt100", appendsuffix=None,
-                 login="root", password="root2root", tryalternativepasswords=False):
+                 login="root", password="root2root", tryalternativepasswords=False,
+                 read_mode="select", rx_buffer_size=RX_BUFFER_SIZE, shared_reader=False,
+                 line_timestamps=False, log_index=True):
 
         self._appendsuffix = appendsuffix
         self._timeout = timeout or 3.0
@@ -46,11 +95,12 @@ class Debug(object):
         self._connected = False
         self._outputfile = None
         self._loggedin = False
-        self._outputfilequeued = False
         self._redirect_debug = False
         self._buffer_debug = False
-        self._rx_buffer = ""
+        self._rx_buffer = RxBuffer(rx_buffer_size)
         self._listeners = ['Kernel panic']
+        self._subscriptions = []
+        self._matcher = ListenerMatcher()
         self._lockfilename = None
         self._listeners_heard = []
         self._login = login
@@ -58,6 +108,12 @@ class Debug(object):
         self._lastread = time.time()
         self._alterative_passwords = ['3n#^(^^#ton3cp3', 'entonehd']
         self._tryalternativepasswords = tryalternativepasswords
+        self._read_mode = read_mode
+        self._shared_reader = shared_reader
+        self._line_timestamps = line_timestamps
+        self._log_index = log_index
+        self._readthread = None
+        self._commport = None
 
         try:
             outdir = BuiltIn().replace_variables('${OUTPUTDIR}')
@@ -110,6 +166,7 @@ class Debug(object):
         except:
             raise DebugError("Error occured trying to open serial port on %s" % commport)
 
+        self._commport = commport
         self._connected = True
         try:
             self._lockfile("create",commport)
@@ -118,12 +175,15 @@ class Debug(object):
 
         if compressed:
             self._outputpath = self._outputpath + ".gz"
-            self._outputfile = gzip.open(self._outputpath, 'a')
-        else:
-            self._outputfile = open(self._outputpath, 'a')
+        self._outputfile = LogWriter(self._outputpath, compressed=compressed, encoding=self._encoding,
+                                     timestamps=self._line_timestamps, index=self._log_index)
 
-        self._readthread = threading.Thread(target=self.read_thread)
-        self._readthread.start()
+        if self._shared_reader:
+            # One thread reads every shared port, see DebugHub
+            DebugHub.DebugHub.get_hub().register(self)
+        else:
+            self._readthread = threading.Thread(target=self.read_thread)
+            self._readthread.start()
 
 
     def _lockfile(self, action, commport):
@@ -152,9 +212,8 @@ class Debug(object):
 
     def debug_marker(self, text):
         try:
-            self._outputfilequeued = True #Hold any further debug until this is written
-            self._outputfile.write("\n\n**********************************\nMarker:  %s\n**********************************\n\n" % text)
-            self._outputfilequeued = False
+            # Queued behind any debug already read, so it lands in the right place
+            self._outputfile.marker("\n\n**********************************\nMarker:  %s\n**********************************\n\n" % text, text)
         except ValueError:
             logger.warn("Unable to write debug marker as debug output file appears to be closed!")
 
@@ -224,30 +283,20 @@ class Debug(object):
 
     def _write_and_wait_for_prompt(self, command, timeout, attempt=0):
         self._buffer_debug = True
-        self._rx_buffer = ""
+        self._rx_buffer.clear()
         self.write(command)
-        tout = 2 * utils.timestr_to_secs(timeout)
-        halfseccount = 0
+        deadline = time.time() + utils.timestr_to_secs(timeout)
 
-        while halfseccount <= tout:
-            if not self._prompt_regex:
+        while True:
+            if self._rx_buffer.wait_for(self._prompt, min(PROMPT_NUDGE_INTERVAL, deadline - time.time()), regex=self._prompt_regex):
+                self._buffer_debug = False
+                self._rx_buffer.clear()
+                return
 
-                if self._prompt in self._rx_buffer:
-                    self._buffer_debug = False
-                    self._rx_buffer = ""
-                    return
-                else:
-                    time.sleep(0.5)
-                    halfseccount = halfseccount + 1
-            else:
-                if re.search(self._prompt, self._rx_buffer) is not None:
-                    self._buffer_debug = False
-                    self._rx_buffer = ""
-                    return
-                else:
-                    time.sleep(0.5)
-                    halfseccount = halfseccount + 1
+            if time.time() >= deadline:
+                break
 
+            if self._prompt_regex:
                 # Pass newlines down the serial connection to have a better
                 # chance of seeing the prompt
                 self.write('')
@@ -262,7 +311,7 @@ class Debug(object):
             self._write_and_wait_for_prompt(command, '5 seconds', attempt=new_attempt)
 
 
-        raise DebugError("Timeout waiting for prompt %s" % self._rx_buffer)
+        raise DebugError("Timeout waiting for prompt %s" % self._rx_buffer.getvalue())
 
 
     def send_command_and_return_output(self, command, prompt, timeout, regex=False):
@@ -271,50 +320,45 @@ class Debug(object):
         self._redirect_debug = True
 
         if not regex:
-            # Running on AmiNET, need to stop syslog from the Debug library
+            # Running on AmiNET, need to stop syslog from the Debug library.
+            # Wait (up to 2 seconds) for the prompt so its output is out of the way
+            self._rx_buffer.clear()
             self.write('/etc/init.d/rc.syslogd stop;echo ******* STOPPING LOGGING TO SEND COMMAND ***********')
+            self._rx_buffer.wait_for(prompt, 2)
 
-        time.sleep(2)
-        self._rx_buffer = ""
+        self._rx_buffer.wait_quiet(DRAIN_QUIET, DRAIN_TIMEOUT)
+        self._rx_buffer.clear()
         self.write(command)
-        tout = 2 * utils.timestr_to_secs(timeout)
-        halfseccount = 0
-        logger.trace("rx_buffer 1 = '%s'" % self._rx_buffer)
+        deadline = time.time() + utils.timestr_to_secs(timeout)
 
-        while halfseccount <= tout:
-            if regex:
-                logger.trace("rx_buffer 2 = '%s'" % self._rx_buffer)
-                if len(re.findall(prompt, self._rx_buffer)) > 0:
-                    logger.trace("rx_buffer 3 = '%s'" % self._rx_buffer)
-                    self._redirect_debug = False
+        while True:
+            if self._rx_buffer.wait_for(prompt, min(PROMPT_NUDGE_INTERVAL, deadline - time.time()), regex=regex):
+                self._redirect_debug = False
+                if not regex:
+                    self.write('/etc/init.d/rc.syslogd start;echo *******RESTARTED LOGGING AFTER SEND COMMAND AND RECEIVE OUTPUT***********')
+
+                rx_buffer = self._rx_buffer.getvalue()
+                logger.trace("rx_buffer = '%s'" % rx_buffer)
 
+                if regex:
                     try:
-                        logger.debug(self._rx_buffer)
-                        return re.sub(prompt, '', self._rx_buffer)
+                        logger.debug(rx_buffer)
+                        return re.sub(prompt, '', rx_buffer)
                     except:
                         # If removing the prompt fails, return the whole buffer
-                        return self._rx_buffer
-
+                        return rx_buffer
                 else:
-                    time.sleep(0.5)
-                    halfseccount = halfseccount + 1
-                    self.write('')
-            else:
-                # Support old AmiNET method of finding the prompt
-                if prompt in self._rx_buffer:
-                    self._redirect_debug = False
-                    self.write('/etc/init.d/rc.syslogd start;echo *******RESTARTED LOGGING AFTER SEND COMMAND AND RECEIVE OUTPUT***********')
-                    logger.trace("rx_buffer = '%s'" % self._rx_buffer)
+                    # Support old AmiNET method of finding the prompt
                     try:
-                        return self._rx_buffer.split('%s' % command)[1].split(prompt)[0]
+                        return rx_buffer.split('%s' % command)[1].split(prompt)[0]
                     except:
-                        return self._rx_buffer.split(prompt)[0]
+                        return rx_buffer.split(prompt)[0]
 
+            if time.time() >= deadline:
+                break
 
-                  #return self._strip_rx(self._rx_buffer, command, prompt)
-                else:
-                    time.sleep(0.5)
-                    halfseccount = halfseccount + 1
+            if regex:
+                self.write('')
 
         raise DebugError("Timeout waiting for prompt")
 
@@ -323,12 +367,60 @@ class Debug(object):
         return rx_buff.split('%s\n' % command)[1].split(prompt)[0]
 
 
-    def add_listener(self, listener):
+    def add_listener(self, listener, regex=False):
+        """     Listen for a string, or a regular expression if 'regex' is set
+        """
+        if regex:
+            listener = re.compile(listener)
         self._listeners.append(listener)
 
+    def has_listener(self, listener):
+        return listener in [_listener_name(l) for l in self._listeners]
+
+    def remove_listener(self, listener):
+        for existing in self._listeners:
+            if _listener_name(existing) == listener:
+                self._listeners.remove(existing)
+                return
+        raise DebugError("Listener '%s' is not in the listeners list" % listener)
+
+    def subscribe(self, listener, callback=None, regex=False):
+        """     Listen for a string (or regular expression) without touching the listeners list
+
+        Returns a ListenerSubscription, which calls 'callback' with a
+        ListenerHit each time the listener is heard, from the reader thread,
+        or if there is no callback queues the hit for its `wait`.  Any number of subscriptions can be open at
+        once, so waiters do not disturb each other or the listeners list.
+        Pass it to `unsubscribe` when finished with.
+        """
+        if regex:
+            listener = re.compile(listener)
+        subscription = ListenerSubscription(listener, callback)
+        # Replace rather than append so the reader can use the list without a lock
+        self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def wait_for_listener(self, listener, timeout, regex=False):
+        """     Wait up to 'timeout' seconds to hear 'listener'
+
+        Returns the ListenerHit, whose time is when the line was received, or
+        None if it was not heard in time.
+        """
+        subscription = self.subscribe(listener, regex=regex)
+        try:
+            return subscription.wait(timeout)
+        finally:
+            self.unsubscribe(subscription)
+
     def close(self):
         self._connected = False
-        self._readthread.join()
+        if self._shared_reader:
+            DebugHub.DebugHub.get_hub().unregister(self)
+        else:
+            self._readthread.join()
         self._conn.close()
         if self._lockfilename != None:
             self._lockfile("close","")
@@ -338,19 +430,20 @@ class Debug(object):
         with open('/tmp/somedebug.txt', 'a') as f:
             f.write("%s\n" % log)
 
-    def _check_listeners(self, output):
+    def _check_listeners(self, output, rxtime=None):
         # Check if a listener is heard
-        heard = []
-        for listener in self._listeners:
-            if listener in output:
-                heard.append(listener)
-
-        if len(heard) > 0:
-            # Found at least one of them, lets add the instances to the list of heards
-            for line in output.split('\n'):
-                for listener in heard:
-                    if listener in line:
-                        self._listeners_heard.append("Listener '%s' heard at %s : %s" % (listener, self._get_timestamp(), line))
+        listeners = list(self._listeners)
+        subscriptions = self._subscriptions
+        for subscription in subscriptions:
+            if subscription.listener not in listeners:
+                listeners.append(subscription.listener)
+
+        for hit in self._matcher.feed(output, listeners, rxtime):
+            if hit.listener in self._listeners:
+                self._listeners_heard.append("Listener '%s' heard at %s : %s" % (_listener_name(hit.listener), self._get_timestamp(hit.time), hit.line))
+            for subscription in subscriptions:
+                if subscription.listener == hit.listener:
+                    subscription._notify(hit)
 
     def check_listeners(self):
         if len(self._listeners_heard) > 0:
@@ -362,30 +455,28 @@ class Debug(object):
         return self._connected
 
 
-    def _get_timestamp(self):
-        time_obj = time.time()
+    def _get_timestamp(self, time_obj=None):
+        if time_obj is None:
+            time_obj = time.time()
         time_str = datetime.datetime.fromtimestamp(time_obj).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
         return time_str
 
 
-    def _handle_read(self, output):
+    def _handle_read(self, output, rxtime=None):
         # Need a string buffer to keep in memory, plus a file to write to
-        self._check_listeners(output)
-
-        # IMPROVEMENT improve this by keeping the last 'output' in memory and appending them together to check if a listener fired between buffers?
-        # may be problematic if more than one instance is picked up?  It will definately be picked up twice on consecutive checks?
+        if rxtime is None:
+            rxtime = time.time()
 
-        self._lastread = time.time()
+        self._check_listeners(output, rxtime)
 
+        self._lastread = rxtime
 
-        while self._outputfilequeued == True:
-            pass
         if not self._redirect_debug:
-            self._outputfile.write(output)
+            self._outputfile.write(output, rxtime)
             if self._buffer_debug:
-                self._rx_buffer = self._rx_buffer + output
+                self._rx_buffer.append(output)
         else:
-            self._rx_buffer = self._rx_buffer + output
+            self._rx_buffer.append(output)
 
     def _log(self, msg, level=None):
         msg = msg.strip()
@@ -393,21 +484,65 @@ class Debug(object):
             logger.write(msg, level or self._default_log_level)
 
     def read_thread(self, loglevel=None):
+        """     Reader loop, run on its own thread for the life of the capture
+
+        In 'select' mode (the default) the thread blocks on the serial port's
+        file descriptor and handles each chunk as soon as it arrives.  'poll'
+        mode keeps the original behaviour of checking the port every 200ms
+        and is used when the port has no file descriptor to wait on.
+        """
+        if self._read_mode == "select":
+            try:
+                fd = self._conn.fileno()
+            except Exception:
+                logger.debug("Serial port has no file descriptor, falling back to polled reads")
+                fd = None
+
+            if fd is not None:
+                self._select_read_loop(fd)
+                return
+
+        self._poll_read_loop()
+
+    def _select_read_loop(self, fd):
+        failure = None
+        while self._connected:
+            try:
+                readable = select.select([fd], [], [], READ_TIMEOUT)[0]
+                if not readable:
+                    continue
+                rxtime = time.time()
+                output = self._conn.read(self._conn.inWaiting() or 1)
+                self._process_output(output, rxtime)
+                failure = None
+            except Exception as e:
+                # Once per run of the same error, as a port that has gone away fails every read
+                if str(e) != failure:
+                    failure = str(e)
+                    logger.warn("Debug capture read error: %s" % e)
+                # Don't spin on a port that has gone away
+                time.sleep(READ_TIMEOUT)
+
+    def _poll_read_loop(self):
         while self._connected:
             time.sleep(0.2)
             #self._verify_connection()
             try:
                 if self._conn.inWaiting() > 0:
+                    rxtime = time.time()
                     output = self._conn.read(self._conn.inWaiting())
-                    if self._terminal_emulator:
-                        self._terminal_emulator.feed(output)
-                        # Removed newline rstrip to solve multi-line issue
-                        self._handle_read(self._terminal_emulator.read())
-                    else:
-                        self._handle_read(output = self._decode(output))
+                    self._process_output(output, rxtime)
             except:
                 pass
 
+    def _process_output(self, output, rxtime):
+        if self._terminal_emulator:
+            self._terminal_emulator.feed(output)
+            # Removed newline rstrip to solve multi-line issue
+            self._handle_read(self._terminal_emulator.read(), rxtime)
+        else:
+            self._handle_read(self._decode(output), rxtime)
+
     def _decode(self, rx_bytes):
         if self.__encoding[0] == 'NONE':
             return rx_bytes
@@ -416,6 +551,10 @@ class Debug(object):
     def _check_terminal_emulation(self, terminal_emulation):
         if not terminal_emulation:
             return False
+        if isinstance(terminal_emulation, basestring) and terminal_emulation.lower() == 'fast':
+            return AnsiFilter(newline=self._newline, encoding=self.__encoding)
+        if not self._parse_terminal_emulation(terminal_emulation):
+            return False
         if not pyte:
             raise RuntimeError("Terminal emulation requires pyte module!\n"
                                "https://pypi.python.org/pypi/pyte/")
@@ -535,6 +674,531 @@ class TerminalEmulator(object):
         self._screen.reset()
         self._screen.set_charset('B', '(')
 
+class AnsiFilter(object):
+    """     Lightweight alternative to TerminalEmulator for plain log streams
+
+    Selected with terminal_emulation='fast'.  Rather than rendering a
+    virtual screen it strips escape sequences and control characters as
+    the bytes stream through, applies backspaces, and turns CR, LF and
+    CRLF into 'newline'.  Escape sequences, CRLF pairs and multi-byte
+    characters split across two reads are carried over to the next one.
+
+    It has the same feed/read interface as TerminalEmulator.
+    """
+
+    def __init__(self, newline="\r\n", encoding=('UTF-8', 'ignore')):
+        self._newline = newline
+        if encoding[0] == 'NONE':
+            encoding = ('latin-1', encoding[1])
+        self._decoder = codecs.getincrementaldecoder(encoding[0])(encoding[1])
+        self._carry = u''
+        self._buffer = []
+
+    def feed(self, input_bytes):
+        data = self._carry + self._decoder.decode(input_bytes)
+        self._carry = u''
+
+        # Hold back anything that might be the start of an unfinished sequence
+        esc = data.rfind(u'\x1b')
+        if esc != -1 and len(data) - esc < 256 and not ANSI_SEQUENCE.match(data, esc):
+            self._carry = data[esc:]
+            data = data[:esc]
+        if data.endswith(u'\r'):
+            self._carry = u'\r' + self._carry
+            data = data[:-1]
+
+        data = ANSI_SEQUENCE.sub(u'', data)
+        data = data.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+        while u'\x08' in data:
+            stripped = ANSI_BACKSPACE.sub(u'', data)
+            if stripped == data:
+                stripped = data.replace(u'\x08', u'')
+            data = stripped
+        data = ANSI_CONTROL.sub(u'', data)
+
+        if self._newline != u'\n':
+            data = data.replace(u'\n', self._newline)
+        self._buffer.append(data)
+
+    def read(self):
+        ret = u''.join(self._buffer)
+        self._buffer = []
+        return ret
+
+
+class LogWriter(object):
+    """     Writes debug output to file from its own thread
+
+    `write` only queues the text, so the serial reader is never held up by
+    the disk or by gzip.  The writer thread batches whatever has queued and
+    writes it once WRITER_BATCH_SIZE characters are pending or
+    WRITER_FLUSH_INTERVAL seconds have passed since the last flush.  When
+    idle it blocks on the queue rather than polling.
+
+    With 'timestamps' set every line is prefixed with the host time the
+    reader received it, e.g. "[2016-03-01 10:22:41.327] ".
+
+    With 'index' set a sidecar index is kept at path + ".idx" (see
+    DebugLogIndex) with an entry every 'index_lines' lines or
+    'index_interval' seconds, whichever comes first, and one for every
+    marker.  Each entry gives the position of the start of a line, so a
+    reader can jump straight to a marker or a time.  For gzip logs the
+    position is in the compressed file, and the compressor is fully flushed
+    there so decompression can start at it.
+
+    `close` writes out everything still queued before closing the file.
+    """
+
+    _CLOSE = object()
+
+    def __init__(self, path, compressed=False, encoding='UTF-8',
+                 batch_size=WRITER_BATCH_SIZE, flush_interval=WRITER_FLUSH_INTERVAL,
+                 timestamps=False, index=False, index_lines=INDEX_LINES,
+                 index_interval=INDEX_INTERVAL):
+        self._encoding = encoding
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._timestamps = timestamps
+        self._index_lines = index_lines
+        self._index_interval = index_interval
+        self._queue = Queue.Queue()
+        self._closed = False
+        self._compressed = compressed
+        if compressed:
+            self._file = gzip.open(path, 'ab')
+        else:
+            self._file = open(path, 'ab')
+
+        self._pending = []
+        self._pending_size = 0
+        self._line_start = True
+        self._lines = 0
+        self._offset = os.path.getsize(path)
+        self._index = None
+        self._index_pending = []
+        if index:
+            self._index = open(path + ".idx", 'ab')
+            self._add_index_entry("open", time.time())
+            self._last_index_line = 0
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, text, rxtime=None):
+        if self._closed:
+            raise ValueError("I/O operation on closed debug log")
+        self._queue.put((text, rxtime or time.time(), None))
+
+    def marker(self, text, label):
+        """     Queues 'text', recording it in the index as marker 'label'
+        """
+        if self._closed:
+            raise ValueError("I/O operation on closed debug log")
+        self._queue.put((text, time.time(), label))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+        self._file.close()
+        if self._index:
+            self._index.close()
+
+    def _run(self):
+        last_flush = time.time()
+
+        while True:
+            if self._pending:
+                timeout = last_flush + self._flush_interval - time.time()
+                try:
+                    item = self._queue.get(timeout=max(timeout, 0.001))
+                except Queue.Empty:
+                    item = None
+            else:
+                item = self._queue.get()
+
+            if item is self._CLOSE:
+                self._flush()
+                return
+
+            if item is not None:
+                try:
+                    self._add(*item)
+                except Exception as e:
+                    logger.warn("Unable to write debug log: %s" % e)
+
+            if self._pending_size >= self._batch_size or time.time() - last_flush >= self._flush_interval:
+                self._flush()
+                last_flush = time.time()
+
+    def _add(self, text, rxtime, label):
+        if not text:
+            return
+
+        if label is not None:
+            # Markers start on a new line of their own, so index the marker itself
+            if self._index:
+                self._index_here("marker", rxtime, label)
+            self._append(self._encode(text))
+            self._line_start = text.endswith('\n')
+            return
+
+        if self._timestamps:
+            text = self._stamp(text, rxtime)
+        data = self._encode(text)
+        self._line_start = data.endswith('\n')
+
+        if self._index and (self._lines - self._last_index_line >= self._index_lines or
+                            rxtime - self._last_index_time >= self._index_interval):
+            split = data.rfind('\n') + 1
+            if split:
+                # Index the start of the last line begun in this chunk
+                self._append(data[:split])
+                self._index_here("time", rxtime)
+                data = data[split:]
+
+        self._append(data)
+
+    def _append(self, data):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            self._offset += len(data)
+            self._lines += data.count('\n')
+
+    def _encode(self, text):
+        if isinstance(text, unicode):
+            return text.encode(self._encoding, 'replace')
+        return text
+
+    def _stamp(self, text, rxtime):
+        stamp = "[%s] " % datetime.datetime.fromtimestamp(rxtime).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        if text.endswith('\n'):
+            text = text[:-1].replace('\n', '\n' + stamp) + '\n'
+        else:
+            text = text.replace('\n', '\n' + stamp)
+        if self._line_start:
+            text = stamp + text
+        return text
+
+    def _index_here(self, kind, rxtime, label=""):
+        if self._compressed:
+            # The entry has to point at a full flush, so write out what is pending first
+            self._flush()
+        self._add_index_entry(kind, rxtime, label)
+        self._last_index_line = self._lines
+
+    def _add_index_entry(self, kind, rxtime, label=""):
+        if self._compressed:
+            self._file.flush(zlib.Z_FULL_FLUSH)
+            seek = os.fstat(self._file.fileobj.fileno()).st_size
+        else:
+            seek = self._offset
+        label = self._encode(label).replace('\t', ' ').replace('\n', ' ')
+        self._index_pending.append("%s\t%d\t%d\t%.3f\t%s\n" % (kind, seek, self._lines, rxtime, label))
+        self._last_index_time = rxtime
+
+    def _flush(self):
+        try:
+            if self._pending:
+                self._file.write(''.join(self._pending))
+                self._pending = []
+                self._pending_size = 0
+            self._file.flush()
+            if self._index_pending:
+                # Only once the log data they point at is on disk
+                self._index.write(''.join(self._index_pending))
+                self._index.flush()
+                self._index_pending = []
+        except Exception as e:
+            logger.warn("Unable to write debug log: %s" % e)
+
+
+class RxBuffer(object):
+    """     Bounded buffer of received output with incremental searching
+
+    Output is held as a list of chunks.  Once the buffer holds more than
+    'capacity' characters the oldest chunks are dropped.
+
+    `find` and `search` only look at output received since the previous
+    call, plus enough of the old output to catch a match that straddles
+    the two: len(sub)-1 characters for strings, back to the start of the
+    current line for regular expressions.  Waiting for a prompt therefore
+    costs time proportional to the new output rather than the whole buffer.
+
+    `wait_for` blocks on a condition that is notified by `append`, so a
+    waiter re-checks as soon as the reader thread delivers new output.
+    """
+
+    def __init__(self, capacity=RX_BUFFER_SIZE):
+        self._capacity = capacity
+        self._lock = threading.Condition()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._chunks = deque()  # (absolute offset, text)
+            self._start = 0         # absolute offset of the first character held
+            self._end = 0           # absolute offset just past the last character
+            self._scanned = 0       # absolute offset searched up to
+
+    def append(self, text):
+        if not text:
+            return
+        with self._lock:
+            if len(text) > self._capacity:
+                self._end += len(text) - self._capacity
+                text = text[-self._capacity:]
+            self._chunks.append((self._end, text))
+            self._end += len(text)
+            while self._end - self._chunks[0][0] > self._capacity:
+                self._chunks.popleft()
+            self._start = self._chunks[0][0]
+            self._lock.notify_all()
+
+    def __len__(self):
+        return self._end - self._start
+
+    def getvalue(self):
+        with self._lock:
+            return ''.join(chunk for offset, chunk in self._chunks)
+
+    def _text_from(self, offset):
+        # Join only the chunks that cover 'offset' onwards
+        offset = max(offset, self._start)
+        parts = []
+        for chunk_offset, chunk in reversed(self._chunks):
+            parts.append(chunk)
+            if chunk_offset <= offset:
+                parts[-1] = chunk[offset - chunk_offset:]
+                break
+        parts.reverse()
+        return offset, ''.join(parts)
+
+    def find(self, sub):
+        """     Returns True if 'sub' is in the output received since the last scan
+        """
+        with self._lock:
+            offset, text = self._text_from(self._scanned - len(sub) + 1)
+            self._scanned = self._end
+        return sub in text
+
+    def search(self, pattern):
+        """     Returns the first match of 'pattern' in the output received since
+        the last scan, or None
+        """
+        with self._lock:
+            offset, text = self._text_from(self._scanned - MAX_LISTENER_LINE)
+            # Start at the beginning of the line that was being scanned
+            rescan = len(text) - (self._end - self._scanned)
+            if rescan > 0:
+                text = text[text.rfind('\n', 0, rescan) + 1:]
+            self._scanned = self._end
+        return re.search(pattern, text)
+
+    def wait(self, timeout):
+        """     Wait up to 'timeout' seconds for output that has not been scanned yet
+
+        Returns True if there is some
+        """
+        with self._lock:
+            if self._end == self._scanned and timeout > 0:
+                self._lock.wait(timeout)
+            return self._end > self._scanned
+
+    def wait_quiet(self, quiet, timeout):
+        """     Wait up to 'timeout' seconds for nothing to be received for 'quiet' seconds
+
+        Returns True if the output went quiet
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            end, since = self._end, time.time()
+            while True:
+                now = time.time()
+                if self._end != end:
+                    end, since = self._end, now
+                if now - since >= quiet:
+                    return True
+                if now >= deadline:
+                    return False
+                self._lock.wait(min(since + quiet, deadline) - now)
+
+    def wait_for(self, pattern, timeout, regex=False):
+        """     Wait up to 'timeout' seconds for 'pattern' to be received
+
+        Returns the match (True for a plain string), or None on timeout
+        """
+        deadline = time.time() + timeout
+        while True:
+            if regex:
+                found = self.search(pattern)
+            else:
+                found = self.find(pattern) or None
+            if found is not None:
+                return found
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self.wait(remaining)
+
+
+class ListenerMatcher(object):
+    """     Matches a set of debug listeners against a stream of output chunks
+
+    Listeners may be plain strings or compiled regular expressions.  They are
+    combined into a single pattern so each chunk is scanned once, and only
+    the lines that hit are checked listener by listener.  Regular expressions
+    with groups (whose numbers, and so backreferences, would change in the
+    combined pattern) or flags of their own are scanned for separately.
+    '^' and '$' match at the start and end of each line.
+
+    The trailing partial line of each chunk is carried over to the next one,
+    so a listener split across two serial reads is still heard.  A string
+    listener can be heard on a partial line, and is not reported again when
+    that line completes, but regular expressions are only checked against
+    whole lines.
+    """
+
+    def __init__(self, max_line=MAX_LISTENER_LINE):
+        self._max_line = max_line
+        self._key = None
+        self._listeners = ()
+        self._patterns = []
+        self._partial = ''
+        self._partial_heard = set()
+
+    def _compile(self, listeners):
+        key = tuple(listeners)
+        if key == self._key:
+            return
+        self._key = key
+        self._listeners = key
+        combined = [l for l in key if not _listener_separate(l)]
+        self._patterns = []
+        if combined:
+            self._patterns.append(re.compile('|'.join('(?:%s)' % _listener_regex(l) for l in combined), re.MULTILINE))
+        for listener in key:
+            if _listener_separate(listener):
+                self._patterns.append(re.compile(listener.pattern, listener.flags | re.MULTILINE))
+
+    def feed(self, text, listeners, rxtime=None):
+        """     Scan the next chunk of output, returning a list of ListenerHits
+        """
+        if rxtime is None:
+            rxtime = time.time()
+
+        self._compile(listeners)
+
+        data = self._partial + text
+        hits = []
+        partial_start = data.rfind('\n') + 1
+        partial_heard = set()
+        if partial_start == 0:
+            # Still on the line carried from the last chunk
+            partial_heard = set(self._partial_heard)
+
+        # Lines that any pattern hit, start to end.  The patterns scan a copy
+        # with the same offsets in which '$' also matches before "\r\n"
+        scan = data.replace('\r\n', '\n\n')
+        lines = {}
+        for pattern in self._patterns:
+            line_end = -1
+            for match in pattern.finditer(scan):
+                if match.start() <= line_end:
+                    # Already have this line
+                    continue
+                line_start = data.rfind('\n', 0, match.start()) + 1
+                line_end = data.find('\n', match.end())
+                if line_end == -1:
+                    line_end = len(data)
+                lines[line_start] = max(line_end, lines.get(line_start, line_end))
+
+        for line_start in sorted(lines):
+            line = data[line_start:lines[line_start]].rstrip('\r')
+            for listener in self._listeners:
+                if line_start == 0 and listener in self._partial_heard:
+                    continue
+                if line_start == partial_start and hasattr(listener, 'search'):
+                    # A regular expression (e.g. ending in '$') waits for the whole line
+                    continue
+                if _listener_matches(listener, line):
+                    hits.append(ListenerHit(listener, line, rxtime))
+                    if line_start == partial_start:
+                        partial_heard.add(listener)
+
+        self._partial = data[partial_start:][-self._max_line:]
+        self._partial_heard = partial_heard
+        return hits
+
+    def reset(self):
+        self._partial = ''
+        self._partial_heard = set()
+
+
+class ListenerSubscription(object):
+    """     A listener registered with `Debug.subscribe`
+
+    Every time the listener is heard a ListenerHit (listener, line, time
+    received) is passed to the callback if there is one, otherwise put on
+    the `heard` queue (which keeps the last MAX_HEARD).  `wait` blocks until
+    the next hit, so only works without a callback.
+    """
+
+    def __init__(self, listener, callback=None):
+        self.listener = listener
+        self.name = _listener_name(listener)
+        self.callback = callback
+        self.heard = Queue.Queue(MAX_HEARD)
+
+    def wait(self, timeout=None):
+        """     Returns the next ListenerHit, or None if there is none within 'timeout' seconds
+        """
+        try:
+            return self.heard.get(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+    def _notify(self, hit):
+        if self.callback is not None:
+            try:
+                self.callback(hit)
+            except Exception as e:
+                logger.warn("Debug listener '%s' callback failed: %s" % (self.name, e))
+            return
+        # Only the reader thread puts, so there is room once the oldest is dropped
+        while True:
+            try:
+                self.heard.put_nowait(hit)
+                return
+            except Queue.Full:
+                try:
+                    self.heard.get_nowait()
+                except Queue.Empty:
+                    pass
+
+
+def _listener_name(listener):
+    return getattr(listener, 'pattern', listener)
+
+def _listener_regex(listener):
+    if hasattr(listener, 'pattern'):
+        return listener.pattern
+    return re.escape(listener)
+
+def _listener_separate(listener):
+    return hasattr(listener, 'pattern') and (listener.groups > 0 or listener.flags & ~re.UNICODE)
+
+def _listener_matches(listener, line):
+    if hasattr(listener, 'search'):
+        return listener.search(line) is not None
+    return listener in line
+
+
 class DebugError(RuntimeError):
     pass
 
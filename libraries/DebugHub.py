@@ -0,0 +1,150 @@
+"""
+Classes:
+    DebugHub - A single reader thread serving every shared Debug capture
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import os
+import select
+import threading
+import time
+
+__version__ = "0.1 beta"
+
+
+class DebugHub(object):
+    """     Reads every registered serial debug port from one thread
+
+    A rack robot capturing debug from many STBs would otherwise run one
+    reader thread per port.  The hub waits on all of the ports' file
+    descriptors at once and hands each chunk to the owning Debug object as
+    soon as it arrives, so the Debug object's log writer and listeners see
+    exactly what they would with a dedicated reader.
+
+    Debug objects join the hub when created with shared_reader=True (see
+    `Capture Debug` in STB and ESTB), so the Debug API is unchanged for the
+    STB libraries.  There is one hub per process, from `get_hub`.
+
+    A port that cannot be read (the adapter unplugged, or its descriptor
+    closed under the hub) is dropped and its capture marked as no longer
+    connected, without stopping the others.  Output is handed over, and so
+    listener callbacks run, outside the hub's lock, so a callback may itself
+    open or close a capture.
+
+    Any file descriptor will do, so pseudo-terminals (pty pairs) can stand
+    in for /dev/ttyUSB ports when testing.
+    """
+
+    _hub = None
+    _hub_lock = threading.Lock()
+
+    @classmethod
+    def get_hub(cls):
+        with cls._hub_lock:
+            if cls._hub is None:
+                cls._hub = DebugHub()
+            return cls._hub
+
+    def __init__(self):
+        self._ports = {}
+        self._lock = threading.RLock()
+        # Notified when a round of output has been handed over
+        self._delivered = threading.Condition(self._lock)
+        self._delivering = []
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def register(self, debug):
+        """     Start reading the serial connection belonging to 'debug'
+        """
+        fd = debug._conn.fileno()
+        with self._lock:
+            self._ports[fd] = debug
+        self._wake()
+
+    def unregister(self, debug):
+        """     Stop reading the serial connection belonging to 'debug'
+
+        Once this returns the hub will not hand 'debug' any more output,
+        unless it is called from a callback the hub is running.
+        """
+        with self._lock:
+            for fd, registered in self._ports.items():
+                if registered is debug:
+                    del self._ports[fd]
+            # Let output already read for 'debug' finish being handed over
+            while debug in self._delivering and threading.current_thread() is not self._thread:
+                self._delivered.wait()
+        self._wake()
+
+    def port_count(self):
+        return len(self._ports)
+
+    def _wake(self):
+        os.write(self._wake_write, 'x')
+
+    def _run(self):
+        while True:
+            with self._lock:
+                fds = list(self._ports)
+
+            try:
+                readable = select.select(fds + [self._wake_read], [], [])[0]
+            except (select.error, OSError, ValueError):
+                # A port was closed under us, or is no longer a valid descriptor
+                self._drop_bad_fds(fds)
+                continue
+
+            rxtime = time.time()
+
+            if self._wake_read in readable:
+                os.read(self._wake_read, 4096)
+
+            received = []
+            with self._lock:
+                for fd in readable:
+                    debug = self._ports.get(fd)
+                    if debug is None:
+                        continue
+                    try:
+                        received.append((debug, debug._conn.read(debug._conn.inWaiting() or 1)))
+                    except Exception as e:
+                        # Most likely the adapter has gone away, don't spin on it
+                        self._fail(fd, e)
+                self._delivering = [debug for debug, output in received]
+
+            try:
+                for debug, output in received:
+                    try:
+                        debug._process_output(output, rxtime)
+                    except Exception as e:
+                        logger.warn("Debug hub unable to handle output of port %s: %s" % (debug._commport, e))
+            finally:
+                with self._lock:
+                    self._delivering = []
+                    self._delivered.notify_all()
+
+    def _drop_bad_fds(self, fds):
+        # Select on each port on its own to find the ones select can't take
+        bad = False
+        for fd in fds:
+            try:
+                select.select([fd], [], [], 0)
+            except (select.error, OSError, ValueError) as e:
+                with self._lock:
+                    if fd in self._ports:
+                        self._fail(fd, e)
+                        bad = True
+        if not bad:
+            # A port was unregistered and closed since the list was taken
+            time.sleep(0.1)
+
+    def _fail(self, fd, error):
+        # Called with the lock held
+        debug = self._ports.pop(fd)
+        logger.warn("Debug hub stopped reading port %s: %s" % (debug._commport, error))
+        debug._connected = False
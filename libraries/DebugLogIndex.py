@@ -0,0 +1,197 @@
+"""
+Classes:
+    DebugLogIndex - Jumps to a marker or a time in a (possibly gzipped) debug log
+"""
+# Standard libraries
+import bisect
+import zlib
+from collections import namedtuple
+
+__version__ = "0.1 beta"
+
+# Bytes read from the log at a time
+READ_BLOCK = 64 * 1024
+
+IndexEntry = namedtuple("IndexEntry", "kind seek line time label")
+
+
+class DebugLogIndex(object):
+    """     Reads the sidecar index Debug keeps next to a *_debug.log(.gz)
+
+    The index (the log path plus ".idx") is a tab separated line per entry:
+
+    | kind | seek | line | time | label |
+
+    - kind  - "open" when the capture started, "marker" for a `Debug Marker`,
+              "time" for the regular entries written every few thousand
+              lines or seconds
+    - seek  - file position of the start of a line.  For gzip logs it is the
+              position in the compressed file of a full flush, where
+              decompression can begin
+    - line  - lines written since the capture was opened
+    - time  - host time (seconds since the epoch) the output from 'seek'
+              onwards was received at or after
+    - label - the marker text, for markers
+
+    A log that has been appended to by several captures (e.g. reruns of a
+    suite) has an "open" entry for each.
+
+    Entries are in time order, so `find_time` is a binary search and reading
+    only starts at the entry found, rather than at the top of a multi-GB log.
+    """
+
+    def __init__(self, logpath, indexpath=None):
+        self._logpath = logpath
+        self._compressed = logpath.endswith('.gz')
+        self.entries = []
+        with open(indexpath or logpath + ".idx", 'rb') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t', 4)
+                if len(parts) != 5:
+                    # Last line still being written
+                    continue
+                kind, seek, lineno, when, label = parts
+                self.entries.append(IndexEntry(kind, int(seek), int(lineno), float(when), label))
+        self._times = [entry.time for entry in self.entries]
+
+    def markers(self):
+        return [entry for entry in self.entries if entry.kind == "marker"]
+
+    def find_marker(self, label):
+        """     Returns the most recent marker entry whose label contains 'label'
+
+        A marker whose label is exactly 'label' is preferred.  Returns None
+        if there is no such marker.
+        """
+        partial = None
+        for entry in reversed(self.entries):
+            if entry.kind != "marker":
+                continue
+            if entry.label == label:
+                return entry
+            if partial is None and label in entry.label:
+                partial = entry
+        return partial
+
+    def find_time(self, when):
+        """     Returns the last entry at or before 'when' (seconds since the epoch)
+
+        Reading from that entry includes everything received from 'when'
+        onwards.  Returns the first entry if 'when' is before the log starts.
+        """
+        if not self.entries:
+            return None
+        pos = bisect.bisect_right(self._times, when)
+        return self.entries[max(pos - 1, 0)]
+
+    def next_entry(self, entry, kinds=("open", "marker")):
+        """     Returns the first entry after 'entry' whose kind is in 'kinds'
+        """
+        for later in self.entries[self.entries.index(entry) + 1:]:
+            if later.kind in kinds:
+                return later
+        return None
+
+    def read_lines(self, start=None, end=None):
+        """     Yields the lines of the log from entry 'start' up to entry 'end'
+
+        'start' defaults to the top of the log and 'end' to the end of it.
+        Lines keep their line endings.
+        """
+        pending = ''
+        for data in self._read_blocks(start.seek if start else 0,
+                                      end.seek if end else None):
+            lines = (pending + data).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if pending:
+            yield pending
+
+    def read_section(self, label):
+        """     Returns the log from marker 'label' to the next marker or capture
+        """
+        start = self.find_marker(label)
+        if start is None:
+            raise ValueError("No marker '%s' in the index of %s" % (label, self._logpath))
+        return ''.join(self.read_lines(start, self.next_entry(start)))
+
+    def read_between(self, start_time, end_time=None):
+        """     Returns the log received between two times (seconds since the epoch)
+
+        The result is aligned to index entries, so may start a little
+        before 'start_time' and finish a little after 'end_time'.
+        """
+        start = self.find_time(start_time)
+        end = None
+        if end_time is not None:
+            pos = bisect.bisect_right(self._times, end_time)
+            if pos < len(self.entries):
+                end = self.entries[pos]
+        return ''.join(self.read_lines(start, end))
+
+    def tail(self, lines, offset=0):
+        """     Returns the last 'lines' lines of the log, 'offset' lines from the end
+
+        Works back through the index until enough lines have been read, so
+        only the end of the log is decompressed.
+        """
+        wanted = int(lines) + int(offset)
+        for entry in reversed(self.entries):
+            found = list(self.read_lines(entry))
+            if len(found) >= wanted or entry is self.entries[0]:
+                break
+        else:
+            found = list(self.read_lines())
+        if offset:
+            found = found[:-int(offset)]
+        return ''.join(found[-int(lines):])
+
+    def _read_blocks(self, start, end):
+        with open(self._logpath, 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            if self._compressed:
+                blocks = self._inflate(f, remaining, raw=start > 0)
+            else:
+                blocks = self._read(f, remaining)
+            for data in blocks:
+                yield data
+
+    def _read(self, f, remaining):
+        while remaining is None or remaining > 0:
+            data = f.read(READ_BLOCK if remaining is None else min(READ_BLOCK, remaining))
+            if not data:
+                return
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+    def _inflate(self, f, remaining, raw):
+        # Index positions are inside a gzip member, so start with a raw deflate
+        # stream.  Once it ends skip the member's 8 byte trailer, anything
+        # after that is further gzip members from later captures
+        if raw:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        skip = 0
+        for data in self._read(f, remaining):
+            while data:
+                if skip:
+                    dropped = min(skip, len(data))
+                    data = data[dropped:]
+                    skip -= dropped
+                    continue
+                output = decompressor.decompress(data)
+                if output:
+                    yield output
+                data = decompressor.unused_data
+                if data:
+                    if raw:
+                        skip = 8
+                        raw = False
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        output = decompressor.flush()
+        if output:
+            yield output
@@ -10,7 +10,6 @@ from paramiko.ssh_exception import NoValidConnectionsError
 import time
 from collections import namedtuple
 import math
-import xml.etree.ElementTree as ET
 import inspect
 import re
 import os
@@ -18,6 +17,7 @@ import subprocess
 import serial
 import struct
 import random
+import json
 from pprint import pprint as pp
 import types
 
@@ -26,6 +26,14 @@ import types
 # AminoEnable Libraries
 import Debug
 import HNRKey
+import LivenessProber
+import Netbooter
+import RackPowerCycle
+import SSHSessionManager
+import ESTBRestClient
+import ESTBRestBatch
+import CommandBatch
+import BootProfiler
 from InfraRedBlaster import InfraRedBlaster
 import StatCollection
 from libraries.hnr import HnrError
@@ -51,6 +59,9 @@ __version__ = "0.1 beta"
 
 DEBUG = False
 
+# Seconds a single ping waits for a reply
+PING_TIMEOUT = 3
+
 ANSI_ESCAPE = re.compile(r'\x1b[^m]*m')
 
 class ESTB(object):
@@ -125,6 +136,7 @@ class ESTB(object):
         self._os = OperatingSystem.OperatingSystem()
         self._stateflags = {}
         self._builtin = BuiltIn.BuiltIn()
+        self._boot_profiler = BootProfiler.BootProfiler()
 
         # Stats collection interface
         self.stats_collection = None
@@ -164,6 +176,7 @@ class ESTB(object):
         self._ssh_timeout = '10 seconds'
         self._ssh_tunnel_user = ''
         self._ssh_tunnel_password = ''
+        self._ssh_managers = {}
 
         # Entone Boot ini path
         self._ini_path = entone_boot_ini
@@ -245,35 +258,44 @@ class ESTB(object):
     def send_curl_command_and_return_output(
         self, method, url, data, need_status_code, send_method):
         """
-        Use SSH connection or Debug connection to send REST API command
-        to the stb.
+        Send a REST API command to the stb, straight to its REST port over
+        a kept-alive connection, or if that can not be reached from the
+        host by curl on the stb over SSH or Debug connection.
 
         Available arguments:
             method: GET, POST, PUT, DELETE
             need_status_code: True, False
-            send_method: ssh, console
+            send_method: ssh, console (only used for curl on the stb)
 
         Author: Mike.GUO
         Date:   28SEP16
 
-        Returns a string of curl command return output from stb.
+        Returns a string of the response as curl prints it, with the status
+        line and headers first if need_status_code is True.
 
         Examples:-
         | ${res}= | send curl command and return output | POST | player | "{\"window_type\":\"main\"}" | ${True} | ssh |
         """
-        return self._rest_api.send_curl_command_and_return_output(
-            method, url, data, need_status_code, send_method)
+        response = self._send_rest_request(method, url, data)
+        if response is None:
+            return self._rest_api.send_curl_command_and_return_output(
+                method, url, data, need_status_code, send_method)
+        if response.status is None:
+            return ""
+        if need_status_code and str(need_status_code).lower() != "false":
+            return ESTBRestClient.curl_output(response)
+        return response.text
 
     def send_curl_command_and_expect_200(
         self, method, url, data, send_method, explain_str):
         """
-        Use SSH connection or Debug connection to send REST API command
-        to the stb and returns if the result contains "HTTP/1.1 200 OK",
+        Send a REST API command to the stb (as `Send Curl Command And Return
+        Output`) and returns if the result contains "HTTP/1.1 200 OK",
         and log the explain_str to log file if return False.
 
         Available arguments:
             method: GET, POST, PUT, DELETE
-            send_method: ssh, console
+            send_method: ssh, console (only used for curl on the stb)
 
         Author: Mike.GUO
         Date:   28SEP16
@@ -284,20 +306,26 @@ class ESTB(object):
         Examples:-
         | ${res}= | send curl command and expect 200 | "POST" | "player/1/open" | "{\"src\":\"udp://233.22.133.12:8110\",\"pltbuf\":\"3600\"}" | "ssh" | "Open source" |
         """
-        return self._rest_api.send_curl_command_and_expect_200(
-            method, url, data,send_method, explain_str)
+        response = self._send_rest_request(method, url, data)
+        if response is None:
+            return self._rest_api.send_curl_command_and_expect_200(
+                method, url, data,send_method, explain_str)
+        if response.status != 200:
+            logger.info("%s failed: %s %s" % (explain_str, response.status, response.reason))
+            return False
+        return True
 
     def send_curl_command_and_expect_json(
         self, method, url, data, send_method, explain_str):
         """
-        Use SSH connection or Debug connection to send REST API command
-        to the stb and try to resolve the result to a json object,
+        Send a REST API command to the stb (as `Send Curl Command And Return
+        Output`) and try to resolve the result to a json object,
         and log the explain_str to log file if can not resolve the result as
         json.
 
         Available arguments:
             method: GET, POST, PUT, DELETE
-            send_method: ssh, console
+            send_method: ssh, console (only used for curl on the stb)
 
         Author: Mike.GUO
         Date:   28SEP16
@@ -308,8 +336,82 @@ class ESTB(object):
         Examples:-
         | ${res}= | send curl command and expect json | "GET" | "player/1" | "audio" | "ssh" | "Get audio languages" |
         """
-        return self._rest_api.send_curl_command_and_expect_json(
-            method, url, data, send_method, explain_str)
+        response = self._send_rest_request(method, url, data)
+        if response is None:
+            return self._rest_api.send_curl_command_and_expect_json(
+                method, url, data, send_method, explain_str)
+        return self._rest_json(response, explain_str)
+
+    def send_rest_requests_concurrently(self, *requests):
+        """
+        Send several REST API commands to the stb at once, each on its own
+        kept-alive connection, and try to resolve each result to a json
+        object.
+
+        Each request is a list of method, url and (optionally) data, as
+        given to `Send Curl Command And Expect Json`.  If the REST port can
+        not be reached from the host they are sent one at a time by curl on
+        the stb over SSH instead.
+
+        Returns a list of the results in the order of the requests, each a
+        Dict of json data, or False if it failed or could not be resolved.
+
+        Examples:-
+        | @{get_audio}= | Create List | GET | player/1 | audio |
+        | @{get_hdmi}= | Create List | GET | system/hdmi |
+        | @{res}= | send rest requests concurrently | ${get_audio} | ${get_hdmi} |
+        """
+        calls = [(request[0], request[1], request[2] if len(request) > 2 else None) for request in requests]
+        client = self._rest_client()
+        if not client.reachable():
+            return [self._rest_api.send_curl_command_and_expect_json(method, url, data, "ssh", "%s %s" % (method, url))
+                    for method, url, data in calls]
+        return [self._rest_json(response, "%s %s" % (method, url))
+                for (method, url, data), response in zip(calls, client.request_many(calls))]
+
+    def run_media_batch(self, steps, rollback=True):
+        """
+        Run a sequence of player, recorder and tuner operations using REST
+        API, each request sent as soon as the one before has answered, over
+        one kept-alive connection (or curl on the stb over SSH if the REST
+        port can not be reached from the host).
+
+        Every step is checked before any is sent.  The batch stops at the
+        first step that fails and, if rollback is True, closes the players,
+        recorders and tuners it opened.
+
+        Each step is a list of an operation and its arguments, or a string
+        of them.  A step can use the id opened by an earlier step as @N,
+        counting steps from 1.  Operations:
+            open player: src [pltbuf=3600] [window_type=main]
+            change player src: id src [playnow=1]
+            change player param: id [x] [y] [z] [h] [w]
+            play player: id [speed=1]
+            pause player: id
+            seek player: id seek_value [mode=0]
+            get player, close player: id
+            open recorder: src assetname
+            change recorder src: id src assetname
+            start recorder, stop recorder, close recorder: id
+            open tuner: standard symbol_rate frequency
+            change tuner setting: id standard symbol_rate frequency
+            get tuner, close tuner: id
+
+        Returns a list of a Dict per step, with keys step, operation, ok,
+        status, result (the json of its last response), id, start and
+        elapsed (seconds).
+
+        Examples:-
+        | @{open}= | Create List | open player | udp://233.22.133.12:8110 | 3600 | main |
+        | @{play}= | Create List | play player | @1 |
+        | @{zap}= | Create List | change player src | @1 | udp://233.22.133.13:8110 |
+        | @{steps}= | Create List | ${open} | ${play} | ${zap} |
+        | @{res}= | run media batch | ${steps} |
+        | Should Be True | ${res[-1]['ok']} |
+        """
+        batch = ESTBRestBatch.ESTBRestBatch(steps)
+        rollback = rollback and str(rollback).lower() != "false"
+        return batch.run(self._send_batch_request, rollback)
 
     def hnr_console_password(self):
         """
@@ -1503,22 +1605,35 @@ class ESTB(object):
     def _send_ssh_command(self, command, interface=-1, ansi_escape=True):
         """     Sends a single SSH command and returns the output
         """
+        return self._send_ssh_command_and_rc(command, interface, ansi_escape)[0]
+
+    def _send_ssh_command_and_rc(self, command, interface=-1, ansi_escape=True):
+        """     Sends a single SSH command and returns the output and return code
+
+        Without 'Login And Keep SSH Open' the command runs on a channel of
+        the box's persistent SSH transport (see SSHSessionManager), and the
+        return code is the channel's exit status.  In a kept open shell the
+        output is read up to the prompt, and the return code is None.
+        """
         logger.debug('_send_ssh_command: Running Command: %s' % (command))
 
         stb_ip = self._get_iface_ip(interface)
 
         if not self._keep_ssh_open:
-            self._ssh_login(stb_ip)
+            output, rc = self._get_ssh_manager(stb_ip).run(command)
+            if ansi_escape:
+                output = ANSI_ESCAPE.sub('', output)
+            logger.debug('_send_ssh_command: Command Returned: %s (rc %s)' % (output, rc))
+            return output, rc
 
         output = self.ssh_conn.write(command)
 
         output += self.ssh_conn.read_until_regexp(self._ssh_cmd_prompt)
 
-        if self._keep_ssh_open:
-            # When the SSH connection is maintained running multiple commands
-            # we need to read again with a small delay to ensure we catch the
-            # whole output of the command using another read
-            output += self.ssh_conn.read(delay="0.5 seconds")
+        # When the SSH connection is maintained running multiple commands
+        # we need to read again with a small delay to ensure we catch the
+        # whole output of the command using another read
+        output += self.ssh_conn.read(delay="0.5 seconds")
 
         if ansi_escape:
             # pybot doesn't cope well with colour chars,
@@ -1536,10 +1651,60 @@ class ESTB(object):
 
         logger.debug('_send_ssh_command: Command Returned: %s' % (output))
 
-        if not self._keep_ssh_open:
-            self.close_ssh_connection()
+        return output, None
 
-        return output
+    def _rest_client(self):
+        return ESTBRestClient.ESTBRestClient.get_client(self._get_iface_ip(-1))
+
+    def _send_rest_request(self, method, url, data):
+        """     Sends a REST request from the host, returns a RestResponse
+
+        Returns None if the REST port can not be reached from the host, so
+        the caller sends it by curl on the STB instead.  A request that
+        fails otherwise gets a RestResponse with status None.
+        """
+        client = self._rest_client()
+        if not client.reachable():
+            logger.debug("REST port of %s unreachable from the host, using curl on the STB" % client.ip)
+            return None
+        try:
+            return client.request(method, url, data)
+        except ESTBRestClient.ESTBRestUnreachable as e:
+            logger.debug("%s, using curl on the STB" % e)
+            return None
+        except ESTBRestClient.ESTBRestError as e:
+            logger.warn(str(e))
+            return ESTBRestClient.RestResponse(None, str(e), {}, "", 0.0)
+
+    def _rest_json(self, response, explain_str):
+        if response.status is None:
+            logger.info("%s failed: %s" % (explain_str, response.reason))
+            return False
+        try:
+            return json.loads(response.text)
+        except ValueError:
+            logger.info("%s failed: can not resolve the result as json: %s" % (explain_str, response.text))
+            return False
+
+    def _send_batch_request(self, method, url, data):
+        response = self._send_rest_request(method, url, data)
+        if response is not None:
+            return response
+        if data is not None:
+            # curl gets the data on the STB's command line
+            data = '"%s"' % re.sub(r'(["\\$`])', r'\\\1', data)
+        start = time.time()
+        output = self._rest_api.send_curl_command_and_return_output(method, url, data, True, "ssh")
+        return ESTBRestClient.parse_curl_output(output or "", time.time() - start)
+
+    def _get_ssh_manager(self, stb_ip):
+        if self._ssh_keyfile == None:
+            raise RuntimeError('No keyfile set in ESTB defintion file')
+        manager = SSHSessionManager.SSHSessionManager.get_manager(stb_ip, self._ssh_user, self._ssh_keyfile,
+                                                                  port=10022,
+                                                                  timeout=utils.timestr_to_secs(self._ssh_timeout))
+        self._ssh_managers[stb_ip] = manager
+        return manager
 
 
     def _getINI(self):
@@ -1646,6 +1811,9 @@ class ESTB(object):
 
         self.ssh_conn.close_all_connections()
 
+        for manager in self._ssh_managers.values():
+            manager.close()
+
     def wait_for_debug_inactivity(self, inactivefor, timeout='10 minutes'):
         """
         Wait for Debug Inactivity
@@ -1900,20 +2068,23 @@ class ESTB(object):
 
         return file_count
 
-    def add_debug_listener(self, listener):
+    def add_debug_listener(self, listener, regex=False):
         """  Add a text string to 'listen' for on the debug interface
 
         If you wish to act upon a specific listener asyncronously (i.e. not pausing execution)
         add it to this list and then interogate with `Check Debug Listeners` keyword later.
 
+        Setting 'regex' treats the listener as a regular expression rather than a plain string.
+
         Examples:
-        | ESTB.Add Debug Listener    | AC_BOOT   |
+        | ESTB.Add Debug Listener    | AC_BOOT   |                   |
+        | ESTB.Add Debug Listener    | WARM_BOOT\\s+\\d+ | regex=${True}     |
 
         """
         logger.debug('add_debug_listener: adding listener "%s"' % (listener))
 
-        if listener not in self._debug._listeners:
-            self._debug.add_listener(listener)
+        if not self._debug.has_listener(listener):
+            self._debug.add_listener(listener, regex=regex)
 
     def remove_debug_listener(self, listener):
         """  Remove a text string to 'listen' for on the debug interface
@@ -1926,8 +2097,8 @@ class ESTB(object):
         | ESTB.Remove Debug Listener | AC_BOOT   |
 
         """
-        if listener in self._debug._listeners:
-            self._debug._listeners.remove(listener)
+        if self._debug.has_listener(listener):
+            self._debug.remove_listener(listener)
         else:
             raise ESTBError("ERROR: Trying to remove a listener that is not in the listeners list")
 
@@ -1955,9 +2126,11 @@ class ESTB(object):
     def wait_for_debug_listener(self, listener, timeout, donotError=False):
         """  Pause execution until a specific text string is read over debug
 
-        Any previous debug listener list will be replaced while this string is waited for.
+        Other debug listeners carry on being checked while this string is waited for, and any
+        number of waits (e.g. from several libraries) can be in progress at once.
 
-        An integer representing how many seconds it took to see the string will be returned.
+        The number of seconds it took to see the string is returned, to the millisecond.  This is
+        measured to when the line was read from the serial port.
 
         If the timeout expires an error will be thrown halting test execution unless the donotError
         flag is set to True. The donotError flag is useful if we want to test a scenario where we do not expect
@@ -1971,25 +2144,12 @@ class ESTB(object):
 
         """
 
-        templisteners = self._debug._listeners
-        templistenersheard = self._debug._listeners_heard
-        self._debug._listeners = ['%s' % listener]
-        self._debug._listeners_heard = []
         tout = utils.timestr_to_secs(timeout)
 
-        seccount = 0
-        found = False
-        while seccount <= tout:
-            time.sleep(1)
-            if len(self._debug._listeners_heard) > 0:
-                found = True
-                break
-            seccount = seccount + 1
-
-        self._debug._listeners = templisteners
-        self._debug._listeners_heard = templistenersheard
+        start = time.time()
+        hit = self._debug.wait_for_listener('%s' % listener, tout)
 
-        if not found:
+        if hit is None:
             if donotError:
                 # We did NOT expect to see the listener string!
                 # We also don't want to know how long it took
@@ -1997,8 +2157,10 @@ class ESTB(object):
             else:
                 raise ESTBError("Listener '%s' not heard within %s" % (listener, timeout))
         else:
-            logger.debug("Listener '%s' heard in %ss" % (listener, seccount))
-            return seccount
+            # The line may have been read just before the wait started
+            timetaken = round(max(hit.time - start, 0), 3)
+            logger.debug("Listener '%s' heard in %ss" % (listener, timetaken))
+            return timetaken
 
     def convert_seconds_to_timestring(self, seconds):
         seconds = int(seconds)
@@ -2217,15 +2379,19 @@ class ESTB(object):
         self._powerip_port = powerip_port
         self._powerip_type = powerip_type
 
-    def ping_stb_until_alive(self, interface=-1, timeout="2 minutes", pinginterval="5 seconds", dieonfail=True):
+    def ping_stb_until_alive(self, interface=-1, timeout="2 minutes", pinginterval="200 milliseconds", dieonfail=True):
         """  Repeatedly pings STB on any defined interface until it responds or 'timeout' expires.
 
-        If the STB responds before 'timeout' expires the keyword will return how long it took to respond (in seconds)
+        If the STB responds before 'timeout' expires the keyword will return how long it took to respond
+        (in seconds, to the millisecond)
 
         If 'timeout' expires, behaviour is defined by 'dieonfail'.  True raises an error, false returns -1.
 
+        The STB is probed every 'pinginterval' from within the test process (see LivenessProber), with ICMP
+        if permitted or else TCP connects to the telnet and ssh ports.
+
         Examples:
-        | Ping STB until alive  | interface=${wifi}     | pinginterval=10 seconds   |
+        | Ping STB until alive  | interface=${wifi}     | pinginterval=1 second     |
         | ${ret}=               | Ping STB until alive  | timeout=3 minutes         |
         | ${ret}=               | Ping STB until alive  | dieonfail=${False}        |
 
@@ -2234,15 +2400,13 @@ class ESTB(object):
         ip = self._get_iface_ip(interface)
 
         starttime = time.time()
-        endtime = starttime + utils.timestr_to_secs(timeout)
-        waitfor = utils.timestr_to_secs(pinginterval)
-
-        while time.time() < endtime:
-            try:
-                self._ping(ip)
-                return str(int(time.time() - starttime))
-            except:
-                time.sleep(waitfor)
+        watch = LivenessProber.LivenessProber.get_prober().watch(ip, utils.timestr_to_secs(pinginterval))
+        try:
+            replied = watch.wait(utils.timestr_to_secs(timeout))
+        finally:
+            watch.stop()
+        if replied is not None:
+            return "%.3f" % max(replied - starttime, 0)
         if dieonfail:
             raise ESTBError("Unable to reach STB with ping after %s" % timeout)
         else:
@@ -2271,12 +2435,11 @@ class ESTB(object):
                 logger.warn("Unable to ping STB on " + ip)
                 return False
 
-    def _ping(self, target):
+    def _ping(self, target, ports=LivenessProber.PROBE_PORTS):
         """     Ping an IP, return 0 if the host is alive
         raise PingResponseError if the host is down
         """
-        retcode = self._os.run_and_return_rc("ping -c 1 " + target)
-        if retcode != 0:
+        if not LivenessProber.LivenessProber.get_prober().probe(target, PING_TIMEOUT, ports):
             raise PingResponseError
         else:
             return 0
@@ -2336,6 +2499,7 @@ class ESTB(object):
             restart_debug = True
 
         # Reboot box
+        self._start_boot_profile("reboot")
         logger.info('reboot_stb: Rebooting STB now....')
 
 
@@ -2346,10 +2510,15 @@ class ESTB(object):
         except (RuntimeError, NoValidConnectionsError):
             logger.info('reboot_stb: Failed to open SSH, trying over debug...')
             self.send_commands_over_debug('reboot')
+            start = time.time()
+        self._boot_profiler.restart_from(start)
 
         logger.info('reboot_stb: Waiting for STB to restart.....')
         time.sleep(30)
+        pingstart = time.time()
         pingtimetaken = self.ping_stb_until_alive(timeout=pingtimeout)
+        if self._boot_profiler.is_running():
+            self._boot_profiler.mark("ping", pingstart + float(pingtimetaken))
         if nocheck=="1":
             logger.debug('reboot_stb: STB responded in: "%ss"' % (pingtimetaken))
             logger.info('reboot_stb: STB responded in: "%ss"' % (pingtimetaken))
@@ -2383,7 +2552,7 @@ class ESTB(object):
         else:
 
             time.sleep(1)
-            pingtimetaken=int(pingtimetaken)
+            pingtimetaken=int(float(pingtimetaken))
             print pingtimetaken
             logger.debug('reboot_stb: STB responded in: "%ss"' % (pingtimetaken))
             logger.debug('reboot_stb: waiting for 30 seconds before commencing')
@@ -2391,7 +2560,7 @@ class ESTB(object):
             time.sleep(90)
             self._builtin.wait_until_keyword_succeeds(name='check_for_browser', retry_interval='1s', timeout='3minutes')
             self.check_for_browser()
-            pingtimetaken=int(pingtimetaken)
+            pingtimetaken=int(float(pingtimetaken))
             print pingtimetaken
             timetaken= pingtimetaken + 30
             timer = time.time() - start
@@ -2437,6 +2606,90 @@ class ESTB(object):
         self.reboot_stb(pingtimeout=pingtimeout)
 
 
+    def set_boot_milestones(self, *milestones):
+        """ Set Boot Milestones - Sets the milestones timed during each reboot or power cycle
+
+        Each milestone is given as name=regular expression, in boot order, and is timed from the
+        first line of debug output matching it.  See `Get Boot Timeline`.
+
+        The defaults are:
+        | bootloader | CFE version or U-Boot banner                 |
+        | kernel     | Linux version                                |
+        | rootfs     | VFS: Mounted root                            |
+        | app        | Starting application/browser/middleware      |
+        | network    | udhcpc lease, or the link coming up          |
+        | video      | first frame or picture decoded               |
+
+        Example:-
+        | Set Boot Milestones   | bootloader=U-Boot     | kernel=Linux version  | app=Starting ekioh    |
+        """
+        parsed = []
+        for milestone in milestones:
+            name, sep, pattern = milestone.partition("=")
+            if not sep or not name.strip() or not pattern:
+                raise ESTBError("Boot milestones are given as name=regular expression, not '%s'" % milestone)
+            parsed.append((name.strip(), pattern))
+        self._boot_profiler.finish()
+        self._boot_profiler.set_milestones(parsed)
+
+    def get_boot_timeline(self):
+        """ Get Boot Timeline - Returns the milestone times of the last reboot or power cycle
+
+        While `Capture Debug` is running, `Reboot STB` and `Power Cycle STB` time each boot milestone
+        (see `Set Boot Milestones`) from the reboot being sent, or from power on, to the first debug
+        line matching it.  The time of the first ping reply is added as 'ping'.  Milestones are timed
+        until the next boot or until this keyword is called, so late ones such as first video are
+        caught.
+
+        Returns a dictionary of milestone name to seconds (to the millisecond), or None for milestones
+        that weren't seen.  Each boot is also appended to ${OUTPUTDIR}/${SUITENAME}_<stb>_boot_timeline.csv
+
+        Example:-
+        | Reboot STB        |                       |
+        | ${timeline}=      | Get Boot Timeline     |
+        | Should Be True    | ${timeline['kernel']} < 5     |
+        """
+        self._boot_profiler.finish()
+        if not self._boot_profiler.timelines:
+            raise ESTBError("No boot has been timed, is Capture Debug running?")
+        return self._format_boot_times(self._boot_profiler.timelines[-1].as_dict())
+
+    def get_boot_statistics(self):
+        """ Get Boot Statistics - Returns statistics for each boot milestone across every boot timed
+
+        See `Get Boot Timeline`.  Returns a dictionary of milestone name to a dictionary of count
+        (the number of boots it was seen in), min, mean, median, max and stdev in seconds.
+
+        Example:-
+        | ${stats}=         | Get Boot Statistics   |
+        | Log               | ${stats['app']['median']}     |
+        """
+        self._boot_profiler.finish()
+        ret = {}
+        for name, stats in self._boot_profiler.statistics().items():
+            ret[name] = self._format_boot_times(stats, exclude=("count",))
+        return ret
+
+    def _format_boot_times(self, times, exclude=()):
+        ret = {}
+        for name, value in times.items():
+            if value is None or name in exclude:
+                ret[name] = value
+            else:
+                ret[name] = "%.3f" % value
+        return ret
+
+    def _start_boot_profile(self, label):
+        if self._debug is None:
+            return
+        try:
+            outdir = self._builtin.replace_variables('${OUTPUTDIR}')
+            suitename = self._builtin.replace_variables('${SUITENAME}')
+            self._boot_profiler.set_path(os.path.join(outdir, suitename + '_' + self._shortname + '_boot_timeline.csv').replace(' ','_'))
+        except:
+            self._boot_profiler.set_path(None)
+        self._boot_profiler.start(self._debug, label)
+
     def get_stateflag(self, stateflag):
         """ Get Stateflag - Return stateflag information for the current object
 
@@ -2469,21 +2722,28 @@ class ESTB(object):
         self._stateflags[stateflag] = state
 
 
-    def power_cycle_stb(self, waitfor="1 minute", downtime="1 second"):
-        """  Power cycles the STB and waits for a set time (default = 1 minute) before continuing.
+    def power_cycle_stb(self, waitfor="1 minute", downtime="1 second", settle="10 seconds"):
+        """  Power cycles the STB and waits up to a set time (default = 1 minute) for it to respond to ping.
 
-        When the wait period expires the STB will be pinged.  A failure to respond will halt the test execution.
+        The keyword stops waiting as soon as the STB responds, then gives it 'settle' (default 10 seconds)
+        to finish booting before anything is restarted, as `Reboot STB` does.  A failure to respond within
+        'waitfor' will halt the test execution.
 
-        If the telnet port was being held open it will be closed and reopened after the wait period.
-        If stb stats were being collected they will be halted and restarted after the wait period.
+        If the telnet port was being held open it will be closed and reopened once the STB responds.
+        If stb stats were being collected they will be halted and restarted once the STB responds.
         A debug capture will stay open.
 
         Defining a downtime (defaults to 1 second) will change the time between OFF and ON
 
+        Returns the number of seconds (to the millisecond) from pinging starting to the STB first responding,
+        not counting 'settle'.
+
         Examples:
         | Power cycle STB   |                       |
         | Power cycle STB   | waitfor=2 minutes     |
         | Power cycle STB   | downtime=5 seconds    |
+        | Power cycle STB   | settle=30 seconds     |
+        | ${recovery}=      | Power cycle STB       |
 
         """
 
@@ -2491,31 +2751,17 @@ class ESTB(object):
             logger.warn("A power cycle was attempted when no powerip settings were defined!")
             return
 
-        restart_stats = False
-        restart_ssh = False
-        restart_debug = False
-
         powerip = self._powerip_port.split(":")[0]
         powerport = self._powerip_port.split(":")[1]
 
         if self._powerip_type == "netbooter":
             try:
-                self._ping(powerip)
+                self._ping(powerip, ports=(80,))
             except PingResponseError:
                 logger.warn("No response from powerip device on ip '" + powerip + "'.  Unable to power cycle STB")
                 return
 
-        if (self._keep_ssh_open) and (self.ssh_conn != None):
-            restart_ssh = True
-
-        if self.stats_collection != None:
-            restart_stats = True
-            self.stats_collection.pause_stats_for_reboot()
-
-        if self._logread_is_running and (self._debug != None):
-            # No need to stop logread process, it will die on reboot
-            self._logread_is_running = False
-            restart_debug = True
+        restart = self._prepare_for_power_cycle()
 
         # Power cycle box
 
@@ -2524,19 +2770,104 @@ class ESTB(object):
         if self._powerip_type == "netbooter":
             self._power_ip_netbooter(powerip, powerport, 0)
             time.sleep(utils.timestr_to_secs(downtime))
+            self._start_boot_profile("power cycle")
             self._power_ip_netbooter(powerip, powerport, 1)
         elif self._powerip_type == "usb-rly16":
             self._power_ip_usbrly16(powerip, powerport, 0)
             time.sleep(utils.timestr_to_secs(downtime))
+            self._start_boot_profile("power cycle")
             self._power_ip_usbrly16(powerip, powerport, 1)
+        self._boot_profiler.restart_from(time.time())
+
+        logger.info("Waiting up to %s for STB to restart" % (waitfor))
+        pingstart = time.time()
+        pingtimetaken = self.ping_stb_until_alive(timeout=waitfor)
+        if self._boot_profiler.is_running():
+            self._boot_profiler.mark("ping", pingstart + float(pingtimetaken))
+        logger.info("STB responded after %ss" % pingtimetaken)
+        # A first reply only means the network is up, not that SSH and the apps are
+        logger.info("Waiting %s for STB to settle" % settle)
+        time.sleep(utils.timestr_to_secs(settle))
+
+        self._restore_after_power_cycle(restart)
+
+        return pingtimetaken
+
+    def power_cycle_rack(self, *stbs, **kwargs):
+        """  Power cycles a list of STBs together and waits for them all to come back
+
+        The STBs are given by the names their libraries were imported with (or are library instances),
+        and each must have a netbooter powerip set with `Set Powerip Port`.  With no STBs given this
+        STB is power cycled on its own.
+
+        All the STBs are switched off, then after 'downtime' switched on again one at a time 'stagger'
+        apart, to limit the inrush current.  Each is then waited for, for up to 'timeout' from its own
+        power on: for 'listener' on its debug capture if given, otherwise for it to respond to ping.
+        So a whole rack comes back in about one boot time.
+
+        SSH, stats collection and logread are handled as in `Power Cycle STB`.
+
+        Returns a dictionary of STB name to the seconds (to the millisecond) from power on to the STB
+        responding.  If any STB fails to come back, behaviour is defined by 'dieonfail': True raises
+        an error, False leaves its time as -1.
+
+        Examples:
+        | Power cycle rack  | STB1              | STB2              | STB3                      |
+        | ${times}=         | Power cycle rack  | @{rack}           | stagger=1 second          |
+        | ${times}=         | Power cycle rack  | @{rack}           | dieonfail=${False}        |
+        """
+        downtime = utils.timestr_to_secs(kwargs.get('downtime', "1 second"))
+        stagger = utils.timestr_to_secs(kwargs.get('stagger', "500 milliseconds"))
+        timeout = utils.timestr_to_secs(kwargs.get('timeout', "3 minutes"))
+        listener = kwargs.get('listener', None)
+        dieonfail = kwargs.get('dieonfail', True)
+
+        boxes = []
+        for stb in stbs or [self]:
+            if isinstance(stb, basestring):
+                boxes.append((stb, self._builtin.get_library_instance(stb)))
+            else:
+                boxes.append((getattr(stb, '_shortname', str(stb)), stb))
+
+        rack = RackPowerCycle.RackPowerCycle(boxes, downtime, stagger, listener)
+        recovery = rack.run(timeout)
+
+        ret = {}
+        for name, seconds in recovery.items():
+            if seconds is None:
+                ret[name] = str(-1)
+            else:
+                ret[name] = "%.3f" % seconds
+        if rack.errors:
+            failures = ", ".join("%s (%s)" % (name, error) for name, error in sorted(rack.errors.items()))
+            if dieonfail:
+                raise ESTBError("STBs did not come back after power cycle: %s" % failures)
+            logger.warn("STBs did not come back after power cycle: %s" % failures)
+        return ret
+
+    def _prepare_for_power_cycle(self):
+        # Returns what to restart afterwards
+        restart_stats = False
+        restart_ssh = False
+        restart_debug = False
+
+        if (self._keep_ssh_open) and (self.ssh_conn != None):
+            restart_ssh = True
+
+        if self.stats_collection != None:
+            restart_stats = True
+            self.stats_collection.pause_stats_for_reboot()
 
-        logger.info("Waiting for STB to restart (%s)" % (waitfor))
-        sleeptime = utils.timestr_to_secs(waitfor)
-        time.sleep(sleeptime)
-        self.ping_stb_until_alive(timeout=sleeptime)
+        if self._logread_is_running and (self._debug != None):
+            # No need to stop logread process, it will die on reboot
+            self._logread_is_running = False
+            restart_debug = True
 
+        return restart_ssh, restart_stats, restart_debug
 
+    def _restore_after_power_cycle(self, restart):
         # Now restart all the stuff that was stopped
+        restart_ssh, restart_stats, restart_debug = restart
         if restart_ssh:
             logger.info('Reopening SSH connection')
             #self.login_and_keep_ssh_open()
@@ -2578,7 +2909,7 @@ class ESTB(object):
 
         if self._powerip_type == "netbooter":
             try:
-                self._ping(powerip)
+                self._ping(powerip, ports=(80,))
             except:
                 logger.warn("No response from powerip device on ip '" + powerip + "'.  Unable to power cycle STB")
                 return
@@ -2689,42 +3020,18 @@ class ESTB(object):
 
 
     def _power_ip_netbooter(self, powerip, powerport, state, max_attempts=3):
-        if state == self._power_ip_netbooter_read(powerip, powerport, max_attempts):
-            logger.info("Power IP already in state %s.  No action" % state)
-        else:
-            self._os.run_and_return_rc('curl --user admin:admin http://' + powerip + '/cmd.cgi?rly=' + powerport + ' >/dev/null 2>&1')
-            counter = 0
-            while int(state) != int(self._power_ip_netbooter_read(powerip, powerport, max_attempts)):
-                counter = counter + 1
-                if counter > max_attempts:
-                    raise ESTBError("Could not set rly to state %s on powerip %s" % (state, powerip))
-                else:
-                    logger.info("Set powerip state failed... retrying")
-                    time.sleep(0.5)
-                    self._os.run_and_return_rc('curl --user admin:admin http://' + powerip + '/cmd.cgi?rly=' + powerport + ' >/dev/null 2>&1')
+        try:
+            Netbooter.Netbooter.get_netbooter(powerip).set_outlet(powerport, state, max_attempts)
+        except Netbooter.NetbooterError as e:
+            raise ESTBError(str(e))
 
     def _power_ip_netbooter_read(self, powerip, powerport, max_attempts=3):
-        counter = 0
-        # Check for a response from the powerip unit
-        logger.info("Pinging powerip")
-        while self._os.run_and_return_rc('ping %s -c 1' % powerip) != 0:
-            counter = counter + 1
-            if counter > max_attempts:
-                raise ESTBError("Unable to ping powerip on %s" % powerip)
-            else:
-                logger.info("Ping powerip failed... retrying")
-                time.sleep(0.5)
-
-        counter = 0
-
         try:
-            root = ET.fromstring(self._os.run('curl -s --user admin:admin http://%s/status.xml' % powerip))
-        except Exception as inst:
-            logger.warn('Power Ip Error: %s' % (inst))
+            return str(Netbooter.Netbooter.get_netbooter(powerip).get_outlet(powerport))
+        except Netbooter.NetbooterError as e:
+            logger.warn('Power Ip Error: %s' % (e))
             raise ESTBError("Unable to read status of powerip on %s" % powerip)
 
-        return root.find('rly%s' % powerport).text
-
     # Fakekey methods (public)
     def send_fakekey(self, key, pause=None, repeatcount=1):
         """  Sends a fakekey code converted to hnr
@@ -3024,7 +3331,7 @@ class ESTB(object):
         if self._debug != None:
             self._debug.debug_marker(text)
 
-    def capture_debug(self, debugport="default", suffix=None, dieonfail=True, compressed=False, setdebugpassword='', tryalternativepasswords=False, suppresslogread=False):
+    def capture_debug(self, debugport="default", suffix=None, dieonfail=True, compressed=False, setdebugpassword='', tryalternativepasswords=False, suppresslogread=False, sharedreader=False, terminalemulation=True, timestamps=False):
         """  Capture debug from a serial port
 
         Opens a serial connection to the debug on port ${debugport} (defaults to the
@@ -3050,6 +3357,17 @@ class ESTB(object):
 
         It is also possibleto suppress the standard call to start log read (if you are only interested in debug capture of boot)
 
+        When capturing from many STBs in one robot run, 'sharedreader=${True}' reads this port
+        from a single thread shared by every capture opened the same way, rather than a thread each.
+
+        Debug is passed through a full terminal emulator by default.  'terminalemulation=fast' uses
+        a much cheaper filter which only strips escape sequences and control characters, which is
+        all a plain log stream needs.  'terminalemulation=${False}' writes the output untouched.
+
+        'timestamps=${True}' prefixes every line of the log with the time it was received by this
+        host.  An index of the log (markers, plus a position every few seconds) is kept alongside it
+        in *_debug.log.idx, see `Get Debug Log Section` in PostProcessing.
+
         Examples:
         | Capture debug |                                        |
         | Capture debug | debugport=/dev/ttyUSB0                 |
@@ -3058,6 +3376,9 @@ class ESTB(object):
         | Capture debug | compressed=${True}                     |
         | Capture debug | tryalternativepasswords=${True}        |
         | Capture debug | suppresslogread=${True}                |
+        | Capture debug | sharedreader=${True}                   |
+        | Capture debug | terminalemulation=fast                 |
+        | Capture debug | timestamps=${True}                     |
 
         NOTE:  The current user MUST have access rights to serial ports!  To acheive this
         add the user to the 'dialout' group using:-
@@ -3092,7 +3413,10 @@ class ESTB(object):
         try:
             self._debug = Debug.Debug(appendsuffix=suffix,
                                       password=self._debug_password,
-                                      tryalternativepasswords=tryalternativepasswords)
+                                      tryalternativepasswords=tryalternativepasswords,
+                                      shared_reader=sharedreader,
+                                      terminal_emulation=terminalemulation,
+                                      line_timestamps=timestamps)
 
             self._debug.open_connection(commport=self._debugport,
                                         compressed=compressed,
@@ -3418,16 +3742,12 @@ class ESTB(object):
         | Send commands | ls /mnt/nv    | cp log.temp / | rm log.temp       |
         | @{rcodes}=    | Send commands | cd /root      | mv log.txt /home  |
         """
-        close_ssh = False
-
         if not self._keep_ssh_open:
-            # If we don't already have an open SSH connection, create one and leave
-            #  it open, and set a flag to shut it down once the commands have run
-            
-            # ssh login with repeat until success or max attempts exceeded.
-            #self.login_and_keep_ssh_open()
-            self._robust_ssh_login_and_keep_ssh_open()
-            close_ssh = True
+            # One channel for the lot, so the commands share a shell (e.g. a cd carries on to the next)
+            batch = CommandBatch.CommandBatch(commands)
+            output, rc = self._get_ssh_manager(self._get_iface_ip(-1)).run(
+                "".join(batch.script(index) for index in range(len(batch))))
+            return [int(rcode) for rcode, text in batch.parse(ANSI_ESCAPE.sub('', output))]
 
         ret = []
 
@@ -3438,9 +3758,6 @@ class ESTB(object):
             # Strip the integer from the returned string
             ret.append(int(ret_code))
 
-        if close_ssh:
-            self.close_ssh_connection()
-
         return ret
 
     def record_pvr_asset_and_check_level(self, url, rectime, level_event='Low'):
@@ -3510,23 +3827,15 @@ class ESTB(object):
         | ${ret}    | ${rc}=    | Send command and return output and rc | cat /etc/hosts    | ${wifi_interface} |
         """
 
-        close_ssh = False
-
-        if not self._keep_ssh_open:
-            close_ssh = True
-            #self.login_and_keep_ssh_open()
-            self._robust_ssh_login_and_keep_ssh_open()
-
-        output = self._send_ssh_command(command, interface=interface)
+        output, ret_code = self._send_ssh_command_and_rc(command, interface=interface)
 
-        ret_code = self._send_ssh_command('echo $?')
-        ret_code = ret_code.replace('\r\n', '')
-        ret_code = ret_code.replace(' ', '')
-
-        ip = self._get_iface_ip(interface)
-
-        if close_ssh:
-            self.close_ssh_connection()
+        if ret_code is None:
+            # A kept open shell, ask it
+            ret_code = self._send_ssh_command('echo $?')
+            ret_code = ret_code.replace('\r\n', '')
+            ret_code = ret_code.replace(' ', '')
+        else:
+            ret_code = str(ret_code)
 
         return output, ret_code
 
@@ -0,0 +1,204 @@
+"""
+Functions:
+    parse_steps - Robot step lists (or strings) to (operation, arguments) pairs
+
+Classes:
+    ESTBRestBatch - Runs a sequence of player, recorder and tuner operations over the REST API
+    Operation - The arguments of an operation and the REST requests it is made of
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import json
+import time
+from collections import namedtuple
+
+__version__ = "0.1 beta"
+
+# The arguments of an operation ("name=default" if optional), and its
+# requests, each (method, path, body arguments).  "{id}" in a path is the
+# id the operation was given, or the one made by its first request if
+# that is a POST to a collection (e.g. a new player).  The paths and body
+# names follow the curl examples of the ESTB REST keywords.
+Operation = namedtuple("Operation", "args requests")
+
+OPERATIONS = {
+    "open player": Operation(("src", "pltbuf=3600", "window_type=main"),
+                             [("POST", "player", ("window_type",)),
+                              ("POST", "player/{id}/open", ("src", "pltbuf"))]),
+    "change player src": Operation(("id", "src", "playnow=1"),
+                                   [("POST", "player/{id}/open", ("src", "playnow"))]),
+    "change player param": Operation(("id", "x=0", "y=0", "z=0", "h=0", "w=0"),
+                                     [("PUT", "player/{id}", ("x", "y", "z", "h", "w"))]),
+    "play player": Operation(("id", "speed=1"), [("POST", "player/{id}/play", ("speed",))]),
+    "pause player": Operation(("id",), [("POST", "player/{id}/pause", ())]),
+    "seek player": Operation(("id", "seek_value", "mode=0"), [("POST", "player/{id}/seek", ("seek_value", "mode"))]),
+    "get player": Operation(("id",), [("GET", "player/{id}", ())]),
+    "close player": Operation(("id",), [("DELETE", "player/{id}", ())]),
+    "open recorder": Operation(("src", "assetname"),
+                               [("POST", "recorder", ()),
+                                ("POST", "recorder/{id}/open", ("src", "assetname"))]),
+    "change recorder src": Operation(("id", "src", "assetname"),
+                                     [("POST", "recorder/{id}/open", ("src", "assetname"))]),
+    "start recorder": Operation(("id",), [("POST", "recorder/{id}/start", ())]),
+    "stop recorder": Operation(("id",), [("POST", "recorder/{id}/stop", ())]),
+    "close recorder": Operation(("id",), [("DELETE", "recorder/{id}", ())]),
+    "open tuner": Operation(("standard", "symbol_rate", "frequency"),
+                            [("POST", "tuner", ("standard", "symbol_rate", "frequency"))]),
+    "change tuner setting": Operation(("id", "standard", "symbol_rate", "frequency"),
+                                      [("PUT", "tuner/{id}", ("standard", "symbol_rate", "frequency"))]),
+    "get tuner": Operation(("id",), [("GET", "tuner/{id}", ())]),
+    "close tuner": Operation(("id",), [("DELETE", "tuner/{id}", ())]),
+}
+
+
+def parse_steps(steps):
+    """     Returns a list of (operation, {argument: value}) from 'steps'
+
+    Each step is a list of the operation name then its arguments, or a
+    string of them separated by whitespace.  Raises ValueError for an
+    unknown operation, the wrong number of arguments or an id "@N" that is
+    not an earlier step, so a bad batch fails before anything is sent.
+    """
+    parsed = []
+    for number, step in enumerate(steps, 1):
+        if isinstance(step, basestring):
+            words = step.split()
+            for length in (3, 2):
+                if " ".join(words[:length]).lower() in OPERATIONS:
+                    step = [" ".join(words[:length])] + words[length:]
+                    break
+        if not step or str(step[0]).strip().lower() not in OPERATIONS:
+            raise ValueError("Step %d: unknown operation %s" % (number, step[0] if step else "''"))
+        name = str(step[0]).strip().lower()
+        names = OPERATIONS[name].args
+        values = list(step[1:])
+        required = len([arg for arg in names if "=" not in arg])
+        if not required <= len(values) <= len(names):
+            raise ValueError("Step %d: '%s' takes %s arguments, got %d" % (
+                number, name, ", ".join(names), len(values)))
+        args = {}
+        for index, arg in enumerate(names):
+            arg, _, default = arg.partition("=")
+            args[arg] = values[index] if index < len(values) else default
+        reference = str(args.get("id", "")).strip()
+        if reference.startswith("@") and not (reference[1:].isdigit() and 1 <= int(reference[1:]) < number):
+            raise ValueError("Step %d: %s is not an earlier step" % (number, reference))
+        parsed.append((name, args))
+    return parsed
+
+
+class ESTBRestBatch(object):
+    """     Runs a sequence of player, recorder and tuner operations over one REST session
+
+    The ESTB player, recorder and tuner keywords each make their REST calls
+    and parse the result before Robot moves on to the next keyword, so
+    zap or multi-recording stress tests spend most of their time between
+    calls.  A batch takes the whole sequence up front (checking every step
+    before sending any), then sends each request as soon as the one before
+    it has answered, on the kept-alive connection of the caller's 'send'.
+
+    A step can use the id made by an earlier step as "@N", N counting
+    steps from 1, e.g. open a player then play "@1".
+
+    The batch stops at the first step that fails.  If 'rollback' is set
+    the players, recorders and tuners it opened are then closed again,
+    newest first (leaving any the batch closed itself), so a failed batch
+    leaves the STB as it found it.
+
+    `run` returns a dictionary per step: its "step" number, "operation",
+    "ok", the HTTP "status" and parsed "result" of its last request, the
+    "id" it made or used, and "start" (from the start of the batch) and
+    "elapsed" in seconds.  Steps not run have "ok" False and status None.
+    """
+
+    def __init__(self, steps):
+        self._steps = parse_steps(steps)
+
+    def __len__(self):
+        return len(self._steps)
+
+    def run(self, send, rollback=True):
+        """     Runs the batch, 'send' being a function of (method, path, data) returning a RestResponse
+        """
+        results = []
+        created = []
+        failed = False
+        start = time.time()
+        for number, (name, args) in enumerate(self._steps, 1):
+            result = {"step": number, "operation": name, "ok": False, "status": None,
+                      "result": None, "id": None, "start": None, "elapsed": 0.0}
+            results.append(result)
+            if failed:
+                continue
+            result["start"] = time.time() - start
+            try:
+                result["id"] = self._id(args.get("id"), results)
+            except ValueError as e:
+                result["result"] = str(e)
+                failed = True
+                continue
+
+            for index, (method, path, body) in enumerate(OPERATIONS[name].requests):
+                data = dict((key, args[key]) for key in body)
+                response = send(method, path.format(id=result["id"]), json.dumps(data) if data else None)
+                result["status"] = response.status
+                result["result"] = self._result(response)
+                result["elapsed"] += response.elapsed
+                if response.status is None or not 200 <= response.status < 300:
+                    break
+                if index == 0 and method == "POST" and "{id}" not in path:
+                    result["id"] = self._new_id(result["result"])
+                    if result["id"] is None:
+                        result["result"] = "No id in the response to %s %s: %s" % (method, path, response.text)
+                        break
+                    created.append((path, result["id"]))
+                elif method == "DELETE":
+                    # Closed by the batch itself, so not for rollback to close (the id may be reused)
+                    closed = path.format(id=result["id"])
+                    created = [(collection, made) for collection, made in created
+                               if "%s/%s" % (collection, made) != closed]
+            else:
+                result["ok"] = True
+            if not result["ok"]:
+                logger.info("Batch step %d '%s' failed: %s %s" % (number, name, result["status"], result["result"]))
+                failed = True
+
+        if failed and rollback:
+            for collection, new_id in reversed(created):
+                response = send("DELETE", "%s/%s" % (collection, new_id), None)
+                if response.status is None or not 200 <= response.status < 300:
+                    logger.warn("Batch rollback could not close %s %s: %s %s" % (
+                        collection, new_id, response.status, response.reason))
+
+        logger.debug("Batch of %d steps took %.3f seconds" % (len(results), time.time() - start))
+        return results
+
+    def _id(self, value, results):
+        if value is None:
+            return None
+        value = str(value).strip()
+        if value.startswith("@"):
+            # parse_steps has checked it is an earlier step
+            made = results[int(value[1:]) - 1]["id"]
+            if made is None:
+                raise ValueError("Step %s has no id" % value[1:])
+            return made
+        return value
+
+    def _result(self, response):
+        try:
+            return json.loads(response.text)
+        except ValueError:
+            return response.text if response.status is not None else response.reason
+
+    def _new_id(self, result):
+        # The STB answers a new object with its id, on its own or as {"id": ...}
+        if isinstance(result, dict):
+            result = result.get("id")
+        elif isinstance(result, list) and len(result) == 1:
+            result = result[0]
+        if isinstance(result, (int, long)) or (isinstance(result, basestring) and result.strip()):
+            return str(result).strip()
+        return None
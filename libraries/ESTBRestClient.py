@@ -0,0 +1,240 @@
+"""
+Functions:
+    curl_output - A response as `curl -i` prints it, headers then body
+    parse_curl_output - The output of `curl -i` back to a RestResponse
+    request_data - The data argument of the ESTB curl keywords as the request body
+
+Classes:
+    ESTBRestClient - Keep-alive HTTP sessions to the REST API of an ESTB
+    ESTBRestError - A REST request could not be made
+    ESTBRestUnreachable - The REST port of the STB cannot be reached from the host
+    RestResponse - The status, headers and body of one request, and how long it took
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import re
+import shlex
+import socket
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+
+__version__ = "0.1 beta"
+
+# Port the STB serves its REST API on, as HttpRest
+REST_PORT = 10080
+
+# Seconds a REST request may take
+REST_TIMEOUT = 10.0
+
+# Connections kept alive to each STB, so also the requests in flight at once
+REST_CONNECTIONS = 8
+
+# Seconds to wait for the REST port to accept a connection when probing it
+PROBE_TIMEOUT = 2.0
+
+# Seconds before a port found unreachable is probed again
+REPROBE_INTERVAL = 60
+
+# "HTTP/1.1 200 OK"
+STATUS_LINE = re.compile(r'^HTTP/\d\.\d\s+(\d{3})\s*(.*?)\s*$')
+
+RestResponse = namedtuple("RestResponse", "status reason headers text elapsed")
+
+
+class ESTBRestError(RuntimeError):
+    pass
+
+
+class ESTBRestUnreachable(ESTBRestError):
+    pass
+
+
+def curl_output(response):
+    """     Returns 'response' as `curl -i` prints it, so callers looking for "HTTP/1.1 200 OK" still work
+    """
+    lines = ["HTTP/1.1 %s %s" % (response.status, response.reason)]
+    lines += ["%s: %s" % (name, value) for name, value in sorted(response.headers.items())]
+    return "\r\n".join(lines) + "\r\n\r\n" + response.text
+
+
+def parse_curl_output(output, elapsed=0.0):
+    """     Returns a RestResponse from the output of `curl -i`, status None if there is no status line
+
+    A "100 Continue" before the real status line is skipped.
+    """
+    status, reason, headers, body = None, "No HTTP status in curl output", {}, output
+    lines = output.replace("\r\n", "\n").split("\n")
+    index = 0
+    while index < len(lines):
+        match = STATUS_LINE.match(lines[index])
+        if match is None:
+            index += 1
+            continue
+        status, reason, headers = int(match.group(1)), match.group(2), {}
+        index += 1
+        while index < len(lines) and lines[index].strip():
+            name, _, value = lines[index].partition(":")
+            headers[name.strip()] = value.strip()
+            index += 1
+        body = "\n".join(lines[index + 1:])
+        if status != 100:
+            break
+    return RestResponse(status, reason, headers, body, elapsed)
+
+
+def request_data(data):
+    """     Returns the data argument of the curl keywords as the body to send, or None
+
+    The keywords put 'data' on a shell command line, so it is often given
+    quoted and escaped for the shell, e.g. "{\\"window_type\\":\\"main\\"}".
+    The shell's quoting is undone here as the shell would have.
+    """
+    if data is None:
+        return None
+    data = str(data).strip()
+    if data in ("", "None", '""', "''"):
+        return None
+    if len(data) > 1 and data[0] == data[-1] and data[0] in "\"'":
+        try:
+            words = shlex.split(data)
+        except ValueError:
+            return data
+        if len(words) == 1:
+            return words[0]
+    return data
+
+
+class ESTBRestClient(object):
+    """     Talks to the REST API of an ESTB from the host over kept-alive connections
+
+    The ESTB curl keywords used to build a curl command line and run it on
+    the STB over SSH or the console, then scrape the output, so each REST
+    call cost at least a login and a round trip for the command, and a
+    process started on the box.
+
+    The client sends the request straight to the REST port instead, on a
+    session that keeps up to REST_CONNECTIONS connections open, so a call
+    is one HTTP round trip.  `request_many` sends several at once, one per
+    connection, and returns the responses in the order asked for.
+
+    Some networks only let the STB reach its own REST port.  `reachable`
+    probes the port from the host (remembering the answer), and the caller
+    falls back to curl on the box when it is not.  A request that cannot
+    connect probes again, and raises ESTBRestUnreachable if the port has
+    gone, so it is safe to send again by curl.  Any other failure raises
+    ESTBRestError, as the request may have been acted on.
+
+    There is one client per STB address per process, from `get_client`.
+    """
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls, ip, port=REST_PORT):
+        with cls._clients_lock:
+            key = (ip, port)
+            if key not in cls._clients:
+                cls._clients[key] = ESTBRestClient(ip, port)
+            return cls._clients[key]
+
+    def __init__(self, ip, port=REST_PORT, timeout=REST_TIMEOUT):
+        self.ip = ip
+        self.port = port
+        self._base_url = "http://%s:%s/" % (ip, port)
+        self._timeout = timeout
+        self._session = requests.Session()
+        # Idempotent requests are sent again once if a kept-alive connection has been dropped
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=REST_CONNECTIONS, max_retries=1)
+        self._session.mount("http://", adapter)
+        self._reachable = None
+        self._probed = 0
+        self._lock = threading.Lock()
+
+    def reachable(self):
+        """     Returns True if the REST port accepts connections from the host
+        """
+        with self._lock:
+            if self._reachable or (self._reachable is False and time.time() - self._probed < REPROBE_INTERVAL):
+                return self._reachable
+            try:
+                socket.create_connection((self.ip, self.port), PROBE_TIMEOUT).close()
+                self._reachable = True
+            except (socket.error, socket.timeout) as e:
+                logger.debug("REST port %s of %s unreachable from the host: %s" % (self.port, self.ip, e))
+                self._reachable = False
+            self._probed = time.time()
+            return self._reachable
+
+    def request(self, method, path, data=None, timeout=None):
+        """     Sends one request, returns a RestResponse
+
+        'path' is relative to the API root, e.g. player/1/open.  For a GET
+        'data' is the query string (e.g. audio for player/1?audio),
+        otherwise it is the body.
+        """
+        method = str(method).strip("\"' ").upper()
+        url = self._base_url + str(path).strip("\"' ").lstrip("/")
+        body = request_data(data)
+        if method == "GET" and body is not None:
+            url += ("&" if "?" in url else "?") + body
+            body = None
+        start = time.time()
+        try:
+            response = self._session.request(method, url, data=body,
+                                             timeout=self._timeout if timeout is None else timeout)
+        except requests.ConnectionError as e:
+            reason = getattr(e.args[0], "reason", None) if e.args else None
+            if isinstance(e, requests.ConnectTimeout) or isinstance(reason, NewConnectionError):
+                # Nothing was sent, so see whether the port has gone
+                with self._lock:
+                    self._reachable = None
+                if not self.reachable():
+                    raise ESTBRestUnreachable("%s %s on %s: %s" % (method, path, self.ip, e))
+            raise ESTBRestError("%s %s on %s failed: %s" % (method, path, self.ip, e))
+        except requests.RequestException as e:
+            raise ESTBRestError("%s %s on %s failed: %s" % (method, path, self.ip, e))
+        elapsed = time.time() - start
+        logger.debug("REST %s %s on %s: %s in %.3f seconds" % (method, path, self.ip, response.status_code, elapsed))
+        return RestResponse(response.status_code, response.reason, dict(response.headers), response.text, elapsed)
+
+    def request_many(self, calls, timeout=None):
+        """     Sends a list of (method, path, data) at once, returns a RestResponse for each in the same order
+
+        A request that fails gets a RestResponse with status None and the
+        error as its reason, rather than stopping the rest.
+        """
+        results = [None] * len(calls)
+        pending = list(enumerate(calls))
+        pending_lock = threading.Lock()
+
+        def sender():
+            while True:
+                with pending_lock:
+                    if not pending:
+                        return
+                    index, (method, path, data) = pending.pop(0)
+                try:
+                    results[index] = self.request(method, path, data, timeout)
+                except ESTBRestError as e:
+                    results[index] = RestResponse(None, str(e), {}, "", 0.0)
+
+        threads = [threading.Thread(target=sender) for i in range(min(REST_CONNECTIONS, len(calls)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def close(self):
+        self._session.close()
+        with self._lock:
+            self._reachable = None
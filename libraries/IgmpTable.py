@@ -0,0 +1,136 @@
+"""
+Functions:
+    parse_igmp - /proc/net/igmp to a list of IgmpMembership
+    group_to_hex - Dotted group address to the hex /proc/net/igmp shows it as
+    hex_to_group - The hex of /proc/net/igmp to a dotted group address
+
+Classes:
+    IgmpMembership - One group joined on one interface
+    IgmpEvent - A group joined or left, and when
+    IgmpWatch - Tracks joins and leaves from successive samples of the table
+"""
+# Standard libraries
+import re
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+__version__ = "0.1 beta"
+
+# "2	eth0      :     2      V3"
+DEVICE_LINE = re.compile(r'^\s*\d+\s+(\S+)\s*:\s*(\d+)\s+(\S+)')
+
+# "				FB0000E0     1 0:00000000		0"
+GROUP_LINE = re.compile(r'^\s+([0-9A-Fa-f]{8})\s+(\d+)\s+([01]):([0-9A-Fa-f]+)\s+(\d+)')
+
+IgmpMembership = namedtuple("IgmpMembership", "interface group hex users timer_running timer reporter")
+
+IgmpEvent = namedtuple("IgmpEvent", "time event interface group")
+
+
+def hex_to_group(value, little_endian=True):
+    """     Returns the dotted address of a group as /proc/net/igmp prints it
+
+    The kernel prints the address as a native integer, so on a little
+    endian box 239.255.250.22 is shown as 16FAFFEF.
+    """
+    packed = struct.pack("<I" if little_endian else ">I", int(value, 16))
+    return socket.inet_ntoa(packed)
+
+
+def group_to_hex(group, little_endian=True):
+    """     Returns the hex /proc/net/igmp shows for the dotted 'group'
+    """
+    return "%08X" % struct.unpack("<I" if little_endian else ">I", socket.inet_aton(group))[0]
+
+
+def parse_igmp(text, little_endian=True):
+    """     Returns an IgmpMembership for every group of every interface in /proc/net/igmp
+
+    'timer' is in jiffies, and only counts down while 'timer_running'.
+    """
+    memberships = []
+    interface = None
+    for line in text.splitlines():
+        match = DEVICE_LINE.match(line)
+        if match:
+            interface = match.group(1)
+            continue
+        match = GROUP_LINE.match(line)
+        if match and interface is not None:
+            value, users, running, timer, reporter = match.groups()
+            memberships.append(IgmpMembership(interface, hex_to_group(value, little_endian), value.upper(),
+                                              int(users), running == "1", int(timer, 16), int(reporter)))
+    return memberships
+
+
+class IgmpWatch(object):
+    """     Records when groups are joined and left, from samples of /proc/net/igmp
+
+    Each `update` is handed the memberships read from one sample and the
+    host time it was taken, and compares them with the previous sample.
+    A group that has appeared is recorded as a join at that time, one that
+    has gone as a leave, so times are accurate to the sampling interval.
+    The groups in the first sample were joined before watching started,
+    so are not recorded as joins.
+
+    `wait` lets another thread wait for a join or leave, e.g. after a
+    channel change.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._current = None
+        self.memberships = []
+        self.events = []
+        self.samples = 0
+
+    def update(self, memberships, when=None):
+        if when is None:
+            when = time.time()
+        current = set((membership.interface, membership.group) for membership in memberships)
+        with self._condition:
+            if self._current is not None:
+                for interface, group in sorted(current - self._current):
+                    self.events.append(IgmpEvent(when, "join", interface, group))
+                for interface, group in sorted(self._current - current):
+                    self.events.append(IgmpEvent(when, "leave", interface, group))
+            self._current = current
+            self.memberships = memberships
+            self.samples += 1
+            self._condition.notify_all()
+
+    def is_member(self, group, interface=None):
+        with self._condition:
+            return self._member(group, interface)
+
+    def wait(self, group, event="join", interface=None, after=None, timeout=None):
+        """     Waits for 'group' to be joined (or left) at or after host time 'after'
+
+        Returns the time it was seen, or None on timeout.  If the group is
+        already in the wanted state, and no sample since 'after' has shown
+        it change, 'after' is returned.
+        """
+        if after is None:
+            after = time.time()
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while True:
+                for seen in self.events:
+                    if (seen.time >= after and seen.event == event and seen.group == group and
+                            (interface is None or seen.interface == interface)):
+                        return seen.time
+                if self._current is not None and self._member(group, interface) == (event == "join"):
+                    return after
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _member(self, group, interface):
+        if self._current is None:
+            return False
+        return any(joined == group and (interface is None or on == interface)
+                   for on, joined in self._current)
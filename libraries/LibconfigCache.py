@@ -0,0 +1,122 @@
+"""
+Classes:
+    LibconfigCache - Snapshot of an STB's libconfig settings, read with one libconfig-dump
+"""
+# Standard libraries
+import re
+
+__version__ = "0.1 beta"
+
+# "NORFLASH.TVSYSTEM=PAL", "NORFLASH.TVSYSTEM = PAL" or "NORFLASH.TVSYSTEM PAL"
+SETTING = re.compile(r'^([A-Za-z0-9_.]+)\s*(?:=\s*|\s+)(.*)$')
+
+# "[NORFLASH]", for dumps that list settings under their group
+GROUP = re.compile(r'^\[([A-Za-z0-9_]+)\]$')
+
+
+class LibconfigCache(object):
+    """     Holds the libconfig settings from a libconfig-dump, so they can be read without the STB
+
+    `load` parses the output of libconfig-dump into a dictionary of
+    GROUP.NAME to value.  Settings are dropped again when they are set
+    (`forget`), and the whole snapshot when the STB reboots
+    (`invalidate`), so the next read goes back to the STB for them.
+
+    Keys that aren't in the snapshot are reported by `missing`, for the
+    caller to read with libconfig-get and `store`.
+    """
+
+    def __init__(self):
+        self._values = None
+
+    def is_loaded(self):
+        return self._values is not None
+
+    def load(self, output):
+        """     Adds the settings in libconfig-dump 'output' to the snapshot
+        """
+        if self._values is None:
+            self._values = {}
+        values = self.parse(output)
+        self._values.update(values)
+        return values
+
+    def parse(self, output):
+        """     Returns a dictionary of the settings in libconfig-dump 'output'
+        """
+        values = {}
+        group = None
+        for line in output.splitlines():
+            line = line.strip()
+            header = GROUP.match(line)
+            if header:
+                group = header.group(1)
+                continue
+            match = SETTING.match(line)
+            if not match:
+                continue
+            name, value = match.group(1), match.group(2)
+            if '.' not in name:
+                if group is None:
+                    continue
+                name = group + '.' + name
+            values[name] = self.unquote(value)
+        return values
+
+    def unquote(self, value):
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+            return value[1:-1]
+        return value
+
+    def get(self, key):
+        """     Returns the value of 'key', or None if it isn't in the snapshot
+        """
+        if self._values is None:
+            return None
+        return self._values.get(key)
+
+    def missing(self, keys):
+        """     Returns the keys in 'keys' that aren't in the snapshot
+        """
+        if self._values is None:
+            return list(keys)
+        return [key for key in keys if key not in self._values]
+
+    def store(self, key, value):
+        if self._values is None:
+            self._values = {}
+        self._values[key] = self.unquote(value)
+
+    def forget(self, keys):
+        """     Drops 'keys' from the snapshot, e.g. because they have just been set
+        """
+        if self._values is not None:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def invalidate(self):
+        """     Drops the whole snapshot, e.g. because the STB has rebooted
+        """
+        self._values = None
+
+    def changes(self, settings):
+        """     Returns the 'KEY value' strings in 'settings' whose value differs from the snapshot
+
+        Keys that aren't in the snapshot count as changed.
+        """
+        changed = []
+        for setting in settings:
+            key, value = self.split(setting)
+            current = self.get(key)
+            if current is None or current != self.unquote(value):
+                changed.append(setting)
+        return changed
+
+    def split(self, setting):
+        """     Splits a 'KEY value' setting, as given to libconfig-set, into (key, value)
+        """
+        fields = setting.strip().split(None, 1)
+        if len(fields) == 1:
+            return fields[0], ""
+        return fields[0], fields[1]
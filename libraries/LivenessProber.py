@@ -0,0 +1,311 @@
+"""
+Classes:
+    LivenessProber - Probes any number of hosts from one thread, recording when each first replies
+    ProbeWatch - One host being probed until it replies
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import errno
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+__version__ = "0.1 beta"
+
+# Seconds between probes of a host
+PROBE_INTERVAL = 0.2
+
+# Ports tried by TCP probes when ICMP isn't permitted: telnet for AmiNET
+# boxes, ssh for enable boxes
+PROBE_PORTS = (23, 22)
+
+# Seconds a TCP probe waits for the SYN to be answered
+CONNECT_TIMEOUT = 2.0
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+class LivenessProber(object):
+    """     Watches hosts until they reply, without starting a process per ping
+
+    `Ping STB Until Alive` used to run `ping -c 1` every 5 seconds, so a
+    reboot time was only known to within 5 seconds.  The prober instead
+    probes each watched host every PROBE_INTERVAL seconds from one select()
+    loop, and records the host time of the first reply, so any number of
+    boxes can be watched at once (e.g. a rack after a power cycle).
+
+    Probes are ICMP echo requests when the process may send them (a raw
+    socket as root, or an unprivileged ping socket where
+    net.ipv4.ping_group_range allows it).  Otherwise they are TCP connects
+    to PROBE_PORTS, where a connection refused counts as a reply, as only
+    a running host sends one.
+
+    Sockets are only used and closed on the prober's thread, and a watch
+    whose probing fails unexpectedly is dropped (its `wait` returning
+    None) rather than stopping the thread, and with it every other watch.
+
+    There is one prober per process, from `get_prober`.
+
+    Example:
+    | watch = LivenessProber.get_prober().watch("10.172.249.10") |
+    | replied = watch.wait(120)  # Host time of the first reply, or None |
+    """
+
+    _prober = None
+    _prober_lock = threading.Lock()
+
+    @classmethod
+    def get_prober(cls):
+        with cls._prober_lock:
+            if cls._prober is None:
+                cls._prober = LivenessProber()
+            return cls._prober
+
+    def __init__(self):
+        self._watches = []
+        self._retired = []
+        self._lock = threading.Lock()
+        self._ident = os.getpid() & 0xFFFF
+        self._seq = 0
+        self._icmp, self._icmp_raw = self._open_icmp()
+        if self._icmp is None:
+            logger.info("ICMP not permitted, probing with TCP connects to ports %s" %
+                        ", ".join(str(port) for port in PROBE_PORTS))
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def uses_icmp(self):
+        return self._icmp is not None
+
+    def watch(self, host, interval=PROBE_INTERVAL, ports=PROBE_PORTS):
+        """     Starts probing 'host' every 'interval' seconds until it replies
+
+        Returns a ProbeWatch.  Probing stops at the first reply or when the
+        watch is stopped.
+        """
+        watch = ProbeWatch(self, socket.gethostbyname(host), float(interval), ports)
+        with self._lock:
+            self._watches = self._watches + [watch]
+        self._wake()
+        return watch
+
+    def probe(self, host, timeout=CONNECT_TIMEOUT, ports=PROBE_PORTS):
+        """     Returns True if 'host' replies within 'timeout' seconds
+        """
+        watch = self.watch(host, ports=ports)
+        try:
+            return watch.wait(timeout) is not None
+        finally:
+            watch.stop()
+
+    def _remove(self, watch):
+        # The prober thread closes the watch's sockets, as it may be using them
+        with self._lock:
+            self._watches = [other for other in self._watches if other is not watch]
+            self._retired.append(watch)
+        self._wake()
+
+    def _drop(self, watch, error):
+        logger.warn("Liveness probing of %s failed, giving up on it: %s" % (watch.host, error))
+        watch.failed(error)
+        self._remove(watch)
+
+    def _wake(self):
+        os.write(self._wake_write, 'x')
+
+    def _open_icmp(self):
+        for kind, raw in ((socket.SOCK_RAW, True), (socket.SOCK_DGRAM, False)):
+            try:
+                sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+                sock.setblocking(0)
+                return sock, raw
+            except (socket.error, OSError):
+                pass
+        return None, False
+
+    def _run(self):
+        while True:
+            try:
+                self._run_once()
+            except Exception as e:
+                # Keep probing the other watches whatever happened
+                logger.warn("Liveness prober error: %s" % e)
+                time.sleep(PROBE_INTERVAL)
+
+    def _run_once(self):
+        with self._lock:
+            watches = self._watches
+            retired, self._retired = self._retired, []
+        for watch in retired:
+            watch.close_pending()
+        now = time.time()
+
+        for watch in watches:
+            try:
+                if now >= watch.next_probe:
+                    watch.next_probe = now + watch.interval
+                    if self._icmp is not None:
+                        self._send_echo(watch)
+                    else:
+                        watch.connect()
+                watch.expire(now)
+            except Exception as e:
+                self._drop(watch, e)
+
+        fds = [self._wake_read]
+        if self._icmp is not None:
+            fds.append(self._icmp)
+        pending = {}
+        for watch in watches:
+            for sock in watch.pending:
+                pending[sock] = watch
+
+        due = min([watch.next_probe for watch in watches] or [now + 60])
+        try:
+            readable, writable, _ = select.select(fds, pending.keys(), [], max(due - time.time(), 0))
+        except (select.error, socket.error, ValueError):
+            # A socket was closed under us, start again with the current watches
+            return
+
+        if self._wake_read in readable:
+            os.read(self._wake_read, 4096)
+        if self._icmp is not None and self._icmp in readable:
+            self._read_echo(watches)
+        for sock in writable:
+            try:
+                pending[sock].connected(sock)
+            except Exception as e:
+                self._drop(pending[sock], e)
+
+    def _send_echo(self, watch):
+        self._seq = (self._seq + 1) & 0xFFFF
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self._ident, self._seq)
+        payload = struct.pack("!d", time.time())
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, _checksum(header + payload),
+                             self._ident, self._seq) + payload
+        try:
+            self._icmp.sendto(packet, (watch.host, 0))
+        except socket.error:
+            # e.g. no route while the interface is coming up, try again next interval
+            pass
+
+    def _read_echo(self, watches):
+        while True:
+            try:
+                packet, address = self._icmp.recvfrom(2048)
+            except socket.error:
+                return
+            received = time.time()
+            if self._icmp_raw:
+                # Raw sockets see every ICMP packet, with its IP header
+                packet = packet[(ord(packet[0]) & 0x0F) * 4:]
+                if len(packet) < 8 or struct.unpack("!H", packet[4:6])[0] != self._ident:
+                    continue
+            if len(packet) < 8 or ord(packet[0]) != ICMP_ECHO_REPLY:
+                continue
+            for watch in watches:
+                if watch.host == address[0]:
+                    watch.replied(received)
+
+
+class ProbeWatch(object):
+    """     One host being probed by the LivenessProber until it first replies
+
+    'first_reply' is the host time of the first reply, or None.  'error'
+    is set if probing failed and the prober gave up on the host.
+    """
+
+    def __init__(self, prober, host, interval, ports):
+        self.host = host
+        self.interval = interval
+        self.first_reply = None
+        self.error = None
+        self.started = time.time()
+        self.next_probe = self.started
+        self.pending = {}
+        self._stopped = False
+        self._ports = ports
+        self._prober = prober
+        self._event = threading.Event()
+
+    def wait(self, timeout=None):
+        """     Waits up to 'timeout' seconds for a reply, returns 'first_reply'
+        """
+        self._event.wait(timeout)
+        return self.first_reply
+
+    def stop(self):
+        # Only flag it, the prober thread closes any connects in progress
+        self._stopped = True
+        self._prober._remove(self)
+
+    def failed(self, error):
+        self.error = error
+        self._stopped = True
+        self._event.set()
+
+    def replied(self, when):
+        if self.first_reply is None:
+            self.first_reply = when
+            self._event.set()
+            self._prober._remove(self)
+
+    def connect(self):
+        if self._stopped:
+            return
+        for port in self._ports:
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            except socket.error as e:
+                # e.g. out of file descriptors for now, try again next interval
+                logger.debug("Unable to probe %s: %s" % (self.host, e))
+                return
+            sock.setblocking(0)
+            # Close with a reset, so probes don't leave connections in TIME_WAIT
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            result = sock.connect_ex((self.host, port))
+            if result in (0, errno.ECONNREFUSED):
+                sock.close()
+                self.replied(time.time())
+            elif result in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                self.pending[sock] = time.time() + CONNECT_TIMEOUT
+            else:
+                sock.close()
+
+    def connected(self, sock):
+        # Writable means the connect finished, one way or another
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        self.pending.pop(sock, None)
+        sock.close()
+        if error in (0, errno.ECONNREFUSED):
+            self.replied(time.time())
+
+    def expire(self, now):
+        for sock, deadline in self.pending.items():
+            if now >= deadline:
+                del self.pending[sock]
+                sock.close()
+        if self.first_reply is not None:
+            self.close_pending()
+
+    def close_pending(self):
+        for sock in self.pending.keys():
+            sock.close()
+        self.pending = {}
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += '\0'
+    total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
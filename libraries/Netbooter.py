@@ -0,0 +1,113 @@
+"""
+Classes:
+    Netbooter - HTTP client for a netbooter power switch, over one persistent session
+    NetbooterError - A netbooter could not be read or switched
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import requests
+
+__version__ = "0.1 beta"
+
+# Seconds a netbooter request may take
+NETBOOTER_TIMEOUT = 5.0
+
+
+class NetbooterError(RuntimeError):
+    pass
+
+
+class Netbooter(object):
+    """     Reads and switches the outlets of a netbooter
+
+    The STB libraries used to run curl twice or more per outlet change
+    (read status.xml, toggle with cmd.cgi, read it again).  This keeps
+    one HTTP session per netbooter, so requests reuse the connection, and
+    talks to each unit one request at a time, as its web server is small.
+
+    cmd.cgi?rly=N toggles outlet N, so `set_outlet` reads the state
+    first and only toggles if it differs, then checks it took.
+
+    There is one Netbooter per address per process, from `get_netbooter`,
+    shared by every STB plugged into it.
+    """
+
+    _netbooters = {}
+    _netbooters_lock = threading.Lock()
+
+    @classmethod
+    def get_netbooter(cls, ip, user="admin", password="admin", port=80):
+        with cls._netbooters_lock:
+            key = (ip, port, user)
+            if key not in cls._netbooters:
+                cls._netbooters[key] = Netbooter(ip, user, password, port)
+            return cls._netbooters[key]
+
+    def __init__(self, ip, user="admin", password="admin", port=80, timeout=NETBOOTER_TIMEOUT):
+        self.ip = ip
+        self._base_url = "http://%s:%s" % (ip, port)
+        self._timeout = timeout
+        self._session = requests.Session()
+        self._session.auth = (user, password)
+        self._lock = threading.Lock()
+
+    def status(self):
+        """     Returns a dictionary of outlet number to state (0 or 1)
+        """
+        with self._lock:
+            return self._status()
+
+    def get_outlet(self, outlet):
+        with self._lock:
+            return self._outlet(self._status(), outlet)
+
+    def set_outlet(self, outlet, state, max_attempts=3):
+        """     Switches 'outlet' to 'state' (0 or 1)
+
+        Returns False if it was already in that state, otherwise True once
+        status.xml shows the change.
+        """
+        state = int(state)
+        with self._lock:
+            if self._outlet(self._status(), outlet) == state:
+                logger.info("Power IP %s outlet %s already in state %s.  No action" % (self.ip, outlet, state))
+                return False
+            for attempt in range(max_attempts + 1):
+                if attempt:
+                    logger.info("Set powerip state failed... retrying")
+                    time.sleep(0.5)
+                self._get("/cmd.cgi?rly=%s" % outlet)
+                if self._outlet(self._status(), outlet) == state:
+                    return True
+        raise NetbooterError("Could not set rly to state %s on powerip %s" % (state, self.ip))
+
+    def _status(self):
+        try:
+            root = ET.fromstring(self._get("/status.xml"))
+        except ET.ParseError as e:
+            raise NetbooterError("Unable to read status of powerip on %s: %s" % (self.ip, e))
+        outlets = {}
+        for element in root:
+            if element.tag.startswith("rly") and element.tag[3:].isdigit():
+                outlets[int(element.tag[3:])] = int(element.text)
+        return outlets
+
+    def _outlet(self, outlets, outlet):
+        try:
+            return outlets[int(outlet)]
+        except KeyError:
+            raise NetbooterError("Powerip %s has no outlet %s" % (self.ip, outlet))
+
+    def _get(self, path):
+        try:
+            response = self._session.get(self._base_url + path, timeout=self._timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise NetbooterError("Powerip %s request %s failed: %s" % (self.ip, path, e))
+        return response.content
@@ -0,0 +1,159 @@
+"""
+Classes:
+    OnBoxSampler - A shell sampler run on the STB itself, writing to a ring file in tmpfs
+"""
+# Standard libraries
+import re
+
+__version__ = "0.1 beta"
+
+# Where the sampler lives on the STB, /tmp being tmpfs so nothing is written to flash
+ONBOX_DIR = "/tmp/stbstats"
+
+# Records kept in each of the two ring files, so at most twice this many
+# are held on the box between pulls
+ONBOX_RING_RECORDS = 3600
+
+# Characters of the sampler script written per command
+SCRIPT_CHUNK = 300
+
+# Printed by a pull when the sampler is no longer running (e.g. the STB rebooted)
+STOPPED = "@@ONBOX@@ stopped"
+
+# seq,timestamp,cpu total jiffies,cpu idle jiffies,free memory kB,wifi quality,level,noise
+RECORD = re.compile(r'^(\d+),(\d{14}),(\d*),(\d*),(\d*),(-?\d*),(-?\d*),(-?\d*)\s*$')
+
+
+class OnBoxSampler(object):
+    """     Samples STB statistics on the box, for the host to pull in bulk
+
+    For long soaks polling every box over telnet for every sample keeps a
+    session busy for the whole run, and a sample is lost whenever the host
+    is too busy to take it.  Instead `install_commands` start a small shell
+    loop on the STB that appends a record every 'interval' seconds to a
+    ring file in ONBOX_DIR.  Reading /proc with the shell's own `read` and
+    `case`, the only process it starts per sample is `date` (and `sleep`).
+
+    When the ring file reaches 'ring' records it replaces the previous one,
+    so the box holds between 'ring' and twice 'ring' records.  Each record
+    is numbered, and `pull_command` prints only the records after the last
+    one pulled, so a pull costs one round trip whatever the interval.
+
+    `parse` turns pulled records into samples in the form returned by
+    StatSampler.parse, with CPU idle worked out from /proc/stat between one
+    record and the next.  qoemon is not sampled on the box.
+    """
+
+    def __init__(self, mem=True, cpu=True, wifi=False, interval=10, wifi_interface="wlan0",
+                 directory=ONBOX_DIR, ring=ONBOX_RING_RECORDS):
+        self._mem = mem
+        self._cpu = cpu
+        self._wifi = wifi
+        self._interval = max(int(round(float(interval))), 1)
+        self._wifi_interface = wifi_interface
+        self._directory = directory
+        self._ring = int(ring)
+        self._last_seq = 0
+        self._last_cpu = None
+
+    def install_commands(self):
+        """     Returns the commands that write the sampler to the STB and start it
+
+        The script is written a few lines per command, to keep each within
+        the length the STB's shell will take on one line.
+        """
+        self._last_seq = 0
+        self._last_cpu = None
+        lines = [
+            'trap "" HUP',
+            'cd %s' % self._directory,
+            'n=0',
+            'c=0',
+            'while :; do',
+            'n=$((n+1))',
+            't=$(date +%Y%m%d%H%M%S)',
+            'ct=',
+            'ci=',
+            'm=',
+            'w=,,',
+        ]
+        if self._cpu:
+            lines += ['read x a b s i o q r rest < /proc/stat',
+                      'ct=$((a+b+s+i+o+q+r))',
+                      'ci=$i']
+        if self._mem:
+            lines += ['m=0',
+                      'while read k v rest; do case $k in MemFree:|Buffers:|Cached:) m=$((m+v));; esac; done < /proc/meminfo']
+        if self._wifi:
+            lines += ['while read k st ql lv ns rest; do [ "$k" = "%s:" ] && w="${ql%%.},${lv%%.},${ns%%.}"; done < /proc/net/wireless'
+                      % self._wifi_interface]
+        lines += [
+            'echo "$n,$t,$ct,$ci,$m,$w" >> ring.0',
+            'c=$((c+1))',
+            'if [ $c -ge %d ]; then mv ring.0 ring.1; c=0; fi' % self._ring,
+            'sleep %d' % self._interval,
+            'done',
+        ]
+
+        script = "%s/sampler.sh" % self._directory
+        commands = [self.stop_command(), "mkdir -p %s; : > %s/ring.1" % (self._directory, self._directory)]
+        chunk = []
+        for line in lines:
+            if chunk and len(" ".join(chunk)) + len(line) > SCRIPT_CHUNK:
+                commands.append("printf '%%s\\n' %s >> %s" % (" ".join(chunk), script))
+                chunk = []
+            chunk.append("'%s'" % line)
+        commands.append("printf '%%s\\n' %s >> %s" % (" ".join(chunk), script))
+        commands.append("sh %s < /dev/null > /dev/null 2>&1 & echo $! > %s/pid" % (script, self._directory))
+        return commands
+
+    def pull_command(self):
+        """     Returns the command that prints the records not yet pulled, and whether the sampler is running
+        """
+        half = len(STOPPED) // 2
+        return ("cat {d}/ring.1 {d}/ring.0 2>/dev/null | awk -F, '$1>{seq}'; "
+                "kill -0 $(cat {d}/pid 2>/dev/null) 2>/dev/null || echo '{a}''{b}'").format(
+                    d=self._directory, seq=self._last_seq, a=STOPPED[:half], b=STOPPED[half:])
+
+    def stop_command(self):
+        """     Returns the command that stops the sampler and removes its files
+        """
+        return "kill $(cat {d}/pid 2>/dev/null) 2>/dev/null; rm -rf {d}".format(d=self._directory)
+
+    def parse(self, output):
+        """     Returns (samples, running) from the output of `pull_command`
+
+        'samples' is a list of dictionaries in the form returned by
+        StatSampler.parse, oldest first.  'running' is False if the
+        sampler has stopped, and needs installing again.
+        """
+        samples = []
+        running = True
+        for line in output.splitlines():
+            line = line.strip()
+            if line == STOPPED:
+                running = False
+                continue
+            match = RECORD.match(line)
+            if match is None:
+                continue
+            seq = int(match.group(1))
+            if seq <= self._last_seq:
+                continue
+            self._last_seq = seq
+            samples.append(self._sample(match.groups()))
+        return samples, running
+
+    def _sample(self, fields):
+        seq, timestamp, total, idle, mem, quality, level, noise = fields
+        sample = {"timestamp": timestamp}
+        if self._cpu and total and idle:
+            cpu = (int(total), int(idle))
+            if self._last_cpu is not None and cpu[0] > self._last_cpu[0]:
+                sample["cpu"] = "%.1f" % (100.0 * (cpu[1] - self._last_cpu[1]) / (cpu[0] - self._last_cpu[0]))
+            self._last_cpu = cpu
+        if self._mem and mem:
+            sample["mem"] = mem
+        if self._wifi and quality:
+            sample["wifi"] = (quality, level, noise)
+        return sample
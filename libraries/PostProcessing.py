@@ -3,7 +3,9 @@ from robot.version import get_version
 from robot import utils
 from robot.libraries.BuiltIn import BuiltIn
 import datetime
+import time
 from CSVWriter import CSVWriter
+from DebugLogIndex import DebugLogIndex
 
 
 __version__ = "0.1 beta"
@@ -192,6 +194,58 @@ def get_channel_change_times(logfile, csvname, family):
             audio = _convert_to_milliseconds(diff)
        
 
+def get_debug_log_section(logfile, marker):
+    """ Returns the debug log from a `Debug Marker` up to the next marker
+
+    Uses the index kept next to the debug log (logfile + ".idx") to seek
+    straight to the marker, so only that section of the log is read.  Plain
+    and gzipped logs are both supported.  The most recent marker containing
+    'marker' is used.
+
+    Examples:-
+    | ${section}=	| Get debug log section	| ${OUTPUTDIR}/Soak_STB1_debug.log.gz	| Channel change 500	|
+    """
+    try:
+        return DebugLogIndex(logfile).read_section(marker)
+    except (IOError, ValueError) as e:
+        raise PostProcessingError("Unable to read debug log section: %s" % e)
+
+
+def get_debug_log_between(logfile, start, end=None):
+    """ Returns the debug log received between two times
+
+    'start' and 'end' are either seconds since the epoch or a local time in
+    the format of the debug log line timestamps, YYYY-MM-DD HH:MM:SS.mmm.
+    The section returned is aligned to the index entries, so can start and
+    end a few seconds either side of the times given.
+
+    Examples:-
+    | ${section}=	| Get debug log between	| ${OUTPUTDIR}/Soak_STB1_debug.log	| 2016-03-01 10:22:00	| 2016-03-01 10:23:00	|
+    """
+    try:
+        index = DebugLogIndex(logfile)
+    except IOError as e:
+        raise PostProcessingError("Unable to read debug log index: %s" % e)
+    start = _to_epoch(start)
+    if end is not None:
+        end = _to_epoch(end)
+    return index.read_between(start, end)
+
+
+def _to_epoch(value):
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            ts = datetime.datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+        return time.mktime(ts.timetuple()) + ts.microsecond / 1000000.0
+    raise PostProcessingError("Unrecognised time '%s'" % value)
+
+
 def _convert_to_milliseconds(delta):
     msd = (delta / 1000)
     ms = msd.microseconds
@@ -0,0 +1,196 @@
+"""
+Functions:
+    parse_df - `df -k` output to (total, available) in kB
+    parse_size - A human readable size (20GB, 500MB...) to kB
+
+Classes:
+    PvrFiller - Plans and builds the shell commands for filling a PVR disk with filler files
+"""
+# Standard libraries
+import math
+import re
+
+__version__ = "0.1 beta"
+
+# Filler files are named this plus a 5 digit number
+FILLER = "tempfiller"
+
+# Size of a whole filler file, in MB
+FILLER_MB = 1024
+
+# Filler files written at once
+FILL_WRITERS = 4
+
+# Printed by a poll while the fill is still running
+RUNNING = "@@FILL@@ running"
+
+# The numbers of a `df -k` data line, ending in its mount point: "1024 512 512 50% /mnt/hd"
+DF_LINE = re.compile(r'(?:^|\s)(\d+)\s+(\d+)\s+(\d+)\s+\d+%\s+/\S*\s*$')
+
+SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$', re.IGNORECASE)
+SIZE_UNITS = {"": 1, "K": 1, "M": 1024, "G": 1024 ** 2, "T": 1024 ** 3}
+
+
+def parse_df(output):
+    """     Returns (total, available) in kB from `df -k` of a single filesystem
+
+    A long device name makes df wrap the line, so the numbers are taken
+    from the line ending in the mount point rather than by position from
+    the device.  Anything else in the output, such as the shell reporting
+    a background job done, is ignored.
+    """
+    for line in output.splitlines():
+        match = DF_LINE.search(line)
+        if match is not None:
+            return int(match.group(1)), int(match.group(3))
+    raise ValueError("Unable to read df output: %s" % output.strip())
+
+
+def parse_size(size):
+    """     Returns 'size' in kB, given as e.g. 20GB, 500 MB, 1.5T or a plain number of kB
+    """
+    match = SIZE.match(str(size))
+    if match is None:
+        raise ValueError("Unable to read size '%s'" % size)
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+class PvrFiller(object):
+    """     Fills a PVR disk to a target with filler files, several at once
+
+    Filler files used to be written one 1GB `dd` at a time, each waited for
+    over telnet, so filling a large disk took hours.  `plan` works out from
+    `df` which files to add (whole FILLER_MB files then one part file to
+    land on the target) or which to remove, and `fill_command` starts
+    writing them in the background on the STB, 'writers' at a time.
+
+    Each file is allocated with `fallocate` where the filesystem supports
+    it, which takes the blocks without writing them, otherwise written by
+    `dd`.  Sparse files are no use, as they take no space.  A fill to 100%
+    ends with a `dd` that runs until the disk is full.
+
+    While the fill runs `poll_command` reports the free space, from which
+    the caller can show progress and throughput, and whether it is still
+    running.
+    """
+
+    def __init__(self, directory="/PVR", writers=FILL_WRITERS, filesize=FILLER_MB):
+        self._directory = directory
+        self._writers = max(int(writers), 1)
+        self._filesize = int(filesize)
+
+    def df_command(self):
+        return "df -k %s" % self._directory
+
+    def list_command(self):
+        return "ls -l %s/%s* 2>/dev/null" % (self._directory, FILLER)
+
+    def parse_list(self, output):
+        """     Returns a list of (number, size in kB) of the filler files, in number order
+        """
+        fillers = []
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) < 5:
+                continue
+            name = fields[-1].split("/")[-1]
+            if not name.startswith(FILLER) or not name[len(FILLER):].isdigit():
+                continue
+            try:
+                fillers.append((int(name[len(FILLER):]), int(fields[4]) // 1024))
+            except ValueError:
+                continue
+        return sorted(fillers)
+
+    def plan(self, total, avail, fillers, percent=None, free=None):
+        """     Works out how to reach the target, all sizes in kB
+
+        The target is either 'percent' of the disk used or 'free' kB left
+        free.  Returns ("add", [(number, MB or None to fill the disk)...])
+        or ("remove", [number...]).  Adding stops short of the target
+        rather than going over it, removing frees at least enough.
+        """
+        if free is not None:
+            target_avail = max(float(free), 0)
+        else:
+            target_avail = max(total - total * float(percent) / 100, 0)
+
+        numbers = [number for number, size in fillers]
+        if avail > target_avail:
+            next_number = max(numbers or [0]) + 1
+            needed_mb = int(math.floor((avail - target_avail) / 1024))
+            files = []
+            while needed_mb >= self._filesize:
+                files.append((next_number + len(files), self._filesize))
+                needed_mb -= self._filesize
+            if target_avail <= 0:
+                files.append((next_number + len(files), None))
+            elif needed_mb > 0:
+                files.append((next_number + len(files), needed_mb))
+            return "add", files
+
+        remove = []
+        freed = 0
+        for number, size in reversed(fillers):
+            if avail + freed >= target_avail:
+                break
+            remove.append(number)
+            freed += size
+        if avail + freed < target_avail:
+            raise ValueError("Not enough filler files exist to trim down to that target.")
+        return "remove", remove
+
+    def fill_command(self, files):
+        """     Returns the command that starts writing 'files' (from `plan`) in the background, and prints its pid
+
+        The whole files are shared out between the writers, each a loop
+        over its numbers, so the command is the same length however many
+        files there are.  The last file, if it is a part file or fills the
+        disk, is written once they are all done.
+        """
+        whole = [number for number, size in files if size == self._filesize]
+        last = [(number, size) for number, size in files if size != self._filesize]
+
+        steps = []
+        if whole:
+            first, end = whole[0], whole[-1]
+            steps.append("for k in %s; do ( n=$((%d+k)); while [ $n -le %d ]; do f=%s$(printf %%05d $n); %s; "
+                         "n=$((n+%d)); done ) & done; wait" % (
+                             " ".join(str(k) for k in range(min(self._writers, len(whole)))), first, end,
+                             FILLER, self._allocate("$f", self._filesize), self._writers))
+        for number, size in last:
+            steps.append(self._allocate(self._name(number), size))
+        return "cd %s; ( %s ) > /dev/null 2>&1 & echo $!" % (self._directory, "; ".join(steps or [":"]))
+
+    def poll_command(self, pid):
+        half = len(RUNNING) // 2
+        return "%s; kill -0 %s 2>/dev/null && echo '%s''%s'" % (self.df_command(), pid,
+                                                                 RUNNING[:half], RUNNING[half:])
+
+    def parse_poll(self, output):
+        """     Returns (available kB, still running) from the output of `poll_command`
+        """
+        running = False
+        lines = []
+        for line in output.splitlines():
+            if line.strip() == RUNNING:
+                running = True
+            else:
+                lines.append(line)
+        return parse_df("\n".join(lines))[1], running
+
+    def stop_command(self, pid):
+        # The background job leads its own process group, which holds every writer
+        return "kill -TERM -%s %s 2>/dev/null" % (pid, pid)
+
+    def remove_command(self, numbers):
+        return "cd %s; rm -f %s" % (self._directory, " ".join(self._name(number) for number in numbers))
+
+    def _name(self, number):
+        return "%s%05d" % (FILLER, number)
+
+    def _allocate(self, name, size):
+        if size is None:
+            return "dd if=/dev/zero of=%s bs=1M 2>/dev/null" % name
+        return "fallocate -l %dM %s 2>/dev/null || dd if=/dev/zero of=%s bs=1M count=%d 2>/dev/null" % (
+            size, name, name, size)
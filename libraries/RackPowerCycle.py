@@ -0,0 +1,147 @@
+"""
+Classes:
+    RackPowerCycle - Power cycles a list of STBs together and waits for them all to come back
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import threading
+import time
+
+# Amino Libraries
+import LivenessProber
+import Netbooter
+
+__version__ = "0.1 beta"
+
+
+class RackPowerCycle(object):
+    """     Power cycles many STBs at once, rather than one after the other
+
+    'boxes' is a list of (name, STB library instance).  Every box is
+    switched off, with the outlets on different netbooters switched in
+    parallel, then after 'downtime' seconds they are switched on again one
+    at a time, 'stagger' seconds apart, so the rack doesn't draw every
+    box's inrush current at the same moment.
+
+    Each box is then waited for from the moment its outlet came on: for
+    'listener' on its debug capture if one is given and the box has a
+    capture open, otherwise for a reply to the LivenessProber.  So a rack
+    takes one boot time (plus the stagger) to come back, not one per box.
+
+    Boxes are expected to provide _powerip_port ("ip:outlet"),
+    _powerip_type, _debug, get_interface_attribute() and the
+    _prepare_for_power_cycle / _restore_after_power_cycle pair that
+    `Power Cycle STB` uses, as STB and ESTB do.
+    """
+
+    def __init__(self, boxes, downtime=1.0, stagger=0.5, listener=None):
+        self._boxes = list(boxes)
+        self._downtime = float(downtime)
+        self._stagger = float(stagger)
+        self._listener = listener
+        self.errors = {}
+        self.poweron = {}
+
+    def run(self, timeout):
+        """     Returns a dictionary of box name to seconds from power on to first response, or None
+
+        The reason a box didn't come back is in 'errors'.
+        """
+        outlets = []
+        for name, box in self._boxes:
+            if box._powerip_port is None or box._powerip_type != "netbooter":
+                self.errors[name] = "no netbooter powerip defined"
+                continue
+            powerip, outlet = box._powerip_port.split(":")[:2]
+            outlets.append((name, box, Netbooter.Netbooter.get_netbooter(powerip), outlet))
+
+        states = {}
+        for name, box, netbooter, outlet in outlets:
+            states[name] = box._prepare_for_power_cycle()
+
+        logger.info("Power cycling %d STBs now...." % len(outlets))
+        self._switch_off(outlets)
+        time.sleep(self._downtime)
+
+        waits = {}
+        for name, box, netbooter, outlet in outlets:
+            if name not in self.errors:
+                waits[name] = self._start_wait(box)
+
+        first = time.time()
+        for index, (name, box, netbooter, outlet) in enumerate(outlets):
+            if name in self.errors:
+                continue
+            # Switch on in turn, 'stagger' apart, however long each request takes
+            time.sleep(max(first + index * self._stagger - time.time(), 0))
+            try:
+                netbooter.set_outlet(outlet, 1)
+                self.poweron[name] = time.time()
+            except Netbooter.NetbooterError as e:
+                self.errors[name] = str(e)
+
+        recovery = {}
+        for name, box, netbooter, outlet in outlets:
+            recovery[name] = None
+            wait = waits.get(name)
+            if name in self.poweron:
+                replied = self._wait(wait, self.poweron[name] + timeout - time.time())
+                if replied is None:
+                    self.errors[name] = "no response after %s seconds" % timeout
+                else:
+                    recovery[name] = max(replied - self.poweron[name], 0)
+                    logger.info("%s responded %.3fs after power on" % (name, recovery[name]))
+            self._stop_wait(box, wait)
+
+        for name, box, netbooter, outlet in outlets:
+            try:
+                box._restore_after_power_cycle(states[name])
+            except Exception as e:
+                logger.warn("Unable to restore %s after power cycle: %s" % (name, e))
+
+        for name, box in self._boxes:
+            recovery.setdefault(name, None)
+        return recovery
+
+    def _switch_off(self, outlets):
+        # One thread per netbooter, each switching its outlets in turn
+        units = {}
+        for name, box, netbooter, outlet in outlets:
+            units.setdefault(netbooter, []).append((name, outlet))
+
+        def switch(netbooter, unit_outlets):
+            for name, outlet in unit_outlets:
+                try:
+                    netbooter.set_outlet(outlet, 0)
+                except Netbooter.NetbooterError as e:
+                    self.errors[name] = str(e)
+
+        threads = [threading.Thread(target=switch, args=unit) for unit in units.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _start_wait(self, box):
+        if self._listener is not None and box._debug is not None:
+            return box._debug.subscribe(self._listener)
+        return LivenessProber.LivenessProber.get_prober().watch(box.get_interface_attribute())
+
+    def _wait(self, wait, timeout):
+        timeout = max(timeout, 0)
+        if isinstance(wait, LivenessProber.ProbeWatch):
+            return wait.wait(timeout)
+        hit = wait.wait(timeout)
+        if hit is None:
+            return None
+        return hit.time
+
+    def _stop_wait(self, box, wait):
+        if wait is None:
+            return
+        if isinstance(wait, LivenessProber.ProbeWatch):
+            wait.stop()
+        else:
+            box._debug.unsubscribe(wait)
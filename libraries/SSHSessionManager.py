@@ -0,0 +1,162 @@
+"""
+Classes:
+    SSHSessionManager - One authenticated SSH transport per STB, running each command on a channel of its own
+    SSHSessionError - A command could not be run over SSH
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import socket
+import threading
+import time
+
+import paramiko
+
+__version__ = "0.1 beta"
+
+# Logins tried before giving up, and seconds between them, as ESTB._ssh_login
+LOGIN_ATTEMPTS = 5
+LOGIN_DELAY = 2.0
+
+# Seconds between keepalives, so an idle transport notices the STB has gone
+KEEPALIVE_INTERVAL = 15
+
+# Bytes read from a channel at a time
+READ_SIZE = 32768
+
+
+class SSHSessionError(RuntimeError):
+    pass
+
+
+class SSHSessionManager(object):
+    """     Keeps one SSH transport open to an STB and runs commands on channels of it
+
+    ESTB used to log in (with retries) for every command, run it in an
+    interactive shell, scrape the output up to the next prompt, then read
+    again for half a second in case more followed, and send `echo $?` as
+    another command for the return code.
+
+    Instead the manager logs in once and keeps the transport, and each
+    `run` opens a new channel on it and executes the command there, so
+    there is no prompt to wait for: the output is everything the channel
+    sends and the return code is its exit status.  Channels are
+    independent, so any number of threads can run commands at once.
+
+    If the transport has gone, e.g. the STB rebooted, the next `run` logs
+    in again, retrying as the old login did.  A command that fails after
+    it has started is not run again, as it may have taken effect.
+
+    There is one manager per STB address per process, from `get_manager`.
+    """
+
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    @classmethod
+    def get_manager(cls, ip, user, keyfile, port=10022, timeout=10.0):
+        with cls._managers_lock:
+            key = (ip, port, user)
+            if key not in cls._managers:
+                cls._managers[key] = SSHSessionManager(ip, user, keyfile, port, timeout)
+            manager = cls._managers[key]
+            manager.keyfile = keyfile
+            manager.timeout = timeout
+            return manager
+
+    def __init__(self, ip, user, keyfile, port=10022, timeout=10.0):
+        self.ip = ip
+        self.user = user
+        self.keyfile = keyfile
+        self.port = port
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    def run(self, command, timeout=None):
+        """     Runs 'command' on its own channel, returns (output, exit status)
+
+        stderr is merged into the output, as it was in the interactive
+        shell.  The exit status is -1 if the STB closed the channel without
+        sending one.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        channel = self._open_channel()
+        try:
+            channel.settimeout(timeout)
+            channel.set_combine_stderr(True)
+            channel.exec_command(command)
+            output = []
+            while True:
+                try:
+                    data = channel.recv(READ_SIZE)
+                except socket.timeout:
+                    raise SSHSessionError("No output from '%s' on %s for %s seconds" % (command, self.ip, timeout))
+                if not data:
+                    break
+                output.append(data)
+            # A command that takes the STB down (e.g. reboot) never sends one
+            if channel.status_event.wait(timeout) and channel.exit_status_ready():
+                status = channel.exit_status
+            else:
+                status = -1
+        except (paramiko.SSHException, socket.error, EOFError) as e:
+            raise SSHSessionError("'%s' failed on %s: %s" % (command, self.ip, e))
+        finally:
+            channel.close()
+        return "".join(output).decode("utf-8", "replace"), status
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def is_connected(self):
+        client = self._client
+        return client is not None and client.get_transport() is not None and client.get_transport().is_active()
+
+    def _open_channel(self):
+        for attempt in range(2):
+            with self._lock:
+                if not self.is_connected():
+                    self._connect()
+                transport = self._client.get_transport()
+            try:
+                return transport.open_session(timeout=self.timeout)
+            except (paramiko.SSHException, socket.error, EOFError) as e:
+                # The STB went away since the last command, log in again once
+                logger.debug("SSH channel to %s failed (%s), logging in again" % (self.ip, e))
+                with self._lock:
+                    self._close()
+        raise SSHSessionError("Unable to open an SSH channel to %s" % self.ip)
+
+    def _connect(self):
+        for attempt in range(1, LOGIN_ATTEMPTS + 1):
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                client.connect(self.ip, port=self.port, username=self.user, key_filename=self.keyfile,
+                               timeout=self.timeout, allow_agent=False, look_for_keys=False)
+            except (paramiko.SSHException, socket.error, EOFError) as e:
+                client.close()
+                logger.debug("SSH login to %s failed: %s.  Attempt %d" % (self.ip, e, attempt))
+                if attempt == LOGIN_ATTEMPTS:
+                    raise SSHSessionError("Unable to log in to %s over SSH: %s" % (self.ip, e))
+                time.sleep(LOGIN_DELAY)
+                continue
+            transport = client.get_transport()
+            transport.set_keepalive(KEEPALIVE_INTERVAL)
+            # Each command is a few small packets each way, don't let Nagle hold them back
+            transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._client = client
+            logger.debug("SSH login to %s succeeded.  Attempt %d" % (self.ip, attempt))
+            return
+
+    def _close(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
@@ -12,17 +12,51 @@ from collections import namedtuple
 import threading
 import os
 import math
-import xml.etree.ElementTree as ET
+import select
 
 # Amino Libraries
 import Debug
 import Fakekey
+import StatSampler
+import StatCollector
+import TelnetPool
+import CommandBatch
+import LibconfigCache
+import LivenessProber
+import Netbooter
+import RackPowerCycle
+import BootProfiler
+import StatParsers
+import OnBoxSampler
+import PvrFiller
+import IgmpTable
 from InfraRedBlaster import InfraRedBlaster
 
 __version__ = "0.1 beta"
 
 DEBUG = True
 
+# Seconds a single ping waits for a reply
+PING_TIMEOUT = 3
+
+# Most bytes of pipelined commands sent ahead of the shell reading them
+PIPELINE_WINDOW = 2048
+
+# Seconds between progress checks of a PVR fill
+PVR_FILL_POLL = 5
+
+# Seconds a PVR fill may go without the free space changing before it is stopped
+PVR_FILL_STALL = 120
+
+# `Get qoemon Value` values, as (qoemon -s counter, column of its output)
+QOEMON_VALUES = {"VLastPTS": ("V", 2), "ALastPTS": ("A", 2), "VPTS": ("P", 2), "APTS": ("P", 4)}
+
+# Samples asked of a streaming qoemon, it is interrupted long before this many
+QOEMON_STREAM_COUNT = 1000000
+
+# Seconds the qoemon stream reader waits for output before checking it should stop
+QOEMON_READ_INTERVAL = 0.5
+
 class STB(object):
 
     """ Amino Aminet STB Library by Frazer Smith.
@@ -106,13 +140,18 @@ class STB(object):
         self._telnet_user = telnet_user
         self._telnet_password = telnet_password
         self._telnet_conn = None
+        self._telnet_ip = None
+        self._telnet_pool = None
         self._telnet_timeout = "3 seconds"
         self._newline = "\n"
         self._keep_telnet_open = False
         self._reboot = True
+        self._libconfig = LibconfigCache.LibconfigCache()
+        self._boot_profiler = BootProfiler.BootProfiler()
 
         # Stats collection properties
         self._stats_conn = None
+        self._stats_ip = None
         self._keep_stats_open = False
         self._stats_memory = False
         self._stats_cpu = False
@@ -120,8 +159,27 @@ class STB(object):
         self._stats_qoemon = False
         self._stats_thread = None
         self._stats_interval = "10 seconds"
-        self._stats_abort = False
+        self._stats_abort = threading.Event()
         self._stats_collecting = False
+        self._stats_shared = False
+        self._stats_onbox = False
+        self._stats_pull = "60 seconds"
+        self._stats_onbox_sampler = None
+        self._stats_onbox_path = None
+        self._stats_lock = threading.Lock()
+
+        # qoemon stream properties
+        self._qoemon_conn = None
+        self._qoemon_ip = None
+        self._qoemon_counters = None
+        self._qoemon_stream = None
+        self._qoemon_thread = None
+        self._qoemon_abort = threading.Event()
+
+        # IGMP watch properties
+        self._igmp_watch = None
+        self._igmp_thread = None
+        self._igmp_abort = threading.Event()
 
         # Debug properties
         self._debug = None
@@ -206,7 +264,7 @@ class STB(object):
         low_disk_size = int(target_avail_disk)
         return low_disk_size
 
-    def fill_pvr(self, target_percent):
+    def fill_pvr(self, target_percent=None, free=None, writers=PvrFiller.FILL_WRITERS):
         """
 
         Author: S. Housley
@@ -223,86 +281,116 @@ class STB(object):
 
         The % supplied can be a floating precision number
 
+        Instead of a percentage 'free' can give the space to leave free, e.g. 20GB, 500MB or 1048576 (kB).
+
+        The space needed is read from df.  Filler files are written 'writers' at a time in the background
+        on the STB, allocated with fallocate where the filesystem supports it (otherwise written with dd),
+        and the last one is sized to land on the target.  Progress and throughput are logged as it goes.
+
         Will return the number of filler files (tempfillerxxxxx) that exist at the end.
 
         Examples:-
         | Fill PVR      | 30%       |                                |
         | Fill PVR      | 75%       |                                |
-        | Fill PVR      | 85%       | low_disk_space_warn=True       |
+        | Fill PVR      | 85%       | writers=8                      |
+        | Fill PVR      | free=20GB |                                |
         | ${filecount}= | Fill PVR  | 99.9%                          |
         """
 
-        # Convert percentage to float
-        target_percent = target_percent.rstrip("%")
-        pcnt_target = float(target_percent)
+        if target_percent is None and free is None:
+            raise STBError("Fill PVR needs a target percentage or free space")
+        if free is not None:
+            try:
+                free = PvrFiller.parse_size(free)
+            except ValueError as e:
+                raise STBError(str(e))
 
+        filler = PvrFiller.PvrFiller(writers=writers)
         ip = self.get_interface_attribute()
 
         self._open_connection(ip)
-        ## Check we have a PVR device which is ready?
-        if int(self._send_command('diskman info | grep "Ready" > /dev/null ; echo $?')) > 0:
-            raise STBError("Fill PVR Failure:  No 'Ready' disk found")
-
-        self._set_telnet_timeout("2 minutes")
-
-        # Run this in /PVR
-        self._send_command("cd /PVR")
-        FS = '"= "'
-
-        # Get initial readings
-
-        total_disk = float(self._send_command("streamerctl diskinfo | awk '/total_size/ { FS = %s; print $2;}'" % FS))
-        avail_disk = float(self._send_command("streamerctl diskinfo | awk '/available_size/ { FS = %s; print $2;}'" % FS))
+        old = self._telnet_timeout
         try:
-            file_count = int((self._send_command("cd /PVR;ls tempfiller* | tail -1").lstrip("tempfiller")))
-        except ValueError:
-            file_count = 0
+            ## Check we have a PVR device which is ready?
+            if int(self._send_command('diskman info | grep "Ready" > /dev/null ; echo $?')) > 0:
+                raise STBError("Fill PVR Failure:  No 'Ready' disk found")
 
-        # Work out how many filler files are required
-        target_avail_disk = total_disk - (total_disk * (float(pcnt_target)/100))
-        filler_files_needed = int(math.ceil((avail_disk - target_avail_disk)/(1024**2)))
-
-        # Sanity check that this many filler will not fill disk, unless we wanted that
-        if ((filler_files_needed * (1024**2) + (total_disk - avail_disk)) > total_disk) and pcnt_target < 100:
-            # We don't want 100 but this will be over 100
-            filler_files_needed = filler_files_needed - 1
+            self._set_telnet_timeout("2 minutes")
 
-        # If we need to remove files, are there enough
-        if filler_files_needed < 0 and abs(filler_files_needed) > file_count:
-            raise STBError("Not enough filler files exist to trim down to that percentage.")
+            # Get initial readings
+            try:
+                total_disk, avail_disk = PvrFiller.parse_df(self._send_command(filler.df_command()))
+            except ValueError as e:
+                raise STBError("Fill PVR Failure:  %s" % e)
+            fillers = filler.parse_list(self._send_command(filler.list_command()))
 
-        if filler_files_needed > 0:
-            logger.info("Need to add '" + str(filler_files_needed) + "' 1GB filler files")
-        else:
-            logger.info("Need to remove '" + str(abs(filler_files_needed)) + "' 1GB filler files")
-
-        file_target = file_count + filler_files_needed
-        while file_target != file_count:
-            if filler_files_needed > 0:
-                # Adding filler files
-                file_count = file_count + 1
-                logger.info("Adding 1GB file.. tempfiller" + str(file_count).zfill(5))
-                self._send_command("cd /PVR; dd if=/dev/zero bs=1M count=1024 of=tempfiller"+str(file_count).zfill(5))
-            else:
-                # Removing filler files
-                logger.info("Removing file tempfiller" + str(file_count).zfill(5))
-                self._send_command("cd /PVR; rm tempfiller"+str(file_count).zfill(5))
-                file_count = file_count -1
+            try:
+                action, files = filler.plan(total_disk, avail_disk, fillers,
+                                            percent=None if target_percent is None else str(target_percent).rstrip("%"),
+                                            free=free)
+            except ValueError as e:
+                raise STBError(str(e))
+
+            if action == "add" and files:
+                logger.info("Need to add '%d' filler files" % len(files))
+                self._run_pvr_fill(filler, files, avail_disk)
+            elif action == "remove" and files:
+                logger.info("Need to remove '%d' filler files" % len(files))
+                self._send_command(filler.remove_command(files))
+
+            file_count = len(filler.parse_list(self._send_command(filler.list_command())))
+        finally:
+            self._set_telnet_timeout(old)
+            self._close_telnet()
 
         return file_count
 
-    def add_debug_listener(self, listener):
+    def _run_pvr_fill(self, filler, files, start_avail):
+        pid = self._send_command(filler.fill_command(files)).strip().splitlines()[-1]
+        start = time.time()
+        stalled = start
+        last_avail = start_avail
+        running = True
+        try:
+            while running:
+                time.sleep(PVR_FILL_POLL)
+                try:
+                    avail, running = filler.parse_poll(self._send_command(filler.poll_command(pid)))
+                except ValueError as e:
+                    raise STBError("PVR fill could not read free space: %s" % e)
+                now = time.time()
+                written = max(start_avail - avail, 0)
+                logger.info("PVR fill: %.1f GB written, %.1f GB free, %.1f MB/s" % (
+                    written / 1024.0 ** 2, avail / 1024.0 ** 2, written / 1024.0 / max(now - start, 0.001)))
+                if avail != last_avail:
+                    last_avail = avail
+                    stalled = now
+                elif running and now - stalled > PVR_FILL_STALL:
+                    raise STBError("PVR fill made no progress for %s seconds, stopped" % PVR_FILL_STALL)
+        finally:
+            if running:
+                # Don't leave the writers filling the disk behind a failed keyword
+                try:
+                    self._send_command(filler.stop_command(pid))
+                except Exception as e:
+                    logger.warn("Unable to stop PVR fill %s: %s" % (pid, e))
+        logger.info("PVR fill finished in %.1f seconds" % (time.time() - start))
+
+    def add_debug_listener(self, listener, regex=False):
         """  Add a text string to 'listen' for on the debug interface
 
         If you wish to act upon a specific listener asyncronously (i.e. not pausing execution)
         add it to this list and then interogate with `Check Debug Listeners` keyword later.
 
+        Setting 'regex' treats the listener as a regular expression rather than a plain string.
+
         Examples:
-        | Add debug listener    | AC_BOOT   |
+        | Add debug listener    | AC_BOOT   |                   |
+        | Add debug listener    | WARM_BOOT\\s+\\d+ | regex=${True}     |
 
         """
-        if listener not in self._debug._listeners:
-            self._debug.add_listener(listener)
+        if not self._debug.has_listener(listener):
+            self._debug.add_listener(listener, regex=regex)
 
     def remove_debug_listener(self, listener):
         """  Remove a text string to 'listen' for on the debug interface
@@ -315,8 +403,8 @@ class STB(object):
         | Remove debug listener | AC_BOOT   |
 
         """
-        if listener in self._debug._listeners:
-            self._debug._listeners.remove(listener)
+        if self._debug.has_listener(listener):
+            self._debug.remove_listener(listener)
         else:
             raise STBError("ERROR: Trying to remove a listener that is not in the listeners list")
 
@@ -344,9 +432,11 @@ class STB(object):
     def wait_for_debug_listener(self, listener, timeout, donotError=False):
         """  Pause execution until a specific text string is read over debug
 
-        Any previous debug listener list will be replaced while this string is waited for.
+        Other debug listeners carry on being checked while this string is waited for, and any
+        number of waits (e.g. from several libraries) can be in progress at once.
 
-        An integer representing how many seconds it took to see the string will be returned.
+        The number of seconds it took to see the string is returned, to the millisecond.  This is
+        measured to when the line was read from the serial port.
 
         If the timeout expires an error will be thrown halting test execution unless the donotError
         flag is set to True. The donotError flag is useful if we want to test a scenario where we do not expect
@@ -360,33 +450,22 @@ class STB(object):
 
         """
 
-        templisteners = self._debug._listeners
-        templistenersheard = self._debug._listeners_heard
-        self._debug._listeners = ['%s' % listener]
-        self._debug._listeners_heard = []
         tout = utils.timestr_to_secs(timeout)
 
-        seccount = 0
-        found = False
-        while seccount <= tout:
-            time.sleep(1)
-            if len(self._debug._listeners_heard) > 0:
-                found = True
-                break
-            seccount = seccount + 1
-
-        self._debug._listeners = templisteners
-        self._debug._listeners_heard = templistenersheard
+        start = time.time()
+        hit = self._debug.wait_for_listener('%s' % listener, tout)
 
-        if not found:
+        if hit is None:
             if donotError:
                 # We did NOT expect to see the listener string!
-                return seccount
+                return round(time.time() - start, 3)
             else:
                 raise STBError("Listener '%s' not heard within %s" % (listener, timeout))
         else:
-            logger.debug("Listener '%s' heard in %ss" % (listener, seccount))
-            return seccount
+            # The line may have been read just before the wait started
+            timetaken = round(max(hit.time - start, 0), 3)
+            logger.debug("Listener '%s' heard in %ss" % (listener, timetaken))
+            return timetaken
 
 
     def get_qoemon_value(self, value="VPTS", videowindow="0"):
@@ -396,6 +475,9 @@ class STB(object):
 
         Optionally you can set the video window to gather the stats from (defaults to 0)
 
+        If `Start qoemon Stream` is running for the same counter and video window the latest value it read is
+        returned, without sending anything to the STB.
+
         Available values are:-
         - VPTS      - Video PTS count
         - APTS      - Audio PTS count
@@ -407,27 +489,118 @@ class STB(object):
         | ${a_time}=    | Get qoemon Value  | ALastPTS      |
         """
 
-        qoemon_values = {
-                        "VLastPTS":"qoemon -sV -w%s | awk {'print $2'} | tail -1" % videowindow,
-                        "ALastPTS":"qoemon -sA -w%s | awk {'print $2'} | tail -1" % videowindow,
-                        "VPTS":"qoemon -sP -w%s | awk {'print $2'} | tail -1" % videowindow,
-                        "APTS":"qoemon -sP -w%s | awk {'print $4'} | tail -1" % videowindow
-                        }
+        if value not in QOEMON_VALUES:
+            raise STBError("qoemon value '" + value + "' not found")
+        counter, column = QOEMON_VALUES[value]
+
+        # A running `Start qoemon Stream` for the same counter already has the value
+        record = None
+        if self._qoemon_counters == (counter, str(videowindow)) and self._qoemon_stream is not None:
+            record = self._qoemon_stream.latest()
+        if record is None:
+            records = StatParsers.parse_qoemon(
+                self.send_command_and_return_output("qoemon -s%s -w%s" % (counter, videowindow)))
+            if records:
+                record = records[-1]
+
+        ret = None if record is None else record.column(column)
+        if ret is None:
+            ret = -1
+        return ret
 
-        qoemon_command = qoemon_values.get(value)
+    def start_qoemon_stream(self, counters="P", videowindow="0"):
+        """  Start qoemon running on the STB, reading its output as it arrives
 
-        if qoemon_command == None:
-            raise STBError("qoemon value '" + value + "' not found")
+        Rather than starting qoemon for every value, it is left running on a telnet session of its own and
+        each line it prints is parsed as it is read.  `Get qoemon Value` then returns the latest value from
+        the stream when it is for the same counters and video window, and `Get qoemon Stream` returns the lines.
 
-        ret = self.send_command_and_return_output(qoemon_command)
+        The stream runs until `Stop qoemon Stream`, or until the STB drops the connection (e.g. a reboot).
 
-        # Some may need post processing
-        if value == 'VPTS' or value =='APTS' or value == 'VLastPTS' or value == 'ALastPTS':
+        Examples:
+        | Start qoemon Stream   |                   |               | # Video and audio PTS counts from window 0  |
+        | Start qoemon Stream   | V                 | videowindow=1 | # Last video PTS from window 1              |
+        | ${vpts}=              | Get qoemon Value  | VPTS          | # Latest from the stream, nothing is sent   |
+        """
+
+        if self._qoemon_thread is not None:
+            self.stop_qoemon_stream()
+
+        ip = self.get_interface_attribute()
+        conn = self._get_telnet_pool().acquire(ip, "qoemon")
+        try:
+            conn.write("qoemon -s%s -w%s -c %d" % (counters, videowindow, QOEMON_STREAM_COUNT))
+        except:
+            self._get_telnet_pool().discard(conn)
+            raise
+
+        self._qoemon_conn = conn
+        self._qoemon_ip = ip
+        self._qoemon_counters = (counters, str(videowindow))
+        self._qoemon_stream = StatParsers.QoemonStream()
+        self._qoemon_abort.clear()
+        self._qoemon_thread = threading.Thread(target=self._qoemon_stream_thread,
+                                               args=(conn, self._qoemon_stream, self._qoemon_abort))
+        self._qoemon_thread.daemon = True
+        self._qoemon_thread.start()
+
+    def get_qoemon_stream(self, count="1"):
+        """  Return the last 'count' lines read from a running `Start qoemon Stream`, newest last
+
+        Returns an empty list if no stream is running or it hasn't printed anything yet.
+
+        Examples:
+        | ${line}=  | Get qoemon Stream |       |
+        | @{lines}= | Get qoemon Stream | 10    |
+        """
+
+        if self._qoemon_stream is None:
+            return []
+        return [str(record) for record in self._qoemon_stream.records[-int(count):]]
+
+    def stop_qoemon_stream(self):
+        """  Stop a qoemon started with `Start qoemon Stream`
+
+        Returns the number of lines read from it.
+
+        Examples:
+        | ${lines}= | Stop qoemon Stream |
+        """
+
+        if self._qoemon_thread is None:
+            return 0
+        self._qoemon_abort.set()
+        self._qoemon_thread.join()
+        self._qoemon_thread = None
+
+        conn = self._qoemon_conn
+        self._qoemon_conn = None
+        self._qoemon_counters = None
+        try:
+            # Interrupt qoemon and wait for the shell, so the session can go back to the pool
+            conn._conn.write_bare("\x03")
+            conn.set_timeout(self._telnet_timeout)
+            conn.read_until_prompt()
+            self._get_telnet_pool().release(conn, self._qoemon_ip, "qoemon")
+        except Exception:
+            self._get_telnet_pool().discard(conn)
+
+        count = self._qoemon_stream.count
+        self._qoemon_stream = None
+        return count
+
+    def _qoemon_stream_thread(self, conn, stream, abort):
+        sock = conn._conn.get_socket()
+        while not abort.is_set():
             try:
-                ret = int(ret)
-            except:
-                ret = -1
-        return ret
+                if not select.select([sock], [], [], QOEMON_READ_INTERVAL)[0]:
+                    continue
+                data = conn._conn.read_very_eager()
+            except Exception as e:
+                logger.warn("qoemon stream on %s ended: %s" % (self._qoemon_ip, e))
+                return
+            if data:
+                stream.feed(data.decode(self._telnet_encoding, 'replace').replace('\r', ''))
 
     def send_command_over_debug(self, command):
 
@@ -522,6 +695,7 @@ class STB(object):
         if len(commands) > 0:
             for command in commands:
                 self.send_command_over_debug("libconfig-set NORFLASH.%s" % command)
+            self._libconfig.invalidate()
 
             if not reboot:
 
@@ -620,15 +794,19 @@ class STB(object):
         self._powerip_port = powerip_port
         self._powerip_type = powerip_type
 
-    def ping_stb_until_alive(self, interface=-1, timeout="2 minutes", pinginterval="5 seconds", dieonfail=True):
+    def ping_stb_until_alive(self, interface=-1, timeout="2 minutes", pinginterval="200 milliseconds", dieonfail=True):
         """  Repeatedly pings STB on any defined interface until it responds or 'timeout' expires.
 
-        If the STB responds before 'timeout' expires the keyword will return how long it took to respond (in seconds)
+        If the STB responds before 'timeout' expires the keyword will return how long it took to respond
+        (in seconds, to the millisecond)
 
         If 'timeout' expires, behaviour is defined by 'dieonfail'.  True raises an error, false returns -1.
 
+        The STB is probed every 'pinginterval' from within the test process (see LivenessProber), with ICMP
+        if permitted or else TCP connects to the telnet and ssh ports.
+
         Examples:
-        | Ping STB until alive  | interface=${wifi}     | pinginterval=10 seconds   |
+        | Ping STB until alive  | interface=${wifi}     | pinginterval=1 second     |
         | ${ret}=               | Ping STB until alive  | timeout=3 minutes         |
         | ${ret}=               | Ping STB until alive  | dieonfail=${False}        |
 
@@ -637,15 +815,13 @@ class STB(object):
         ip = self._get_iface_ip(interface)
 
         starttime = time.time()
-        endtime = starttime + utils.timestr_to_secs(timeout)
-        waitfor = utils.timestr_to_secs(pinginterval)
-
-        while time.time() < endtime:
-            try:
-                self._ping(ip)
-                return str(int(time.time() - starttime))
-            except:
-                time.sleep(waitfor)
+        watch = LivenessProber.LivenessProber.get_prober().watch(ip, utils.timestr_to_secs(pinginterval))
+        try:
+            replied = watch.wait(utils.timestr_to_secs(timeout))
+        finally:
+            watch.stop()
+        if replied is not None:
+            return "%.3f" % max(replied - starttime, 0)
         if dieonfail:
             raise STBError("Unable to reach STB with ping after %s" % timeout)
         else:
@@ -677,9 +853,8 @@ class STB(object):
                 logger.warn("Unable to ping STB on " + ip)
                 return False
 
-    def _ping(self, target):
-        retcode = self._os.run_and_return_rc("ping -c 1 " + target)
-        if retcode != 0:
+    def _ping(self, target, ports=LivenessProber.PROBE_PORTS):
+        if not LivenessProber.LivenessProber.get_prober().probe(target, PING_TIMEOUT, ports):
             raise PingResponseError
         else:
             return 0
@@ -693,7 +868,8 @@ class STB(object):
         If stb stats were being collected they will be halted and restarted after the wait period.
         A debug capture will stay open.
 
-        This keyword will return the number of whole seconds it took for the STB to become responsive to ping.
+        This keyword will return the number of seconds (to the millisecond) from sending the reboot to the STB
+        becoming responsive to ping.
 
         Examples:
         | ${time}=      | Reboot STB            |
@@ -716,7 +892,7 @@ class STB(object):
             restart_telnet = True
 
 
-        if (self._keep_stats_open == True) and (self._stats_conn != None):
+        if ((self._keep_stats_open == True) and (self._stats_conn != None)) or self._stats_onbox_sampler is not None:
             restart_stats = True
             # Close down stats gracefully
             try:
@@ -730,6 +906,7 @@ class STB(object):
 
         # Reboot box
 
+        self._start_boot_profile("reboot")
         logger.info("Rebooting STB now....")
 
         try:
@@ -740,6 +917,9 @@ class STB(object):
             logger.info("Failed to open telnet, trying over debug...")
             self.send_commands_over_debug("reboot")
 
+        rebooted = time.time()
+        self._boot_profiler.restart_from(rebooted)
+
         # Close down telnet gracefully
         try:
             self._keep_telnet_open = False
@@ -749,10 +929,16 @@ class STB(object):
             self._close_telnet()
         except:
             pass
+        # Pooled sessions won't survive the reboot
+        self._get_telnet_pool().close_all()
+        self._libconfig.invalidate()
 
         logger.info("Waiting for STB to restart.....")
         time.sleep(20)
-        timetaken = self.ping_stb_until_alive(timeout=pingtimeout)
+        pingstart = time.time()
+        timetaken = pingstart - rebooted + float(self.ping_stb_until_alive(timeout=pingtimeout))
+        if self._boot_profiler.is_running():
+            self._boot_profiler.mark("ping", rebooted + timetaken)
         logger.info("STB has responded, waiting for 10 seconds before commencing")
         time.sleep(10)
 
@@ -765,11 +951,96 @@ class STB(object):
 
         if restart_stats:
             logger.info("Restarting stats capture")
-            self.capture_stb_statistics(mem=self._stats_memory, cpu=self._stats_cpu, wifi=self._stats_wifi, qoemon=self._stats_qoemon, interval=self._stats_interval)
+            self.capture_stb_statistics(mem=self._stats_memory, cpu=self._stats_cpu, wifi=self._stats_wifi, qoemon=self._stats_qoemon, interval=self._stats_interval,
+                                        onbox=self._stats_onbox, pull=self._stats_pull)
 
         self._stateflags = {}
 
-        return str(int(timetaken) + 20)
+        return "%.3f" % timetaken
+
+    def set_boot_milestones(self, *milestones):
+        """ Set Boot Milestones - Sets the milestones timed during each reboot or power cycle
+
+        Each milestone is given as name=regular expression, in boot order, and is timed from the
+        first line of debug output matching it.  See `Get Boot Timeline`.
+
+        The defaults are:
+        | bootloader | CFE version or U-Boot banner                 |
+        | kernel     | Linux version                                |
+        | rootfs     | VFS: Mounted root                            |
+        | app        | Starting application/browser/middleware      |
+        | network    | udhcpc lease, or the link coming up          |
+        | video      | first frame or picture decoded               |
+
+        Example:-
+        | Set Boot Milestones   | bootloader=CFE version    | kernel=Linux version  | app=Starting ekioh    |
+        """
+        parsed = []
+        for milestone in milestones:
+            name, sep, pattern = milestone.partition("=")
+            if not sep or not name.strip() or not pattern:
+                raise STBError("Boot milestones are given as name=regular expression, not '%s'" % milestone)
+            parsed.append((name.strip(), pattern))
+        self._boot_profiler.finish()
+        self._boot_profiler.set_milestones(parsed)
+
+    def get_boot_timeline(self):
+        """ Get Boot Timeline - Returns the milestone times of the last reboot or power cycle
+
+        While `Capture Debug` is running, `Reboot STB` and `Power Cycle STB` time each boot milestone
+        (see `Set Boot Milestones`) from the reboot being sent, or from power on, to the first debug
+        line matching it.  The time of the first ping reply is added as 'ping'.  Milestones are timed
+        until the next boot or until this keyword is called, so late ones such as first video are
+        caught.
+
+        Returns a dictionary of milestone name to seconds (to the millisecond), or None for milestones
+        that weren't seen.  Each boot is also appended to ${OUTPUTDIR}/${SUITENAME}_<stb>_boot_timeline.csv
+
+        Example:-
+        | Reboot STB        |                       |
+        | ${timeline}=      | Get Boot Timeline     |
+        | Should Be True    | ${timeline['kernel']} < 5     |
+        """
+        self._boot_profiler.finish()
+        if not self._boot_profiler.timelines:
+            raise STBError("No boot has been timed, is Capture Debug running?")
+        return self._format_boot_times(self._boot_profiler.timelines[-1].as_dict())
+
+    def get_boot_statistics(self):
+        """ Get Boot Statistics - Returns statistics for each boot milestone across every boot timed
+
+        See `Get Boot Timeline`.  Returns a dictionary of milestone name to a dictionary of count
+        (the number of boots it was seen in), min, mean, median, max and stdev in seconds.
+
+        Example:-
+        | ${stats}=         | Get Boot Statistics   |
+        | Log               | ${stats['app']['median']}     |
+        """
+        self._boot_profiler.finish()
+        ret = {}
+        for name, stats in self._boot_profiler.statistics().items():
+            ret[name] = self._format_boot_times(stats, exclude=("count",))
+        return ret
+
+    def _format_boot_times(self, times, exclude=()):
+        ret = {}
+        for name, value in times.items():
+            if value is None or name in exclude:
+                ret[name] = value
+            else:
+                ret[name] = "%.3f" % value
+        return ret
+
+    def _start_boot_profile(self, label):
+        if self._debug is None:
+            return
+        try:
+            outdir = BuiltIn().replace_variables('${OUTPUTDIR}')
+            suitename = BuiltIn().replace_variables('${SUITENAME}')
+            self._boot_profiler.set_path(os.path.join(outdir, suitename + '_' + self._shortname + '_boot_timeline.csv').replace(' ','_'))
+        except:
+            self._boot_profiler.set_path(None)
+        self._boot_profiler.start(self._debug, label)
 
     def get_stateflag(self, stateflag):
         """ Get Stateflag - Return stateflag information for the current object
@@ -803,22 +1074,29 @@ class STB(object):
         self._stateflags[stateflag] = state
 
 
-    def power_cycle_stb(self, waitfor="1 minute", downtime="1 second"):
+    def power_cycle_stb(self, waitfor="1 minute", downtime="1 second", settle="10 seconds"):
 
-        """  Power cycles the STB and waits for a set time (default = 1 minute) before continuing.
+        """  Power cycles the STB and waits up to a set time (default = 1 minute) for it to respond to ping.
 
-        When the wait period expires the STB will be pinged.  A failure to respond will halt the test execution.
+        The keyword stops waiting as soon as the STB responds, then gives it 'settle' (default 10 seconds)
+        to finish booting before anything is restarted, as `Reboot STB` does.  A failure to respond within
+        'waitfor' will halt the test execution.
 
-        If the telnet port was being held open it will be closed and reopened after the wait period.
-        If stb stats were being collected they will be halted and restarted after the wait period.
+        If the telnet port was being held open it will be closed and reopened once the STB responds.
+        If stb stats were being collected they will be halted and restarted once the STB responds.
         A debug capture will stay open.
 
         Defining a downtime (defaults to 1 second) will change the time between OFF and ON
 
+        Returns the number of seconds (to the millisecond) from power on to the STB first responding to ping,
+        not counting 'settle'.
+
         Examples:
         | Power cycle STB   |                       |
         | Power cycle STB   | waitfor=2 minutes     |
         | Power cycle STB   | downtime=5 seconds    |
+        | Power cycle STB   | settle=30 seconds     |
+        | ${recovery}=      | Power cycle STB       |
 
         """
 
@@ -826,21 +1104,111 @@ class STB(object):
             logger.warn("A power cycle was attempted when no powerip settings were defined!")
             return
 
-        restart_telnet = False
-        restart_stats = False
-
         powerip = self._powerip_port.split(":")[0]
         powerport = self._powerip_port.split(":")[1]
 
         try:
-            self._ping(powerip)
+            # The netbooter answers on its web port
+            self._ping(powerip, ports=(80,))
         except:
             logger.warn("No response from powerip device on ip '" + powerip + "'.  Unable to power cycle STB")
             return
 
+        restart = self._prepare_for_power_cycle()
+
+        # Power cycle box
+        recovery = None
+
+        if self._powerip_type == "netbooter":
+
+            logger.info("Power cycling STB now....")
+            self._power_ip_netbooter(powerip, powerport, 0)
+            time.sleep(utils.timestr_to_secs(downtime))
+            self._start_boot_profile("power cycle")
+            self._power_ip_netbooter(powerip, powerport, 1)
+            # Watch from power on, so the time the STB came back is known to the probe interval
+            poweron = time.time()
+            self._boot_profiler.restart_from(poweron)
+            watch = LivenessProber.LivenessProber.get_prober().watch(self.get_interface_attribute())
+            logger.info("Waiting up to " + waitfor + " for STB to restart")
+            try:
+                replied = watch.wait(utils.timestr_to_secs(waitfor))
+            finally:
+                watch.stop()
+            if replied is None:
+                raise STBError("Unable to reach STB with ping after %s" % waitfor)
+            recovery = "%.3f" % (replied - poweron)
+            logger.info("STB responded %ss after power on" % recovery)
+            if self._boot_profiler.is_running():
+                self._boot_profiler.mark("ping", replied)
+            # A first reply only means the network is up, not that telnet and the apps are
+            logger.info("Waiting %s for STB to settle" % settle)
+            time.sleep(utils.timestr_to_secs(settle))
+
+        self._restore_after_power_cycle(restart)
+
+        return recovery
+
+    def power_cycle_rack(self, *stbs, **kwargs):
+        """  Power cycles a list of STBs together and waits for them all to come back
+
+        The STBs are given by the names their libraries were imported with (or are library instances),
+        and each must have a netbooter powerip set with `Set Powerip Port`.  With no STBs given this
+        STB is power cycled on its own.
+
+        All the STBs are switched off, then after 'downtime' switched on again one at a time 'stagger'
+        apart, to limit the inrush current.  Each is then waited for, for up to 'timeout' from its own
+        power on: for 'listener' on its debug capture if given (and the STB has `Capture Debug` running),
+        otherwise for it to respond to ping.  So a whole rack comes back in about one boot time.
+
+        Telnet sessions and stats collection are handled as in `Power Cycle STB`.
+
+        Returns a dictionary of STB name to the seconds (to the millisecond) from power on to the STB
+        responding.  If any STB fails to come back, behaviour is defined by 'dieonfail': True raises
+        an error, False leaves its time as -1.
+
+        Examples:
+        | Power cycle rack  | STB1              | STB2              | STB3                      |
+        | ${times}=         | Power cycle rack  | @{rack}           | stagger=1 second          |
+        | ${times}=         | Power cycle rack  | @{rack}           | listener=Starting kernel  | timeout=5 minutes |
+        | ${times}=         | Power cycle rack  | @{rack}           | dieonfail=${False}        |
+        """
+        downtime = utils.timestr_to_secs(kwargs.get('downtime', "1 second"))
+        stagger = utils.timestr_to_secs(kwargs.get('stagger', "500 milliseconds"))
+        timeout = utils.timestr_to_secs(kwargs.get('timeout', "3 minutes"))
+        listener = kwargs.get('listener', None)
+        dieonfail = kwargs.get('dieonfail', True)
+
+        boxes = []
+        for stb in stbs or [self]:
+            if isinstance(stb, basestring):
+                boxes.append((stb, BuiltIn().get_library_instance(stb)))
+            else:
+                boxes.append((getattr(stb, '_shortname', str(stb)), stb))
+
+        rack = RackPowerCycle.RackPowerCycle(boxes, downtime, stagger, listener)
+        recovery = rack.run(timeout)
+
+        ret = {}
+        for name, seconds in recovery.items():
+            if seconds is None:
+                ret[name] = str(-1)
+            else:
+                ret[name] = "%.3f" % seconds
+        if rack.errors:
+            failures = ", ".join("%s (%s)" % (name, error) for name, error in sorted(rack.errors.items()))
+            if dieonfail:
+                raise STBError("STBs did not come back after power cycle: %s" % failures)
+            logger.warn("STBs did not come back after power cycle: %s" % failures)
+        return ret
+
+    def _prepare_for_power_cycle(self):
+        # Close telnet and stats down gracefully, returns what to restart afterwards
+        restart_telnet = False
+        restart_stats = False
+
         if (self._keep_telnet_open == True) and (self._telnet_conn != None):
             restart_telnet = True
-            # Close down telnet gracefully
             try:
                 self._keep_telnet_open = False
             except:
@@ -850,9 +1218,8 @@ class STB(object):
             except:
                 pass
 
-        if (self._keep_stats_open == True) and (self._stats_conn != None):
+        if ((self._keep_stats_open == True) and (self._stats_conn != None)) or self._stats_onbox_sampler is not None:
             restart_stats = True
-            # Close down stats gracefully
             try:
                 self._keep_stats_open = False
             except:
@@ -862,27 +1229,23 @@ class STB(object):
             except:
                 pass
 
-        # Power cycle box
+        # Pooled sessions won't survive the power cycle
+        self._get_telnet_pool().close_all()
+        self._libconfig.invalidate()
 
-        if self._powerip_type == "netbooter":
-
-            logger.info("Power cycling STB now....")
-            self._power_ip_netbooter(powerip, powerport, 0)
-            time.sleep(utils.timestr_to_secs(downtime))
-            self._power_ip_netbooter(powerip, powerport, 1)
-            logger.info("Waiting for STB to restart (" + waitfor + ")")
-            sleeptime = utils.timestr_to_secs(waitfor)
-            time.sleep(sleeptime)
-            self.ping_stb_until_alive(timeout=sleeptime)
+        return restart_telnet, restart_stats
 
+    def _restore_after_power_cycle(self, restart):
         # Now restart all the stuff that was stopped
+        restart_telnet, restart_stats = restart
         if restart_telnet:
             logger.info("Reopening telnet connection")
             self.login_and_keep_telnet_open()
 
         if restart_stats:
             logger.info("Restarting stats capture")
-            self.capture_stb_statistics(mem=self._stats_memory, cpu=self._stats_cpu, wifi=self._stats_wifi, qoemon=self._stats_qoemon, interval=self._stats_interval)
+            self.capture_stb_statistics(mem=self._stats_memory, cpu=self._stats_cpu, wifi=self._stats_wifi, qoemon=self._stats_qoemon, interval=self._stats_interval,
+                                        onbox=self._stats_onbox, pull=self._stats_pull)
 
         self._stateflags = {}
 
@@ -898,44 +1261,19 @@ class STB(object):
 
 
     def _power_ip_netbooter(self, powerip, powerport, state, max_attempts=3):
-        if state == self._power_ip_netbooter_read(powerip, powerport, max_attempts):
-            logger.info("Power IP already in state %s.  No action" % state)
-        else:
-            self._os.run_and_return_rc('curl --user admin:admin http://' + powerip + '/cmd.cgi?rly=' + powerport + ' >/dev/null 2>&1')
-            counter = 0
-            while int(state) != int(self._power_ip_netbooter_read(powerip, powerport, max_attempts)):
-                counter = counter + 1
-                if counter > max_attempts:
-                    raise STBError("Could not set rly to state %s on powerip %s" % (state, powerip))
-                else:
-                    logger.info("Set powerip state failed... retrying")
-                    time.sleep(0.5)
-                    self._os.run_and_return_rc('curl --user admin:admin http://' + powerip + '/cmd.cgi?rly=' + powerport + ' >/dev/null 2>&1')
+        try:
+            Netbooter.Netbooter.get_netbooter(powerip).set_outlet(powerport, state, max_attempts)
+        except Netbooter.NetbooterError as e:
+            raise STBError(str(e))
 
 
     def _power_ip_netbooter_read(self, powerip, powerport, max_attempts=3):
-        counter = 0
-        # Check for a response from the powerip unit
-        logger.info("Pinging powerip")
-        while self._os.run_and_return_rc('ping %s -c 1' % powerip) != 0:
-            counter = counter + 1
-            if counter > max_attempts:
-                raise STBError("Unable to ping powerip on %s" % powerip)
-            else:
-                logger.info("Ping powerip failed... retrying")
-                time.sleep(0.5)
-
-        counter = 0
-
-
         try:
-            root = ET.fromstring(self._os.run('curl -s --user admin:admin http://%s/status.xml' % powerip))
-        except Exception as inst:
-            logger.warn('Power Ip Error: %s' % (inst))
+            return str(Netbooter.Netbooter.get_netbooter(powerip).get_outlet(powerport))
+        except Netbooter.NetbooterError as e:
+            logger.warn('Power Ip Error: %s' % (e))
             raise STBError("Unable to read status of powerip on %s" % powerip)
 
-        return root.find('rly%s' % powerport).text
-
     # Fakekey methods (public)
     def send_fakekey(self, key, pause=None, repeatcount=1):
 
@@ -1024,15 +1362,38 @@ class STB(object):
 
         """
 
+        if self._stats_shared:
+            logger.info("Stopping stb statistics..")
+            StatCollector.StatCollector.get_collector().remove(self._shortname)
+            self._stats_shared = False
+            self._stats_collecting = False
+
         if self._stats_thread != None:
             logger.info("Stopping stb statistics..")
             self._keep_stats_open = False
-            self._stats_abort = True
+            self._stats_abort.set()
             self._stats_thread.join()
             self._stats_thread = None
             self._close_stats()
 
-    def capture_stb_statistics(self, mem=True, cpu=True, wifi=False, qoemon=False, interval="10 seconds", keepopen=True):
+    def pull_stb_statistics(self):
+
+        """  Pulls the samples taken on the STB since the last pull, when capturing with 'onbox=${True}'
+
+        Returns the number of samples pulled, which are written to the usual log files.
+
+        Example:
+        | ${samples}=   | Pull stb statistics   |
+
+        """
+
+        if self._stats_onbox_sampler is None:
+            logger.warn("On-box stb stats are not being collected.  Nothing to pull.")
+            return 0
+        return self._pull_onbox_stats()
+
+    def capture_stb_statistics(self, mem=True, cpu=True, wifi=False, qoemon=False, interval="10 seconds", keepopen=True, shared=False,
+                               onbox=False, pull="60 seconds"):
 
         """  Starts gathering STB statistics
 
@@ -1050,6 +1411,22 @@ class STB(object):
         - qoemon={False|xxxx}   - Capture 'qoemon' stats where xxxx is any of the available qoemon counters*
         - interval      - Set the time between captures (default 10 seconds)
         - keepopen={True|False} - Allows the telnet connection to stay open rather than log in each time, saving at least 3 seconds a capture. (defaults to True)
+        - shared={True|False} - Sample from the single collector thread shared by every STB in the run, rather than a thread for this STB (defaults to False)
+        - onbox={True|False} - Sample on the STB itself, and pull the samples every 'pull' (defaults to False)
+        - pull          - Set the time between pulls of on-box samples (default 60 seconds)
+
+        Every enabled statistic is gathered by a single command, so a sample costs one telnet round trip.
+        Samples are taken on a fixed schedule of 'interval' from the start, rather than 'interval' after
+        the previous sample finished, so intervals down to 1 second hold (with keepopen) and do not drift.
+
+        With 'shared=${True}' every STB using the same interval is sampled at the same moments, and as well
+        as the per STB logs every sample is written to ${SUITENAME}_fleet_stats.csv, a row per STB per sample.
+        The shared collector always keeps its connection open.
+
+        With 'onbox=${True}', for long soaks, a small shell loop is started on the STB that samples every 'interval'
+        (whole seconds) into a ring file in /tmp, and the samples are pulled in bulk every 'pull' or by
+        `Pull STB Statistics`.  No session is held open between pulls and a busy host doesn't lose samples.  If the
+        sampler has gone, e.g. the STB rebooted, it is started again at the next pull.  qoemon is not sampled on-box.
 
         * qoemon can monitor one or more from:-
         - T - Time
@@ -1071,32 +1448,134 @@ class STB(object):
         | Capture STB Statistics    | cpu=False      | interval=30 | # Start capturing MEM only at 30 second intervals                                 |
         | Capture STB Statistics    | keepopen=False |             | # Start capturing CPU and MEM at 10 second intervals, log in each time            |
         | Capture STB Statistics    | qoemon=SD      | cpu=False   | # Start capturing MEM and qoemon skips and discontinuities at 10 second intervals |
+        | Capture STB Statistics    | interval=1     |             | # Start capturing CPU and MEM every second                                        |
+        | Capture STB Statistics    | shared=${True} |             | # Start capturing CPU and MEM in step with every other STB in the run             |
+        | Capture STB Statistics    | onbox=${True}  | interval=1  | # Sample CPU and MEM every second on the STB, pulling the samples every minute    |
 
         """
 
+        if self._stats_thread != None or self._stats_shared:
+            logger.warn("A call to collect stb stats was issued while stb stats where already being collected.  Ignoring.")
+            return
+
+        self._stats_onbox = onbox
+        self._stats_pull = pull
+
+        if shared:
+            self._start_shared_stats(mem, cpu, wifi, qoemon, interval)
+            return
+
+        if onbox:
+            self._start_onbox_stats(mem, cpu, wifi, qoemon, interval, pull)
+            return
+
         if keepopen:
             ip = self.get_interface_attribute()
             self._open_stats_connection(ip)
             self._keep_stats_open = True
 
         logger.info("Starting stats collection")
-        if self._stats_thread != None:
-            logger.warn("A call to collect stb stats was issued while stb stats where already being collected.  Ignoring.")
-            return
         self._stats_memory = mem
         self._stats_cpu = cpu
         self._stats_wifi = wifi
         self._stats_qoemon = qoemon
         self._stats_interval = interval
-        self._stats_abort = False
+        self._stats_abort.clear()
         self._stats_thread = threading.Thread(target=self._capture_stats_thread)
         self._stats_thread.start()
         self._stats_collecting = True
 
     # STATS methods (private)
-    def _capture_stats_thread(self):
+    def _start_shared_stats(self, mem, cpu, wifi, qoemon, interval):
+        outdir = BuiltIn().replace_variables('${OUTPUTDIR}')
+        suitename = BuiltIn().replace_variables('${SUITENAME}')
+        outputpath = os.path.join(outdir, suitename + '_' + self._shortname).replace(' ','_')
+
+        collector = StatCollector.StatCollector.get_collector()
+        fleetpath = os.path.join(outdir, suitename + '_fleet_stats.csv').replace(' ','_')
+        if collector.sink_path() != fleetpath:
+            # First STB of this suite to start
+            collector.set_sink(StatCollector.FleetStatsSink(fleetpath))
+
+        logger.info("Starting shared stats collection")
+        self._stats_memory = mem
+        self._stats_cpu = cpu
+        self._stats_wifi = wifi
+        self._stats_qoemon = qoemon
+        self._stats_interval = interval
+        sampler = StatSampler.StatSampler(mem=mem, cpu=cpu, wifi=wifi, qoemon=qoemon)
+        collector.add(self._shortname, self.get_interface_attribute(), sampler,
+                      utils.timestr_to_secs(interval),
+                      callback=lambda sample: self._write_stats_sample(outputpath, sample),
+                      user=self._telnet_user, password=self._telnet_password,
+                      login_prompt=self._login_prompt, password_prompt=self._password_prompt,
+                      prompt=self._prompt, prompt_regex=self._prompt_regex)
+        self._stats_shared = True
+        self._stats_collecting = True
+
+    def _start_onbox_stats(self, mem, cpu, wifi, qoemon, interval, pull):
+        outdir = BuiltIn().replace_variables('${OUTPUTDIR}')
+        suitename = BuiltIn().replace_variables('${SUITENAME}')
+        self._stats_onbox_path = os.path.join(outdir, suitename + '_' + self._shortname).replace(' ','_')
+
+        if qoemon != False:
+            logger.warn("qoemon is not sampled on-box, ignoring qoemon=%s" % qoemon)
 
-        countsec = 0
+        logger.info("Starting on-box stats collection")
+        self._stats_memory = mem
+        self._stats_cpu = cpu
+        self._stats_wifi = wifi
+        self._stats_qoemon = qoemon
+        self._stats_interval = interval
+        self._stats_onbox_sampler = OnBoxSampler.OnBoxSampler(mem=mem, cpu=cpu, wifi=wifi,
+                                                              interval=utils.timestr_to_secs(interval))
+        with self._stats_lock:
+            self._open_stats_connection(self.get_interface_attribute())
+            try:
+                for command in self._stats_onbox_sampler.install_commands():
+                    self._send_stats_command(command)
+            finally:
+                self._close_stats()
+
+        self._stats_abort.clear()
+        self._stats_thread = threading.Thread(target=self._capture_onbox_stats_thread)
+        self._stats_thread.start()
+        self._stats_collecting = True
+
+    def _capture_onbox_stats_thread(self):
+        pull = utils.timestr_to_secs(self._stats_pull)
+        while not self._stats_abort.wait(pull):
+            self._pull_onbox_stats()
+
+        # The last samples, then leave nothing running on the STB
+        self._pull_onbox_stats(stop=True)
+        self._stats_onbox_sampler = None
+
+    def _pull_onbox_stats(self, stop=False):
+        sampler = self._stats_onbox_sampler
+        with self._stats_lock:
+            try:
+                self._open_stats_connection(self.get_interface_attribute())
+                try:
+                    samples, running = sampler.parse(self._send_stats_command(sampler.pull_command()))
+                    if stop:
+                        self._send_stats_command(sampler.stop_command())
+                    elif not running:
+                        logger.warn("On-box stats sampler not running on %s, restarting it" % self._shortname)
+                        for command in sampler.install_commands():
+                            self._send_stats_command(command)
+                finally:
+                    self._close_stats()
+            except Exception as e:
+                # e.g. the STB is rebooting, the samples will still be there (or not) next pull
+                logger.warn("Unable to pull on-box stats from %s: %s" % (self._shortname, e))
+                return 0
+
+        for sample in samples:
+            self._write_stats_sample(self._stats_onbox_path, sample)
+        return len(samples)
+
+    def _capture_stats_thread(self):
 
         ip = self.get_interface_attribute() #Use active for now
 
@@ -1104,67 +1583,52 @@ class STB(object):
         suitename = BuiltIn().replace_variables('${SUITENAME}')
         outputpath = os.path.join(outdir, suitename + '_' + self._shortname).replace(' ','_')
 
+        # One command, so one round trip, gathers every statistic for a sample
+        sampler = StatSampler.StatSampler(mem=self._stats_memory, cpu=self._stats_cpu,
+                                          wifi=self._stats_wifi, qoemon=self._stats_qoemon)
+        command = sampler.command()
+        clock = StatSampler.SampleClock(utils.timestr_to_secs(self._stats_interval), self._stats_abort)
 
-        while not self._stats_abort:
+        while not self._stats_abort.is_set():
 
             self._open_stats_connection(ip)
-            if self._stats_cpu:
-                #Collect CPU stats
-                logfile = outputpath + "_cpu.log"
-                if not os.path.isfile(logfile):
-                    with open(logfile, 'w') as outputfile:
-                        outputfile.write("Timestamp,CPU_IDLE(%)\n")
-                timestamp = self._send_stats_command("date +'%Y%m%d%H%M%S'")
-                output = self._send_stats_command("top -n 1 | head -n 2 | tail -n 1")
-
-                with open(logfile, 'a') as outputfile:
-                    outputfile.write(timestamp + "," + output.split()[7].rstrip("%") + "\n")
-
-            if self._stats_memory:
-                #Collect Mem stats
-                logfile = outputpath + "_mem.log"
-                if not os.path.isfile(logfile):
-                    with open(logfile, 'w') as outputfile:
-                        outputfile.write("Timestamp,FreeMemory(B)\n")
-
-                timestamp = self._send_stats_command("date +'%Y%m%d%H%M%S' && `cat /proc/meminfo > /tmp/mem`")
-                output = self._send_stats_command("echo `expr $(cat /tmp/mem | grep 'Buffers' | awk {'print $2'}) + $(cat /tmp/mem | grep 'MemFree' | awk {'print $2'}) + $(cat /tmp/mem | grep 'Cached:' | grep -v 'SwapCached:' | awk {'print $2'})`")
-                self._send_stats_command("rm /tmp/mem")
-                with open(logfile, 'a') as outputfile:
-                    outputfile.write(timestamp + "," + output + "\n")
-
-
-            if self._stats_wifi:
-                #Collect Wifi stats
-                logfile = outputpath + "_wifi.log"
-                if not os.path.isfile(logfile):
-                    with open(logfile, 'w') as outputfile:
-                        outputfile.write("Timestamp,Quality(%),SignalStrength(dBm),Noisefloor(dBm)\n")
-
-                timestamp = self._send_stats_command("date +'%Y%m%d%H%M%S'")
-                qual = self._send_stats_command("cat /proc/net/wireless | grep wlan0 | awk '{print $3}'").rstrip('.')
-                strength = self._send_stats_command("cat /proc/net/wireless | grep wlan0 | awk '{print $4}'").rstrip('.')
-                noise = self._send_stats_command("cat /proc/net/wireless | grep wlan0 | awk '{print $5}'")
-                with open(logfile, 'a') as outputfile:
-                    outputfile.write(timestamp + "," + qual + "," + strength + "," + noise + "\n")
-
-            if self._stats_qoemon != False:
-                logfile = outputpath + "_qoemon.log"
-                qoeoutput = self._send_stats_command("qoemon -s " + self._stats_qoemon + " -c 1")
-                timestamp = self._send_stats_command("date +'%Y%m%d%H%M%S'")
-                with open(logfile, 'a') as outputfile:
-                    outputfile.write(timestamp + "\n")
-                    outputfile.write(qoeoutput + "\n")
-
+            sample = sampler.parse(self._send_stats_command(command))
             self._close_stats()
 
-            targetsec = utils.timestr_to_secs(self._stats_interval)
-            countsec = 0
-            while (targetsec > countsec):
-                if self._stats_abort:
-                    return
-                time.sleep(1)
-                countsec = countsec + 1
+            self._write_stats_sample(outputpath, sample)
+
+            if not clock.wait():
+                return
+
+    def _write_stats_sample(self, outputpath, sample):
+        timestamp = sample.get("timestamp", "")
+
+        if self._stats_cpu and "cpu" in sample:
+            #Collect CPU stats
+            self._write_stats_line(outputpath + "_cpu.log", "Timestamp,CPU_IDLE(%)",
+                                   timestamp + "," + sample["cpu"])
+
+        if self._stats_memory and "mem" in sample:
+            #Collect Mem stats
+            self._write_stats_line(outputpath + "_mem.log", "Timestamp,FreeMemory(B)",
+                                   timestamp + "," + sample["mem"])
+
+        if self._stats_wifi and "wifi" in sample:
+            #Collect Wifi stats
+            self._write_stats_line(outputpath + "_wifi.log", "Timestamp,Quality(%),SignalStrength(dBm),Noisefloor(dBm)",
+                                   timestamp + "," + ",".join(sample["wifi"]))
+
+        if self._stats_qoemon != False and "qoemon" in sample:
+            with open(outputpath + "_qoemon.log", 'a') as outputfile:
+                outputfile.write(timestamp + "\n")
+                outputfile.write(sample["qoemon"] + "\n")
+
+    def _write_stats_line(self, logfile, header, line):
+        if not os.path.isfile(logfile):
+            with open(logfile, 'w') as outputfile:
+                outputfile.write(header + "\n")
+        with open(logfile, 'a') as outputfile:
+            outputfile.write(line + "\n")
 
     # Debug methods (public)
     def debug_marker(self, text):
@@ -1181,7 +1645,7 @@ class STB(object):
         if self._debug != None:
             self._debug.debug_marker(text)
 
-    def capture_debug(self, debugport="default", suffix=None, dieonfail=True, compressed=False):
+    def capture_debug(self, debugport="default", suffix=None, dieonfail=True, compressed=False, sharedreader=False, terminalemulation=True, timestamps=False):
         """  Capture debug from a serial port
 
         Opens a serial connection to the debug on port ${debugport} (defaults to the
@@ -1197,12 +1661,26 @@ class STB(object):
         If you are running a long test it would be advisable to compress the log as it is being
         written.  You can do this with 'compressed=${True}'
 
+        When capturing from many STBs in one robot run, 'sharedreader=${True}' reads this port
+        from a single thread shared by every capture opened the same way, rather than a thread each.
+
+        Debug is passed through a full terminal emulator by default.  'terminalemulation=fast' uses
+        a much cheaper filter which only strips escape sequences and control characters, which is
+        all a plain log stream needs.  'terminalemulation=${False}' writes the output untouched.
+
+        'timestamps=${True}' prefixes every line of the log with the time it was received by this
+        host.  An index of the log (markers, plus a position every few seconds) is kept alongside it
+        in *_debug.log.idx, see `Get Debug Log Section` in PostProcessing.
+
         Examples:
         | Capture debug |                           |
         | Capture debug | debugport=/dev/ttyUSB0    |
         | Capture debug | suffix=UUT                |
         | Capture debug | dieonfail=${False}        |
         | Capture debug | compressed=${True}        |
+        | Capture debug | sharedreader=${True}      |
+        | Capture debug | terminalemulation=fast    |
+        | Capture debug | timestamps=${True}        |
 
 
         NOTE:  The current user MUST have access rights to serial ports!  To acheive this
@@ -1232,7 +1710,9 @@ class STB(object):
             else:
                 return
         try:
-            self._debug = Debug.Debug(appendsuffix=suffix)
+            self._debug = Debug.Debug(appendsuffix=suffix, shared_reader=sharedreader,
+                                      terminal_emulation=terminalemulation,
+                                      line_timestamps=timestamps)
             self._debug.open_connection(commport=self._debugport, compressed=compressed)
             logger.info("Serial debug capture %sstarted on '%s'" % (comp, self._debugport))
         except Debug.DebugError as d:
@@ -1343,6 +1823,11 @@ class STB(object):
             self.stop_stb_statistics()
         except:
             pass
+        try:
+            self._get_telnet_pool().close_all()
+        except:
+            pass
+        self._boot_profiler.finish()
 
 
 
@@ -1435,29 +1920,30 @@ class STB(object):
         self._telnet_timeout = timeout
 
 
+    def _get_telnet_pool(self):
+        # Created on first use, so device libraries can change the login settings after __init__
+        if self._telnet_pool is None:
+            self._telnet_pool = TelnetPool.TelnetPool(self._telnet_user, self._telnet_password,
+                                                      self._login_prompt, self._password_prompt,
+                                                      self._prompt, self._prompt_regex,
+                                                      newline=self._newline, encoding=self._telnet_encoding,
+                                                      terminal_type=self._telnet_terminal_type,
+                                                      timeout=self._telnet_timeout)
+        return self._telnet_pool
+
     def _open_connection(self, ip):
         if self._keep_telnet_open == False:
             try:
-                self._telnet_conn = Telnet.Telnet(newline=self._newline)
-                self._telnet_conn.open_connection(ip,encoding=self._telnet_encoding,encoding_errors="strict", terminal_emulation=True, terminal_type=self._telnet_terminal_type, window_size='400x100')
-                if self._login_prompt is not None:
-                    self._telnet_conn.login(self._telnet_user,self._telnet_password,login_prompt=self._login_prompt,password_prompt=self._password_prompt,login_timeout="2 seconds")
-                else:
-                    # Need to consume first prompt
-                    self._telnet_conn.read()
-                self._telnet_conn.set_prompt(self._prompt, self._prompt_regex)
-                time.sleep(2)
+                self._telnet_conn = self._get_telnet_pool().acquire(ip)
+                self._telnet_ip = ip
             except Exception as inst:
                 raise Exception("Unable to open Telnet connection! - " + inst.__str__())
 
     def _open_stats_connection(self, ip):
         if self._keep_stats_open == False:
             try:
-                self._stats_conn = Telnet.Telnet(newline=self._newline)
-                self._stats_conn.open_connection(ip,encoding=self._telnet_encoding,encoding_errors="strict", terminal_emulation=True, terminal_type=self._telnet_terminal_type, window_size='400x100')
-                self._stats_conn.login(self._telnet_user,self._telnet_password,login_prompt=self._login_prompt,password_prompt=self._password_prompt,login_timeout="2 seconds")
-                self._stats_conn.set_prompt(self._prompt)
-                time.sleep(2)
+                self._stats_conn = self._get_telnet_pool().acquire(ip, "stats")
+                self._stats_ip = ip
             except Exception as inst:
                 raise Exception("Unable to open Telnet connection for stats! - " + inst.__str__())
 
@@ -1479,12 +1965,13 @@ class STB(object):
         t_ip = self._get_iface_ip(telnet_interface)
 
         self._open_connection(t_ip)
-        qual = self._send_command("cat /proc/net/wireless | grep wlan0 | awk '{print $3}'").rstrip('.') + " %"
-        strength = self._send_command("cat /proc/net/wireless | grep wlan0 | awk '{print $4}'").rstrip('.') + " dBm"
-        noise = self._send_command("cat /proc/net/wireless | grep wlan0 | awk '{print $5}'") + " dBm"
-
+        wireless = StatParsers.parse_wireless(self._send_command("grep wlan0 /proc/net/wireless"))
         self._close_telnet()
-        return qual + "," + strength + "," + noise
+
+        if "wlan0" not in wireless:
+            raise STBError("wlan0 not found in /proc/net/wireless")
+        record = wireless["wlan0"]
+        return "%d %%,%d dBm,%d dBm" % (record.quality, record.level, record.noise)
 
 
     def _get_iface_ip(self, interface_index):
@@ -1521,34 +2008,85 @@ class STB(object):
         return output
 
     def _close_telnet(self):
+        # Back to the pool, for the next keyword to use without logging in
         if self._keep_telnet_open == False:
-            self._telnet_conn.close_all_connections()
+            self._get_telnet_pool().release(self._telnet_conn, self._telnet_ip)
 
     def _close_stats(self):
         if self._keep_stats_open == False:
-            self._stats_conn.close_all_connections()
-            #self._stats_conn = None
+            self._get_telnet_pool().release(self._stats_conn, self._stats_ip, "stats")
 
-    def send_commands(self, *commands):
+    def send_commands(self, *commands, **kwargs):
         """   Sends a list of commands to telnet on the active interface
 
         returns an array of return codes
 
+        By default each command is sent on its own and its return code read
+        with a separate `echo $?`, so every command costs two round trips.
+        With pipelined=${True} the commands are sent without waiting for
+        each other, wrapped in sentinels carrying their return codes, and
+        the output is split back up as it arrives (see CommandBatch).  This
+        is much quicker for long lists of commands.  The commands still run
+        one after the other in the same shell.
+
+        With output=${True} (pipelined only) each item returned is a list
+        of [return code, output] rather than just the return code.
+
         Examples:
         | Send commands | ls /mnt/nv    | cp log.temp / | rm log.temp       |
         | @{rcodes}=    | Send commands | cd /root      | mv log.txt /home  |
+        | @{rcodes}=    | Send commands | @{config}     | pipelined=${True} |
+        | @{results}=   | Send commands | cat /proc/version | uptime | pipelined=${True} | output=${True} |
         """
+        pipelined = kwargs.get('pipelined', False)
+        output = kwargs.get('output', False)
+
+        if any("libconfig-set" in str(command) for command in commands):
+            self._libconfig.invalidate()
+
         ip = self.get_interface_attribute() #Use active
         self._open_connection(ip)
         #old = self._set_telnet_timeout("11 minutes")
         ret = []
-        for command in commands:
-            self._send_command(command)
-            thisret = self._send_command("echo $?")
-            ret.append(thisret)
+        if pipelined:
+            try:
+                results = self._send_pipelined(commands)
+            except:
+                # The shell may still be working through the batch, don't reuse the session
+                if self._keep_telnet_open == False:
+                    self._get_telnet_pool().discard(self._telnet_conn)
+                    self._telnet_conn = None
+                raise
+            for rcode, text in results:
+                if output:
+                    ret.append([rcode, text])
+                else:
+                    ret.append(rcode)
+        else:
+            for command in commands:
+                self._send_command(command)
+                thisret = self._send_command("echo $?")
+                ret.append(thisret)
         self._close_telnet()
         return ret
 
+    def _send_pipelined(self, commands):
+        batch = CommandBatch.CommandBatch(commands, self._newline)
+        self._telnet_conn.set_timeout(self._telnet_timeout)
+        scripts = [batch.script(index) for index in range(len(batch))]
+        output = []
+        sent = 0
+        for done in range(len(batch)):
+            # Keep up to PIPELINE_WINDOW bytes queued, but always at least the next command
+            while sent < len(batch) and (sent == done or
+                                         sum(len(script) for script in scripts[done:sent + 1]) <= PIPELINE_WINDOW):
+                self._telnet_conn.write_bare(scripts[sent])
+                sent += 1
+            output.append(self._telnet_conn.read_until_regexp(batch.end_pattern(done)))
+        if len(batch):
+            output.append(self._telnet_conn.read_until_prompt())
+        return batch.parse(''.join(output))
+
     def record_pvr_asset_and_check_level(self, url, rectime, level_event='Low'):
         """   Records a PVR asset for given url and checks for a disk space level event
 
@@ -1705,23 +2243,33 @@ class STB(object):
         If changes were required, by default the STB will reboot. This behaviour can be changed using
         the `Reboot after libconfig set` keyword
 
+        All the commands are sent in one go (see `Send Commands` pipelined), and the settings are
+        dropped from the libconfig snapshot (see `Get Libconfig Values`).
+
 
         Example:
         | Send libconfig set commands   | NORFLASH.TVSYSTEM NTSC-M  | SETTINGS.OUTPUT_RESOLUTION HDAUTO |
 
         """
 
+        self._libconfig.forget([self._libconfig.split(command)[0] for command in commands])
         self._open_connection(self.get_interface_attribute())
         settings_have_changed = False
-        for command in commands:
-            output = self._send_command("libconfig-set " + command)
+        try:
+            results = self._send_pipelined(["libconfig-set " + command for command in commands])
+        except:
+            if self._keep_telnet_open == False:
+                self._get_telnet_pool().discard(self._telnet_conn)
+                self._telnet_conn = None
+            raise
+        for rcode, output in results:
             if self._check_setting_has_changed(output) == True:
                 settings_have_changed = True
+        self._close_telnet()
         if self._reboot == True and settings_have_changed:
             self.reboot_stb()
         elif self._reboot == True and not settings_have_changed:
             logger.info("NOTE: No need to reboot STB since no changes to settings have been required")
-        self._close_telnet()
 
 
     def _check_setting_has_changed(self, output):
@@ -1740,20 +2288,98 @@ class STB(object):
             return True
 
 
-    def send_libconfig_get_command(self, command):
-        """    Send libconfig get command    ${command}
+    def send_libconfig_get_command(self, command, cached=False):
+        """    Send libconfig get command    ${command}    [${cached}]
 
         Sends a single command to return a libconfig-get value
 
+        With cached=${True} the value comes from the libconfig snapshot instead (see `Get Libconfig Values`)
+
         Example:-
-        | ${value}= | Send libconfig get command | NORFLASH.TVSYSTEM    |
+        | ${value}= | Send libconfig get command | NORFLASH.TVSYSTEM    |                |
+        | ${value}= | Send libconfig get command | NORFLASH.TVSYSTEM    | cached=${True} |
 
         """
+        if cached:
+            return self.get_libconfig_values(command)[0]
         self._open_connection(self.get_interface_attribute())
         output = self._send_command("libconfig-get " + command)
         self._close_telnet()
         return output
 
+    def get_libconfig_values(self, *keys):
+        """    Get libconfig values    ${key1}    [${key2}].....
+
+        Returns a list of the values of libconfig settings, from a snapshot of the STB's libconfig
+
+        The first call reads every setting with one libconfig-dump, and later calls are answered
+        from that snapshot without going to the STB.  Any keys that aren't in the dump are read
+        with libconfig-get, all in one go, and added to the snapshot.
+
+        Settings are dropped from the snapshot when set with `Send libconfig set commands` or
+        `Apply Libconfig Settings`, and the whole snapshot when the STB is rebooted or power
+        cycled, or `Send Commands` runs libconfig-set.  Use `Refresh Libconfig Snapshot` if
+        settings are changed some other way.
+
+        Example:-
+        | ${tvsystem}=           | Get libconfig values | NORFLASH.TVSYSTEM |                            |
+        | ${tvsystem}  ${res}=   | Get libconfig values | NORFLASH.TVSYSTEM | SETTINGS.OUTPUT_RESOLUTION |
+
+        """
+        if not self._libconfig.is_loaded():
+            self.refresh_libconfig_snapshot()
+        missing = self._libconfig.missing(keys)
+        if missing:
+            self._open_connection(self.get_interface_attribute())
+            try:
+                results = self._send_pipelined(["libconfig-get " + key for key in missing])
+            except:
+                if self._keep_telnet_open == False:
+                    self._get_telnet_pool().discard(self._telnet_conn)
+                    self._telnet_conn = None
+                raise
+            self._close_telnet()
+            for key, (rcode, output) in zip(missing, results):
+                if rcode == "0":
+                    self._libconfig.store(key, output)
+        return [self._libconfig.get(key) for key in keys]
+
+    def refresh_libconfig_snapshot(self):
+        """    Refresh libconfig snapshot
+
+        Reads every libconfig setting from the STB with one libconfig-dump, replacing the snapshot
+        used by `Get Libconfig Values`, and returns the settings as a dictionary
+
+        Example:-
+        | ${config}= | Refresh libconfig snapshot |
+
+        """
+        self._libconfig.invalidate()
+        return self._libconfig.parse(self.send_libconfig_dump_command())
+
+    def apply_libconfig_settings(self, *settings):
+        """    Apply libconfig settings  ${setting1}    [${setting2}].....
+
+        Makes the STB's libconfig match the settings given, writing only those that differ
+
+        Settings are given as for `Send libconfig set commands`.  The current values come from
+        the libconfig snapshot (see `Get Libconfig Values`), and only the settings whose value
+        differs are sent to libconfig-set, so nothing is written (and the STB isn't rebooted)
+        if it is already configured.  Returns the list of settings that were written.
+
+        Example:-
+        | @{changed}= | Apply libconfig settings | NORFLASH.TVSYSTEM NTSC-M | SETTINGS.OUTPUT_RESOLUTION HDAUTO |
+
+        """
+        self.get_libconfig_values(*[self._libconfig.split(setting)[0] for setting in settings])
+        changed = self._libconfig.changes(settings)
+        if changed:
+            logger.info("Writing libconfig settings: %s" % ", ".join(changed))
+            self.send_libconfig_set_commands(*changed)
+        else:
+            logger.info("Libconfig settings already applied")
+        return changed
+
     # Added by Steve Housley 16/01/2014.
     # Implements libconfig-dump command available in 3.3.0 Live and Ax4x Release.
     def send_libconfig_dump_command(self, group=""):
@@ -1761,6 +2387,8 @@ class STB(object):
 
         Sends a libconfig-dump with an optional "group" (defaults to "all groups") to return a list of configuration settings
 
+        The settings are also added to the libconfig snapshot (see `Get Libconfig Values`)
+
         Example:-
         | ${config}=    | Send libconfig dump command |                 |
         | ${config}=    | Send libconfig dump command | NORFLASH        |
@@ -1773,6 +2401,7 @@ class STB(object):
         tempfile = "/tmp/stbconfig.txt"
         output = self._send_command("libconfig-dump " + tempfile + " " + group + "; cat " + tempfile + "; rm " + tempfile)
         self._close_telnet()
+        self._libconfig.load(output)
         return output
 
     def get_dhcp_init_args(self):
@@ -1818,37 +2447,160 @@ class STB(object):
 
         Find IGMP stream in output from cat /proc/net/igmp and if found returns True otherwise False.
 
+        Only the first 'streamCount' groups of 'interface' are searched.  If `Start IGMP Watch` is running its
+        latest sample is searched, otherwise the table is read over the debug port.
+
         Needs modifying and testing with wifi!
 
         Examples:-
-        | ${ret}= | Find IGMP Stream |
+        | ${ret}= | Find IGMP Stream | 16FAFFEF | 3 | eth0 |
         """
 
         logger.info("DEBUG>> hexValue=" + hexValue + " streamCount=" + str(streamCount) + " interface=" + interface)
-        found = False
-        timeout = "3 seconds"
-        command = "cat /proc/net/igmp"
-        lines1 = self._debug.send_command_and_return_output(str(command), self._prompt, timeout)
-        logger.info("DEBUG>> lines1=" + lines1)
-        lines2 = lines1.split("\n")
-        searchActive = False
-        searchCount = 0
-        for line in lines2:
-            if interface in line:
-                searchActive = True
-                logger.info("DEBUG>> SEARCH ACTIVE!")
-                continue
-            if searchActive:
-                if hexValue in line:
-                    found = True
-                    logger.info("DEBUG>> FOUND!")
-                    break
-                else:
-                    searchCount = searchCount + 1
-                    if searchCount == streamCount:
-                        logger.warn("DEBUG>> NOT FOUND in " + str(streamCount) + " IGMP streams for " + interface)
-                        break
-        return found
+        if self._igmp_watch is not None and self._igmp_watch.samples:
+            memberships = self._igmp_watch.memberships
+        else:
+            timeout = "3 seconds"
+            command = "cat /proc/net/igmp"
+            memberships = IgmpTable.parse_igmp(self._debug.send_command_and_return_output(str(command), self._prompt, timeout))
+
+        groups = [membership for membership in memberships if membership.interface == interface][:int(streamCount)]
+        for membership in groups:
+            if membership.hex == hexValue.upper():
+                logger.info("DEBUG>> FOUND!")
+                return True
+        logger.warn("DEBUG>> NOT FOUND in " + str(len(groups)) + " IGMP streams for " + interface)
+        return False
+
+    def get_igmp_memberships(self, interface=None):
+        """  Return the multicast groups joined on the STB, read from /proc/net/igmp
+
+        Optionally only those joined on 'interface'.
+
+        Examples:
+        | ${groups}=    | Get IGMP Memberships  |           |
+        | ${groups}=    | Get IGMP Memberships  | eth0      |
+        """
+
+        output = self.send_command_and_return_output("cat /proc/net/igmp")
+        return [membership.group for membership in IgmpTable.parse_igmp(output)
+                if interface is None or membership.interface == interface]
+
+    def start_igmp_watch(self, interval="200 milliseconds"):
+        """  Start sampling the STB's IGMP table every 'interval', recording when groups are joined and left
+
+        The table is read over a telnet session of its own, so a check costs nothing once the watch is running.
+        Join and leave times are accurate to the interval.  Use `Wait For IGMP Join` and `Wait For IGMP Leave`
+        to time channel changes, and `Stop IGMP Watch` for every join and leave seen.
+
+        Examples:
+        | Start IGMP Watch      |                       |                   |                   |
+        | ${mark}=              | Mark IGMP Time        |                   |                   |
+        | Send Key              | CHUP                  |                   |                   |
+        | ${latency}=           | Wait For IGMP Join    | 239.255.250.22    | since=${mark}     |
+        """
+
+        if self._igmp_thread is not None:
+            self.stop_igmp_watch()
+
+        self._igmp_watch = IgmpTable.IgmpWatch()
+        self._igmp_abort.clear()
+        self._igmp_thread = threading.Thread(target=self._igmp_watch_thread,
+                                             args=(self.get_interface_attribute(), self._igmp_watch,
+                                                   utils.timestr_to_secs(interval)))
+        self._igmp_thread.daemon = True
+        self._igmp_thread.start()
+
+    def stop_igmp_watch(self):
+        """  Stop a watch started with `Start IGMP Watch`
+
+        Returns every join and leave seen, as "<host time> join|leave <interface> <group>"
+
+        Examples:
+        | @{events}=    | Stop IGMP Watch   |
+        """
+
+        if self._igmp_thread is None:
+            return []
+        self._igmp_abort.set()
+        self._igmp_thread.join()
+        self._igmp_thread = None
+        events = ["%.3f %s %s %s" % event for event in self._igmp_watch.events]
+        self._igmp_watch = None
+        return events
+
+    def mark_igmp_time(self):
+        """  Return the host time now, to time an IGMP join or leave from with `Wait For IGMP Join` 'since'
+
+        Mark the time before the key press or request that should make the STB join or leave a group, as
+        the join can be seen before the wait starts.
+
+        Examples:
+        | ${mark}=      | Mark IGMP Time        |                   |                   |
+        | Send Key      | CHUP                  |                   |                   |
+        | ${latency}=   | Wait For IGMP Join    | 239.255.250.22    | since=${mark}     |
+        """
+        if self._igmp_watch is None:
+            raise STBError("No IGMP watch running, use 'Start IGMP Watch' first")
+        return "%.3f" % time.time()
+
+    def wait_for_igmp_join(self, group, timeout="10 seconds", interface=None, since=None):
+        """  Wait for the STB to join multicast 'group', returning the seconds it took
+
+        Needs `Start IGMP Watch`.  The time is taken from 'since', a time from `Mark IGMP Time`, or from when
+        the keyword is called if not given.  A join seen after 'since' counts even if it was before the
+        keyword was called.  Returns 0 if the group was already joined at 'since'.
+
+        Examples:
+        | ${latency}=   | Wait For IGMP Join    | 239.255.250.22    |                   |
+        | ${latency}=   | Wait For IGMP Join    | 239.255.250.22    | timeout=5 seconds |
+        | ${latency}=   | Wait For IGMP Join    | 239.255.250.22    | since=${mark}     |
+        """
+        return self._wait_for_igmp(group, "join", timeout, interface, since)
+
+    def wait_for_igmp_leave(self, group, timeout="10 seconds", interface=None, since=None):
+        """  Wait for the STB to leave multicast 'group', returning the seconds it took
+
+        Needs `Start IGMP Watch`.  'since' is as for `Wait For IGMP Join`.  Returns 0 if the group was not
+        joined at 'since'.
+
+        Examples:
+        | ${latency}=   | Wait For IGMP Leave   | 239.255.250.22    |                   |
+        | ${latency}=   | Wait For IGMP Leave   | 239.255.250.22    | since=${mark}     |
+        """
+        return self._wait_for_igmp(group, "leave", timeout, interface, since)
+
+    def _wait_for_igmp(self, group, event, timeout, interface, since=None):
+        if self._igmp_watch is None:
+            raise STBError("No IGMP watch running, use 'Start IGMP Watch' first")
+        try:
+            start = time.time() if since is None else float(since)
+        except ValueError:
+            raise STBError("'since' should be a time from 'Mark IGMP Time', not '%s'" % since)
+        seen = self._igmp_watch.wait(group, event, interface, after=start, timeout=utils.timestr_to_secs(timeout))
+        if seen is None:
+            raise STBError("IGMP %s of %s not seen within %s" % (event, group, timeout))
+        timetaken = round(max(seen - start, 0), 3)
+        logger.info("IGMP %s of %s seen in %ss" % (event, group, timetaken))
+        return timetaken
+
+    def _igmp_watch_thread(self, ip, watch, interval):
+        pool = self._get_telnet_pool()
+        conn = None
+        while not self._igmp_abort.is_set():
+            try:
+                if conn is None:
+                    conn = pool.acquire(ip, "igmp")
+                sent = time.time()
+                output = conn.execute_command("cat /proc/net/igmp")
+                # The table was read somewhere between sending and the reply
+                watch.update(IgmpTable.parse_igmp(output), (sent + time.time()) / 2)
+            except Exception as e:
+                logger.warn("IGMP watch unable to read table: %s" % e)
+                pool.discard(conn)
+                conn = None
+            self._igmp_abort.wait(interval)
+        pool.release(conn, ip, "igmp")
 
 
 
@@ -0,0 +1,386 @@
+"""
+Classes:
+    StatCollector - One thread sampling statistics from every STB, on a shared schedule
+    FleetStatsSink - CSV file holding every STB's samples, one row per STB per tick
+"""
+# Robot libraries
+from robot.api import logger
+
+# Standard libraries
+import csv
+import errno
+import os
+import re
+import select
+import socket
+import telnetlib
+import threading
+import time
+
+# Amino Libraries
+import StatSampler
+
+__version__ = "0.1 beta"
+
+# Longest a TCP connect to a box may take
+CONNECT_TIMEOUT = 5.0
+
+# Seconds before a box that could not be reached is connected to again,
+# doubling with each failure in a row up to MAX_RECONNECT_BACKOFF
+RECONNECT_BACKOFF = 5.0
+MAX_RECONNECT_BACKOFF = 300.0
+
+# Ticks a box may miss (still busy with an earlier sample, or not connected)
+# before its session is dropped and logged in again
+MAX_MISSED_TICKS = 3
+
+
+class StatCollector(object):
+    """     Samples statistics from any number of STBs from a single thread
+
+    With one `_capture_stats_thread` per box a rack of 20-40 STBs runs as
+    many threads, each with its own telnet session and its own idea of
+    when the next sample is due.  The collector instead keeps every box's
+    stats session in one select() loop.  Samples are taken on a grid of
+    'interval' seconds aligned to the epoch, so every box with the same
+    interval is sampled at the same tick (e.g. 10:22:30, 10:22:40...),
+    and the rows for a tick can be compared across the fleet.
+
+    Each box is added with a StatSampler, so a sample is a single command
+    (see StatSampler), and a callback that is handed each parsed sample.
+    If a sink (FleetStatsSink) is set every sample is also written to it.
+
+    Sessions connect and log in without blocking the loop, a connect
+    being given up after CONNECT_TIMEOUT.  A box that has missed
+    MAX_MISSED_TICKS ticks is logged in again, which covers reboots, and
+    one that cannot be reached is tried again after a backoff of its own,
+    so a dead box costs the rest of the rack nothing.
+
+    There is one collector per process, from `get_collector`.  Any host
+    and port will do, so the fake STB telnet server in
+    _utils/fake_stb_telnet.py can stand in for a rack.
+    """
+
+    _collector = None
+    _collector_lock = threading.Lock()
+
+    @classmethod
+    def get_collector(cls):
+        with cls._collector_lock:
+            if cls._collector is None:
+                cls._collector = StatCollector()
+            return cls._collector
+
+    def __init__(self):
+        self._boxes = {}
+        self._sink = None
+        self._lock = threading.RLock()
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def set_sink(self, sink):
+        """     Write every sample to 'sink' (a FleetStatsSink) from now on
+        """
+        with self._lock:
+            if self._sink is not None and self._sink is not sink:
+                self._sink.close()
+            self._sink = sink
+
+    def sink_path(self):
+        if self._sink is None:
+            return None
+        return self._sink.path
+
+    def add(self, name, host, sampler, interval, callback=None, port=23,
+            user="root", password="root2root", login_prompt="login: ",
+            password_prompt="Password: ", prompt="#", prompt_regex=False):
+        """     Start sampling box 'name' at 'host' every 'interval' seconds
+
+        'callback' is called from the collector thread with each sample, a
+        dictionary as returned by StatSampler.parse with the addition of
+        'tick' (the scheduled time), 'sent' and 'received' (host times).
+        """
+        box = _Box(name, host, port, sampler, float(interval), callback,
+                   user, password, login_prompt, password_prompt, prompt, prompt_regex)
+        box.connect()
+        with self._lock:
+            if name in self._boxes:
+                self._boxes[name].close()
+            self._boxes[name] = box
+        self._wake()
+
+    def remove(self, name):
+        """     Stop sampling box 'name'
+
+        Once this returns the box's callback will not be called again.
+        """
+        with self._lock:
+            box = self._boxes.pop(name, None)
+            if box is not None:
+                box.close()
+        self._wake()
+
+    def box_count(self):
+        return len(self._boxes)
+
+    def _wake(self):
+        os.write(self._wake_write, 'x')
+
+    def _run(self):
+        while True:
+            with self._lock:
+                boxes = list(self._boxes.values())
+
+            now = time.time()
+            due = min([box.due() for box in boxes] or [now + 60])
+            fds = [box.fileno() for box in boxes if box.fileno() is not None and not box.connecting()]
+            connecting = [box.fileno() for box in boxes if box.connecting()]
+
+            try:
+                readable, writable = select.select(fds + [self._wake_read], connecting, [], max(due - now, 0))[:2]
+            except (select.error, socket.error, ValueError):
+                # A session was closed under us, pick up the new list
+                time.sleep(0.1)
+                continue
+
+            if self._wake_read in readable:
+                os.read(self._wake_read, 4096)
+
+            with self._lock:
+                for box in self._boxes.values():
+                    if box.connecting() and box.fileno() in writable:
+                        box.on_connected()
+                    elif box.fileno() in readable:
+                        sample = box.on_readable()
+                        if sample is not None:
+                            self._deliver(box, sample)
+
+                now = time.time()
+                for box in self._boxes.values():
+                    if box.connecting() and now >= box.connect_end:
+                        box.on_connect_timeout()
+                    if now >= box.next_tick:
+                        box.on_tick(now)
+
+    def _deliver(self, box, sample):
+        if self._sink is not None:
+            try:
+                self._sink.write(box.name, sample)
+            except Exception as e:
+                logger.warn("Unable to write fleet stats: %s" % e)
+        if box.callback is not None:
+            try:
+                box.callback(sample)
+            except Exception as e:
+                logger.warn("Stats callback for %s failed: %s" % (box.name, e))
+
+
+class _Box(object):
+    """     One STB's stats session, driven by the collector's select loop
+    """
+
+    def __init__(self, name, host, port, sampler, interval, callback,
+                 user, password, login_prompt, password_prompt, prompt, prompt_regex):
+        self.name = name
+        self.callback = callback
+        self._host = host
+        self._port = port
+        self._command = sampler.command()
+        self._sampler = sampler
+        self._interval = interval
+        self._user = user
+        self._password = password
+        self._login_prompt = login_prompt
+        self._password_prompt = password_prompt
+        if prompt_regex:
+            self._prompt = re.compile(prompt)
+        else:
+            self._prompt = re.compile(re.escape(prompt))
+        self._conn = None
+        self._sock = None       # While connecting
+        self.connect_end = None
+        self._retry_at = 0
+        self._backoff = RECONNECT_BACKOFF
+        self._state = None      # login, password, prompt, ready, busy
+        self._buffer = ''
+        self._missed = 0
+        self._tick = None
+        self._sent = None
+        self.next_tick = (int(time.time() / interval) + 1) * interval
+
+    def fileno(self):
+        if self._sock is not None:
+            return self._sock.fileno()
+        if self._conn is None:
+            return None
+        return self._conn.fileno()
+
+    def connecting(self):
+        return self._sock is not None
+
+    def due(self):
+        # When the loop next has something to do for this box
+        if self._sock is not None:
+            return min(self.next_tick, self.connect_end)
+        return self.next_tick
+
+    def close(self):
+        for conn in (self._conn, self._sock):
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        self._conn = None
+        self._sock = None
+        self._state = None
+
+    def on_tick(self, now):
+        tick = self.next_tick
+        self.next_tick = (int(now / self._interval) + 1) * self._interval
+
+        if self._state == "ready":
+            self._missed = 0
+            self._tick = tick
+            self._sent = time.time()
+            self._buffer = ''
+            self._state = "busy"
+            self._write(self._command)
+            return
+
+        self._missed += 1
+        if self._sock is not None or now < self._retry_at:
+            return
+        if self._conn is None or self._missed > MAX_MISSED_TICKS:
+            self.connect()
+
+    def on_readable(self):
+        try:
+            data = self._conn.read_very_eager()
+        except (EOFError, socket.error) as e:
+            logger.info("Stats session to %s closed: %s" % (self.name, e))
+            self.close()
+            return None
+
+        self._buffer += data
+        if self._state == "login" and self._buffer.rstrip().endswith(self._login_prompt.strip()):
+            self._buffer = ''
+            self._state = "password"
+            self._write(self._user)
+        elif self._state == "password" and self._buffer.rstrip().endswith(self._password_prompt.strip()):
+            self._buffer = ''
+            self._state = "prompt"
+            self._write(self._password)
+        elif self._state == "prompt" and self._at_prompt():
+            self._buffer = ''
+            self._state = "ready"
+            self._backoff = RECONNECT_BACKOFF
+        elif self._state == "busy" and StatSampler.SECTION + " end" in self._buffer and self._at_prompt():
+            sample = self._sampler.parse(self._buffer)
+            sample["tick"] = self._tick
+            sample["sent"] = self._sent
+            sample["received"] = time.time()
+            self._buffer = ''
+            self._state = "ready"
+            return sample
+        return None
+
+    def _at_prompt(self):
+        # Only the end of the output can be the prompt
+        tail = self._buffer[-200:]
+        match = None
+        for match in self._prompt.finditer(tail):
+            pass
+        return match is not None and not tail[match.end():].strip()
+
+    def connect(self):
+        """     Starts connecting, finished by `on_connected` once select finds the socket writable
+        """
+        self.close()
+        self._missed = 0
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setblocking(0)
+            error = self._sock.connect_ex((self._host, self._port))
+        except socket.error as e:
+            self._failed(e)
+            return
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self._failed(os.strerror(error))
+            return
+        self.connect_end = time.time() + CONNECT_TIMEOUT
+
+    def on_connected(self):
+        error = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self._failed(os.strerror(error))
+            return
+        # Blocking again, so a write can't fail half sent, but never for long
+        self._sock.settimeout(CONNECT_TIMEOUT)
+        self._conn = telnetlib.Telnet()
+        self._conn.host, self._conn.port, self._conn.sock = self._host, self._port, self._sock
+        self._sock = None
+        self._buffer = ''
+        if self._login_prompt:
+            self._state = "login"
+        else:
+            self._state = "prompt"
+
+    def on_connect_timeout(self):
+        self._failed("no answer within %s seconds" % CONNECT_TIMEOUT)
+
+    def _failed(self, reason):
+        logger.info("Unable to open stats session to %s: %s, trying again in %s seconds" % (
+            self.name, reason, self._backoff))
+        self.close()
+        self._retry_at = time.time() + self._backoff
+        self._backoff = min(self._backoff * 2, MAX_RECONNECT_BACKOFF)
+
+    def _write(self, text):
+        try:
+            self._conn.write(text + "\n")
+        except (socket.error, AttributeError) as e:
+            logger.info("Stats session to %s failed: %s" % (self.name, e))
+            self.close()
+
+
+class FleetStatsSink(object):
+    """     One CSV file of statistics for every STB in the run
+
+    A row per STB per sample, with fixed columns, so a spreadsheet or
+    pandas can pivot a whole rack's CPU or memory by tick:
+
+    | Tick | STB | Timestamp | Sent(ms) | RoundTrip(ms) | CPU_IDLE(%) | FreeMemory(kB) | Quality(%) | SignalStrength(dBm) | Noisefloor(dBm) |
+
+    Tick is the scheduled sample time (host time, seconds since the epoch)
+    and Sent how long after it the command went out; Timestamp is the
+    STB's own date.  Statistics that were not collected are left empty.
+    """
+
+    COLUMNS = ("Tick", "STB", "Timestamp", "Sent(ms)", "RoundTrip(ms)", "CPU_IDLE(%)",
+               "FreeMemory(kB)", "Quality(%)", "SignalStrength(dBm)", "Noisefloor(dBm)")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        new = not os.path.isfile(path)
+        self._file = open(path, 'ab')
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(self.COLUMNS)
+
+    def write(self, name, sample):
+        wifi = sample.get("wifi", ("", "", ""))
+        row = ("%.3f" % sample["tick"], name, sample.get("timestamp", ""),
+               "%.1f" % ((sample["sent"] - sample["tick"]) * 1000),
+               "%.1f" % ((sample["received"] - sample["sent"]) * 1000),
+               sample.get("cpu", ""), sample.get("mem", "")) + tuple(wifi)
+        with self._lock:
+            self._writer.writerow(row)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,166 @@
+"""
+Functions:
+    parse_meminfo - /proc/meminfo to a dictionary of counter to int
+    free_memory - Free memory in kB (MemFree + Buffers + Cached) from parsed meminfo
+    parse_wireless - /proc/net/wireless to a dictionary of interface to WirelessRecord
+    parse_top_cpu - The CPU line of top to a dictionary of state to percentage
+    parse_qoemon - qoemon output to a list of QoemonRecord
+
+Classes:
+    WirelessRecord - One interface's line of /proc/net/wireless
+    QoemonRecord - One line of qoemon output
+    QoemonStream - Incremental parser for a qoemon left running
+"""
+# Standard libraries
+import re
+import threading
+import time
+from collections import namedtuple
+
+__version__ = "0.1 beta"
+
+# Lines of qoemon output a QoemonStream keeps
+QOEMON_HISTORY = 1000
+
+# busybox top: "CPU:  4.1% usr  2.0% sys  0.0% nic 93.8% idle  0.0% io ..."
+CPU_FIELD = re.compile(r'(\d+(?:\.\d+)?)%\s*([a-z]+)')
+
+# An interface's line of /proc/net/wireless:
+# "  wlan0: 0000   54.  -56.  -95.  0  0  0  0  0  0"
+WIRELESS_LINE = re.compile(r'^\s*([^\s:]+):\s*([0-9a-fA-F]+)\s+(-?\d+)\.?\s+(-?\d+)\.?\s+(-?\d+)\.?')
+
+WirelessRecord = namedtuple("WirelessRecord", "interface status quality level noise")
+
+
+def parse_meminfo(text):
+    """     Returns a dictionary of /proc/meminfo counter name to its value as an int (kB)
+    """
+    values = {}
+    for line in text.splitlines():
+        name, sep, rest = line.partition(':')
+        fields = rest.split()
+        if sep and fields:
+            try:
+                values[name.strip()] = int(fields[0])
+            except ValueError:
+                pass
+    return values
+
+
+def free_memory(meminfo):
+    """     Returns MemFree + Buffers + Cached in kB, or None if any is missing
+    """
+    try:
+        return meminfo["MemFree"] + meminfo["Buffers"] + meminfo["Cached"]
+    except KeyError:
+        return None
+
+
+def parse_wireless(text):
+    """     Returns a dictionary of interface name to WirelessRecord
+
+    'text' may be all of /proc/net/wireless or just the lines grep'd from
+    it.  Quality, level and noise are ints, with the '.' the kernel adds to
+    updated values removed.
+    """
+    records = {}
+    for line in text.splitlines():
+        match = WIRELESS_LINE.match(line)
+        if match:
+            interface, status, quality, level, noise = match.groups()
+            records[interface] = WirelessRecord(interface, status, int(quality), int(level), int(noise))
+    return records
+
+
+def parse_top_cpu(text):
+    """     Returns a dictionary of CPU state (usr, sys, idle...) to percentage, from top
+
+    Only the first line with an 'idle' figure is used, so 'text' can be
+    the whole of `top -n 1`.  Returns an empty dictionary if there isn't
+    one.
+    """
+    for line in text.splitlines():
+        fields = dict((name, float(value)) for value, name in CPU_FIELD.findall(line))
+        if "idle" in fields:
+            return fields
+    return {}
+
+
+def parse_qoemon(text, received=None):
+    """     Returns a QoemonRecord for every non blank line of qoemon output
+    """
+    return [QoemonRecord(line, received) for line in text.splitlines() if line.strip()]
+
+
+class QoemonRecord(object):
+    """     One line of qoemon output, split into whitespace separated fields
+
+    Columns are numbered from 1, as awk numbers them, so the record for
+    `qoemon -sP` has the video PTS count in column 2 and the audio PTS
+    count in column 4.  'received' is the host time the line was read, if
+    known.
+    """
+
+    def __init__(self, line, received=None):
+        self.line = line.rstrip('\r\n')
+        self.fields = self.line.split()
+        self.received = received
+
+    def column(self, number):
+        """     Returns column 'number' as an int, or None if it is missing or not a number
+        """
+        try:
+            return int(self.fields[int(number) - 1].rstrip(',;'))
+        except (IndexError, ValueError):
+            return None
+
+    def __str__(self):
+        return self.line
+
+
+class QoemonStream(object):
+    """     Parses the output of a qoemon left running, as it arrives
+
+    `feed` takes whatever has been read from the connection, which may end
+    part way through a line.  Complete lines become QoemonRecords, kept up
+    to QOEMON_HISTORY of them, and the rest waits for the next feed.  So
+    qoemon can be started once and sampled as often as needed, instead of
+    being started, and its output piped through awk, for every value.
+
+    Thread safe, so one thread can feed while others read `latest`.
+    """
+
+    def __init__(self, history=QOEMON_HISTORY):
+        self._lock = threading.Lock()
+        self._partial = ""
+        self._history = history
+        self.records = []
+        self.count = 0
+
+    def feed(self, data, received=None):
+        """     Adds 'data' read from qoemon, returns the records it completed
+        """
+        if received is None:
+            received = time.time()
+        with self._lock:
+            lines = (self._partial + data).split('\n')
+            self._partial = lines.pop()
+            records = [QoemonRecord(line, received) for line in lines if line.strip()]
+            if records:
+                self.records = (self.records + records)[-self._history:]
+                self.count += len(records)
+        return records
+
+    def latest(self):
+        """     Returns the last complete record, or None if there hasn't been one
+        """
+        with self._lock:
+            if self.records:
+                return self.records[-1]
+            return None
+
+    def since(self, when):
+        """     Returns the records received at or after host time 'when'
+        """
+        with self._lock:
+            return [record for record in self.records if record.received >= when]
@@ -0,0 +1,142 @@
+"""
+Classes:
+    StatSampler - Collects every enabled STB statistic with a single shell command
+"""
+# Standard libraries
+import time
+
+# Amino Libraries
+import StatParsers
+
+__version__ = "0.1 beta"
+
+# Starts each section of a sample's output.  The shell prints it from two
+# quoted halves so the echoed command line can never be mistaken for it
+SECTION = "@@STATS@@"
+
+
+class StatSampler(object):
+    """     Builds the shell command for one statistics sample and parses its output
+
+    A sample used to take a telnet round trip, and a wait for the prompt,
+    per value (date, top, meminfo to a tmp file, awk, three greps of
+    /proc/net/wireless, qoemon).  `command` instead returns one command
+    that prints every enabled statistic, each section headed by a SECTION
+    line, and `parse` turns the output back into a dictionary:
+
+    | timestamp | STB date, YYYYmmddHHMMSS                                  |
+    | cpu       | CPU idle %, from top                                      |
+    | mem       | MemFree + Buffers + Cached from /proc/meminfo, in kB      |
+    | wifi      | (quality, signal strength, noise floor) for the interface |
+    | qoemon    | qoemon output for the requested counters                  |
+
+    Statistics that were not enabled, or could not be parsed, are missing
+    from the dictionary.  The sections are parsed by StatParsers.
+    """
+
+    def __init__(self, mem=True, cpu=True, wifi=False, qoemon=False, wifi_interface="wlan0"):
+        self._mem = mem
+        self._cpu = cpu
+        self._wifi = wifi
+        self._qoemon = qoemon
+        self._wifi_interface = wifi_interface
+
+    def command(self):
+        parts = [self._section("timestamp"), "date +'%Y%m%d%H%M%S'"]
+        if self._cpu:
+            parts += [self._section("cpu"), "top -n 1 | head -n 2 | tail -n 1"]
+        if self._mem:
+            parts += [self._section("mem"), "cat /proc/meminfo"]
+        if self._wifi:
+            parts += [self._section("wifi"), "grep %s /proc/net/wireless" % self._wifi_interface]
+        if self._qoemon:
+            parts += [self._section("qoemon"), "qoemon -s %s -c 1" % self._qoemon]
+        parts.append(self._section("end"))
+        return "; ".join(parts)
+
+    def parse(self, output):
+        sections = self._split(output)
+        sample = {}
+
+        if sections.get("timestamp"):
+            sample["timestamp"] = sections["timestamp"][0].strip()
+
+        if sections.get("cpu"):
+            idle = self._parse_cpu(sections["cpu"][0])
+            if idle is not None:
+                sample["cpu"] = idle
+
+        if sections.get("mem"):
+            free = self._parse_mem(sections["mem"])
+            if free is not None:
+                sample["mem"] = free
+
+        if sections.get("wifi"):
+            record = StatParsers.parse_wireless("\n".join(sections["wifi"])).get(self._wifi_interface)
+            if record is not None:
+                sample["wifi"] = (str(record.quality), str(record.level), str(record.noise))
+
+        if "qoemon" in sections:
+            sample["qoemon"] = "\n".join(sections["qoemon"])
+
+        return sample
+
+    def _section(self, name):
+        half = len(SECTION) // 2
+        return "echo '%s''%s' %s" % (SECTION[:half], SECTION[half:], name)
+
+    def _split(self, output):
+        sections = {}
+        current = None
+        for line in output.splitlines():
+            line = line.rstrip('\r')
+            if line.startswith(SECTION + " "):
+                current = line[len(SECTION) + 1:].strip()
+                sections[current] = []
+            elif current is not None and line.strip():
+                sections[current].append(line)
+        return sections
+
+    def _parse_cpu(self, line):
+        fields = StatParsers.parse_top_cpu(line)
+        if "idle" in fields:
+            return "%.1f" % fields["idle"]
+        try:
+            return line.split()[7].rstrip("%")
+        except IndexError:
+            return None
+
+    def _parse_mem(self, lines):
+        free = StatParsers.free_memory(StatParsers.parse_meminfo("\n".join(lines)))
+        if free is None:
+            return None
+        return str(free)
+
+
+class SampleClock(object):
+    """     Schedules samples on a fixed grid of 'interval' seconds
+
+    `wait` sleeps until the next tick, measured from the start rather than
+    from when the last sample finished, so slow samples do not make the
+    interval drift.  A sample that overruns one or more ticks skips them.
+    Waiting is on 'abort' (a threading.Event), so setting it ends the wait
+    at once.  If the host clock steps backwards the grid restarts from now.
+    """
+
+    def __init__(self, interval, abort):
+        self._interval = float(interval)
+        self._abort = abort
+        self._start = time.time()
+        self._ticks = 0
+
+    def wait(self):
+        """     Returns False if 'abort' was set while waiting
+        """
+        now = time.time()
+        if now < self._start + self._ticks * self._interval - self._interval:
+            self._start = now
+            self._ticks = 0
+        self._ticks = max(self._ticks + 1, int((now - self._start) / self._interval) + 1)
+        delay = self._start + self._ticks * self._interval - now
+        self._abort.wait(delay)
+        return not self._abort.is_set()
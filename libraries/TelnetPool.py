@@ -0,0 +1,125 @@
+"""
+Classes:
+    TelnetPool - Keeps logged in telnet sessions to an STB for reuse between keywords
+"""
+# Robot libraries
+import robot.libraries.Telnet as Telnet
+from robot.api import logger
+
+# Standard libraries
+import select
+import threading
+
+__version__ = "0.1 beta"
+
+# Sent to a pooled session before it is reused.  Checks the shell still
+# answers and puts it back in the home directory, as a new login would be
+HEALTH_CHECK = "cd"
+
+
+class TelnetPool(object):
+    """     Logged in telnet sessions to one STB, reused between keywords
+
+    Keywords such as `Send Commands` or `Send Libconfig Get Command` used to
+    open a telnet session, log in and sleep for 2 seconds every call.  With
+    the pool, `acquire` hands back the session a previous keyword
+    `release`d, and only logs in when there isn't one.
+
+    Before a pooled session is reused it is health checked: a session the
+    STB has closed (e.g. because it rebooted) is noticed straight away, and
+    otherwise HEALTH_CHECK is run, which has to return to the prompt.  A
+    session that fails the check is dropped and a new one logged in, so
+    reboots need no special handling by the keywords.
+
+    New sessions are ready as soon as the prompt is read after logging in,
+    rather than after a fixed sleep.
+
+    Sessions are pooled per (ip, purpose), so the stats thread ("stats")
+    does not share a session with the keywords ("telnet").
+    """
+
+    def __init__(self, user, password, login_prompt, password_prompt, prompt, prompt_regex=False,
+                 newline="\n", encoding="UTF-8", terminal_type="vt100", timeout="3 seconds"):
+        self._user = user
+        self._password = password
+        self._login_prompt = login_prompt
+        self._password_prompt = password_prompt
+        self._prompt = prompt
+        self._prompt_regex = prompt_regex
+        self._newline = newline
+        self._encoding = encoding
+        self._terminal_type = terminal_type
+        self._timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, ip, purpose="telnet"):
+        """     Returns a logged in Robot Telnet library instance for 'ip'
+        """
+        with self._lock:
+            conn = self._idle.pop((ip, purpose), None)
+        if conn is not None:
+            if self._healthy(conn):
+                return conn
+            logger.info("Pooled telnet session to %s failed its health check, logging in again" % ip)
+            self._close(conn)
+        return self._login(ip)
+
+    def release(self, conn, ip, purpose="telnet"):
+        """     Hands 'conn' back to the pool for the next keyword to use
+        """
+        if conn is None:
+            return
+        with self._lock:
+            old = self._idle.pop((ip, purpose), None)
+            self._idle[(ip, purpose)] = conn
+        if old is not None and old is not conn:
+            self._close(old)
+
+    def discard(self, conn):
+        """     Closes 'conn' rather than returning it to the pool
+        """
+        if conn is not None:
+            self._close(conn)
+
+    def close_all(self):
+        """     Closes every pooled session, e.g. before the STB reboots
+        """
+        with self._lock:
+            idle = self._idle.values()
+            self._idle = {}
+        for conn in idle:
+            self._close(conn)
+
+    def _login(self, ip):
+        conn = Telnet.Telnet(newline=self._newline)
+        conn.open_connection(ip, prompt=self._prompt, prompt_is_regexp=self._prompt_regex,
+                             encoding=self._encoding, encoding_errors="strict",
+                             terminal_emulation=True, terminal_type=self._terminal_type,
+                             window_size='400x100')
+        if self._login_prompt is not None:
+            # With the prompt set login returns as soon as the prompt is read
+            conn.login(self._user, self._password, login_prompt=self._login_prompt,
+                       password_prompt=self._password_prompt, login_timeout="2 seconds")
+        else:
+            conn.read_until_prompt()
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            sock = conn._conn.get_socket()
+            if select.select([sock], [], [], 0)[0]:
+                # Readable while idle: either stray output or the STB hung up
+                conn._conn.read_very_eager()
+            conn.set_timeout(self._timeout)
+            conn.execute_command(HEALTH_CHECK)
+            return True
+        except Exception as e:
+            logger.debug("Telnet health check failed: %s" % e)
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close_all_connections()
+        except Exception:
+            pass
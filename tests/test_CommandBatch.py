@@ -0,0 +1,78 @@
+"""     Tests for libraries/CommandBatch.py
+
+Run from the top of the repository with:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libraries"))
+
+import CommandBatch
+
+
+def shell_output(batch, outputs, prompt="/root # ", codes=None):
+    """     Returns what a shell echoing every line after 'prompt' would print for 'batch'
+    """
+    lines = []
+    for index, output in enumerate(outputs):
+        sent = batch.script(index).splitlines()
+        lines.append(prompt + sent[0])
+        lines.append("%s %s %d begin" % (CommandBatch.MARK, batch._token, index))
+        lines.append(prompt + sent[1])
+        lines.extend(output)
+        lines.append(prompt + sent[2])
+        lines.append("%s %s %d end %s" % (CommandBatch.MARK, batch._token, index, codes[index] if codes else 0))
+    return "\r\n".join(lines) + "\r\n"
+
+
+class CommandBatchParseTest(unittest.TestCase):
+
+    def test_output_and_return_codes(self):
+        batch = CommandBatch.CommandBatch(["ls /mnt/nv", "false"])
+        output = shell_output(batch, [["a.txt", "b.txt"], []], codes=[0, 1])
+        self.assertEqual(batch.parse(output), [("0", "a.txt\nb.txt"), ("1", "")])
+
+    def test_echo_without_prompt_is_dropped(self):
+        batch = CommandBatch.CommandBatch(["pwd", "ls"])
+        output = shell_output(batch, [["/root/tools"], ["x"]], prompt="")
+        self.assertEqual(batch.parse(output), [("0", "/root/tools"), ("0", "x")])
+
+    def test_output_ending_in_a_later_command_is_kept(self):
+        # "/root/tools" ends with "ls", the next command, but is not an echo of it
+        batch = CommandBatch.CommandBatch(["pwd", "ls"])
+        output = shell_output(batch, [["/root/tools"], ["a.txt"]])
+        self.assertEqual(batch.parse(output), [("0", "/root/tools"), ("0", "a.txt")])
+
+    def test_output_ending_in_its_own_command_is_kept(self):
+        batch = CommandBatch.CommandBatch(["libconfig-get NORFLASH.HOST_IP"])
+        output = shell_output(batch, [["no NORFLASH.HOST_IP"]])
+        self.assertEqual(batch.parse(output), [("0", "no NORFLASH.HOST_IP")])
+
+    def test_output_equal_to_a_later_command_is_kept(self):
+        # Every line echoed before any output, as a shell without line editing does
+        batch = CommandBatch.CommandBatch(["echo ls", "ls"])
+        sent = "".join(batch.script(index) for index in range(len(batch))).splitlines()
+        output = "\r\n".join(sent + [
+            "%s %s 0 begin" % (CommandBatch.MARK, batch._token), "ls", "%s %s 0 end 0" % (CommandBatch.MARK, batch._token),
+            "%s %s 1 begin" % (CommandBatch.MARK, batch._token), "a.txt", "%s %s 1 end 0" % (CommandBatch.MARK, batch._token)])
+        self.assertEqual(batch.parse(output), [("0", "ls"), ("0", "a.txt")])
+
+    def test_echo_interleaved_with_output_is_dropped(self):
+        batch = CommandBatch.CommandBatch(["echo ls", "ls"])
+        output = shell_output(batch, [["ls"], ["a.txt"]], prompt="")
+        self.assertEqual(batch.parse(output), [("0", "ls"), ("0", "a.txt")])
+
+    def test_queued_lines_echoed_early_are_dropped(self):
+        # The second command's lines are echoed, after the prompt, before the first's output
+        batch = CommandBatch.CommandBatch(["pwd", "ls"])
+        first, second = [batch.script(index).splitlines() for index in range(len(batch))]
+        output = "\r\n".join(["/root # " + line for line in first + second] + [
+            "%s %s 0 begin" % (CommandBatch.MARK, batch._token), "/root", "%s %s 0 end 0" % (CommandBatch.MARK, batch._token),
+            "%s %s 1 begin" % (CommandBatch.MARK, batch._token), "a.txt", "%s %s 1 end 0" % (CommandBatch.MARK, batch._token)])
+        self.assertEqual(batch.parse(output), [("0", "/root"), ("0", "a.txt")])
+
+
+if __name__ == "__main__":
+    unittest.main()
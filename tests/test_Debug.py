@@ -0,0 +1,110 @@
+"""     Tests for the listener matching of libraries/Debug.py
+
+Run from the top of the repository with:
+    python -m unittest discover tests
+"""
+import os
+import re
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libraries"))
+
+import Debug
+
+
+def heard(hits):
+    return [(Debug._listener_name(hit.listener), hit.line) for hit in hits]
+
+
+class ListenerMatcherTest(unittest.TestCase):
+
+    def test_anchored_listener_inside_a_chunk(self):
+        matcher = Debug.ListenerMatcher()
+        hits = matcher.feed("12 x\nStarting app\n", [re.compile("^Starting")])
+        self.assertEqual(heard(hits), [("^Starting", "Starting app")])
+
+    def test_end_anchor_before_crlf(self):
+        matcher = Debug.ListenerMatcher()
+        hits = matcher.feed("all done\r\nnot done yet\r\n", [re.compile("done$")])
+        self.assertEqual(heard(hits), [("done$", "all done")])
+
+    def test_backreference_alongside_other_listeners(self):
+        matcher = Debug.ListenerMatcher()
+        listeners = ["boot", re.compile(r"(\w+)=\1")]
+        hits = matcher.feed("a=b\nx=x\nboot\n", listeners)
+        self.assertEqual(heard(hits), [(r"(\w+)=\1", "x=x"), ("boot", "boot")])
+
+    def test_listener_split_across_chunks(self):
+        matcher = Debug.ListenerMatcher()
+        listeners = [re.compile("^Starting")]
+        self.assertEqual(matcher.feed("x\nStar", listeners), [])
+        self.assertEqual(heard(matcher.feed("ting now\n", listeners)), [("^Starting", "Starting now")])
+
+    def test_end_anchor_waits_for_the_whole_line(self):
+        matcher = Debug.ListenerMatcher()
+        listeners = [re.compile("done$")]
+        self.assertEqual(matcher.feed("not done", listeners), [])
+        self.assertEqual(matcher.feed(" yet\r\n", listeners), [])
+        self.assertEqual(heard(matcher.feed("all done\r\n", listeners)), [("done$", "all done")])
+
+    def test_string_listener_heard_on_a_partial_line_once(self):
+        matcher = Debug.ListenerMatcher()
+        self.assertEqual(heard(matcher.feed("login:", ["login:"])), [("login:", "login:")])
+        self.assertEqual(matcher.feed(" root\n", ["login:"]), [])
+
+
+class ListenerSubscriptionTest(unittest.TestCase):
+
+    def test_callback_hits_are_not_queued(self):
+        calls = []
+        subscription = Debug.ListenerSubscription("boot", callback=calls.append)
+        for n in range(5):
+            subscription._notify(Debug.ListenerHit("boot", "boot %d" % n, n))
+        self.assertEqual(len(calls), 5)
+        self.assertTrue(subscription.heard.empty())
+
+    def test_queue_keeps_the_latest_hits(self):
+        subscription = Debug.ListenerSubscription("boot")
+        for n in range(Debug.MAX_HEARD + 10):
+            subscription._notify(Debug.ListenerHit("boot", "boot %d" % n, n))
+        self.assertEqual(subscription.heard.qsize(), Debug.MAX_HEARD)
+        self.assertEqual(subscription.wait(0).line, "boot 10")
+
+
+class RxBufferTest(unittest.TestCase):
+
+    def test_wait_quiet_outlasts_stray_prompts(self):
+        buffer = Debug.RxBuffer()
+
+        def prompts():
+            for n in range(3):
+                time.sleep(0.05)
+                buffer.append("/ # ")
+        thread = threading.Thread(target=prompts)
+        thread.start()
+        self.assertTrue(buffer.wait_quiet(0.2, 2))
+        thread.join()
+        self.assertEqual(buffer.getvalue(), "/ # " * 3)
+
+    def test_wait_quiet_gives_up_on_a_busy_console(self):
+        buffer = Debug.RxBuffer()
+        stop = threading.Event()
+
+        def chatter():
+            while not stop.is_set():
+                buffer.append("log line\n")
+                time.sleep(0.01)
+        thread = threading.Thread(target=chatter)
+        thread.start()
+        try:
+            self.assertFalse(buffer.wait_quiet(0.2, 0.5))
+        finally:
+            stop.set()
+            thread.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""     Tests for libraries/DebugHub.py, with pseudo-terminals standing in for serial ports
+
+Run from the top of the repository with:
+    python -m unittest discover tests
+"""
+import os
+import pty
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libraries"))
+
+import DebugHub
+
+
+class FakeSerial(object):
+
+    def __init__(self, fd):
+        self._fd = fd
+
+    def fileno(self):
+        return self._fd
+
+    def inWaiting(self):
+        return 0
+
+    def read(self, size):
+        return os.read(self._fd, 4096)
+
+
+class FakeDebug(object):
+    """     The parts of Debug the hub uses
+    """
+
+    def __init__(self, name, fd, callback=None):
+        self._conn = FakeSerial(fd)
+        self._commport = name
+        self._connected = True
+        self.output = ''
+        self._callback = callback
+
+    def _process_output(self, output, rxtime):
+        self.output += output
+        if self._callback is not None:
+            self._callback(self)
+
+
+def wait_until(condition, timeout=2.0):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class DebugHubTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hub = DebugHub.DebugHub()
+        self.ptys = []
+
+    def tearDown(self):
+        for fd in self.ptys:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def port(self, name, callback=None):
+        master, slave = pty.openpty()
+        self.ptys += [master, slave]
+        debug = FakeDebug(name, slave, callback)
+        self.hub.register(debug)
+        return master, debug
+
+    def test_bad_fd_fails_only_its_capture(self):
+        good_master, good = self.port("good")
+        bad_master, bad = self.port("bad")
+        os.close(bad._conn.fileno())
+        self.hub._wake()
+        self.assertTrue(wait_until(lambda: not bad._connected))
+        os.write(good_master, "still here\n")
+        self.assertTrue(wait_until(lambda: "still here" in good.output))
+        self.assertTrue(good._connected)
+        self.assertEqual(self.hub.port_count(), 1)
+
+    def test_callback_can_unregister_its_own_port(self):
+        master, debug = self.port("stop", callback=self.hub.unregister)
+        os.write(master, "stop\n")
+        self.assertTrue(wait_until(lambda: self.hub.port_count() == 0))
+        other_master, other = self.port("other")
+        os.write(other_master, "next\n")
+        self.assertTrue(wait_until(lambda: "next" in other.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""     Tests for libraries/ESTBRestBatch.py
+
+Run from the top of the repository with:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libraries"))
+
+import ESTBRestBatch
+from ESTBRestClient import RestResponse
+
+
+class FakeSTB(object):
+    """     Answers batch requests, with every request to a missing object failing
+    """
+
+    def __init__(self):
+        self.objects = set()
+        self.next_id = 1
+        self.sent = []
+
+    def send(self, method, path, data):
+        self.sent.append((method, path))
+        parts = path.split("/")
+        if len(parts) == 1 and method == "POST":
+            new_id = str(self.next_id)
+            self.next_id += 1
+            self.objects.add("%s/%s" % (parts[0], new_id))
+            return RestResponse(200, "OK", {}, '{"id": "%s"}' % new_id, 0.0)
+        if "/".join(parts[:2]) not in self.objects:
+            return RestResponse(404, "Not Found", {}, '{"error": "not found"}', 0.0)
+        if method == "DELETE":
+            self.objects.discard(path)
+        return RestResponse(200, "OK", {}, '{"result": "ok"}', 0.0)
+
+
+class ESTBRestBatchTest(unittest.TestCase):
+
+    def test_rollback_closes_what_the_batch_opened(self):
+        stb = FakeSTB()
+        results = ESTBRestBatch.ESTBRestBatch(
+            [["open player", "udp://a:1"], ["open recorder", "udp://b:1", "asset"], ["play player", "9"]]).run(stb.send)
+        self.assertEqual([result["ok"] for result in results], [True, True, False])
+        self.assertEqual(stb.objects, set())
+        self.assertEqual(stb.sent[-2:], [("DELETE", "recorder/2"), ("DELETE", "player/1")])
+
+    def test_rollback_leaves_objects_the_batch_closed(self):
+        stb = FakeSTB()
+        results = ESTBRestBatch.ESTBRestBatch(
+            [["open player", "udp://a:1"], ["seek player", "@1", "10"], ["close player", "@1"],
+             ["get player", "@1"]]).run(stb.send)
+        self.assertEqual([result["ok"] for result in results], [True, True, True, False])
+        self.assertEqual([sent for sent in stb.sent if sent[0] == "DELETE"], [("DELETE", "player/1")])
+
+    def test_bad_steps_fail_before_anything_is_sent(self):
+        stb = FakeSTB()
+        for steps in ([["fly player"]], [["play player"]], [["play player", "@2"], ["open player", "x"]]):
+            self.assertRaises(ValueError, ESTBRestBatch.ESTBRestBatch, steps)
+        self.assertEqual(stb.sent, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
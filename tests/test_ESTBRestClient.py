@@ -0,0 +1,83 @@
+"""     Tests for libraries/ESTBRestClient.py, against the fake REST API of _utils/fake_estb_rest.py
+
+Run from the top of the repository with:
+    python -m unittest discover tests
+"""
+import json
+import os
+import socket
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "libraries"))
+sys.path.insert(0, os.path.join(HERE, "..", "_utils"))
+
+import ESTBRestClient
+import fake_estb_rest
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class ESTBRestClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.port = free_port()
+        self.server = fake_estb_rest.start_servers(["127.0.0.1"], self.port)[0]
+        self.client = ESTBRestClient.ESTBRestClient("127.0.0.1", self.port)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_curl_form_output(self):
+        response = self.client.request("POST", "player", '{"window_type": "main"}')
+        output = ESTBRestClient.curl_output(response)
+        self.assertTrue(output.startswith("HTTP/1.1 200 OK\r\n"))
+        self.assertTrue("\r\nContent-Type: application/json\r\n" in output)
+        self.assertEqual(json.loads(output.split("\r\n\r\n", 1)[1]), {"id": "1"})
+        parsed = ESTBRestClient.parse_curl_output(output)
+        self.assertEqual((parsed.status, parsed.reason, parsed.text), (200, "OK", response.text))
+
+    def test_get_data_is_the_query_string(self):
+        self.client.request("POST", "player", None)
+        response = self.client.request("GET", "player/1", "audio")
+        self.assertEqual(json.loads(response.text), {"audio": fake_estb_rest.PLAYER["audio"]})
+        response = self.client.request("GET", "player/1?audio", "subtitle")
+        self.assertEqual(sorted(json.loads(response.text)), ["audio", "subtitle"])
+
+    def test_quoted_data_is_unquoted(self):
+        # As the curl keywords are given it, escaped for the STB's shell
+        self.client.request("POST", "player", '"{\\"window_type\\":\\"pip\\"}"')
+        response = self.client.request("GET", "player/1", None)
+        self.assertEqual(json.loads(response.text)["window_type"], "pip")
+
+    def test_request_data(self):
+        self.assertEqual(ESTBRestClient.request_data('"{\\"a\\":\\"b c\\"}"'), '{"a":"b c"}')
+        self.assertEqual(ESTBRestClient.request_data("'{\"a\": 1}'"), '{"a": 1}')
+        self.assertEqual(ESTBRestClient.request_data('{"a": 1}'), '{"a": 1}')
+        for empty in (None, "", "None", '""', "''"):
+            self.assertEqual(ESTBRestClient.request_data(empty), None)
+
+    def test_unreachable_port_falls_back_to_curl(self):
+        self.assertTrue(self.client.reachable())
+        self.server.shutdown()
+        self.server.server_close()
+        # A refused connect means nothing was sent, so the caller can send it again by curl
+        self.assertRaises(ESTBRestClient.ESTBRestUnreachable, self.client.request, "POST", "player", None)
+        self.assertFalse(self.client.reachable())
+
+    def test_never_reachable(self):
+        client = ESTBRestClient.ESTBRestClient("127.0.0.1", free_port())
+        self.assertFalse(client.reachable())
+
+
+if __name__ == "__main__":
+    unittest.main()
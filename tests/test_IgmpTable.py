@@ -0,0 +1,45 @@
+"""     Tests for libraries/IgmpTable.py
+
+Run from the top of the repository with:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libraries"))
+
+import IgmpTable
+
+GROUP = "239.255.250.22"
+
+
+def membership(group):
+    return IgmpTable.IgmpMembership("eth0", group, IgmpTable.group_to_hex(group), 1, False, 0, 0)
+
+
+class IgmpWatchTest(unittest.TestCase):
+
+    def test_join_before_the_wait_is_timed_from_after(self):
+        # Joined during the key press, seen before the wait was called
+        watch = IgmpTable.IgmpWatch()
+        watch.update([], 100.0)
+        watch.update([membership(GROUP)], 100.6)
+        self.assertEqual(watch.wait(GROUP, after=100.2, timeout=0), 100.6)
+
+    def test_already_joined_at_after(self):
+        watch = IgmpTable.IgmpWatch()
+        watch.update([membership(GROUP)], 100.0)
+        watch.update([membership(GROUP)], 100.6)
+        self.assertEqual(watch.wait(GROUP, after=100.2, timeout=0), 100.2)
+
+    def test_leave_after(self):
+        watch = IgmpTable.IgmpWatch()
+        watch.update([membership(GROUP)], 100.0)
+        watch.update([], 100.6)
+        self.assertEqual(watch.wait(GROUP, "leave", after=100.2, timeout=0), 100.6)
+        self.assertEqual(watch.wait(GROUP, after=100.2, timeout=0), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
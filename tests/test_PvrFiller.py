@@ -0,0 +1,49 @@
+"""     Tests for libraries/PvrFiller.py
+
+Run from the top of the repository with:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "libraries"))
+
+import PvrFiller
+
+DF = ("Filesystem           1K-blocks      Used Available Use% Mounted on\n"
+      "/dev/sda1            976283648 488141824 488141824  50% /mnt/hd\n")
+
+DF_WRAPPED = ("Filesystem           1K-blocks      Used Available Use% Mounted on\n"
+              "/dev/disk/by-label/a-very-long-pvr-label\n"
+              "                     976283648 488141824 488141824  50% /mnt/hd\n")
+
+
+class ParseDfTest(unittest.TestCase):
+
+    def test_data_line(self):
+        self.assertEqual(PvrFiller.parse_df(DF), (976283648, 488141824))
+
+    def test_wrapped_device_name(self):
+        self.assertEqual(PvrFiller.parse_df(DF_WRAPPED), (976283648, 488141824))
+
+    def test_no_data_line(self):
+        self.assertRaises(ValueError, PvrFiller.parse_df, "df: /PVR: No such file or directory\n")
+
+
+class ParsePollTest(unittest.TestCase):
+
+    def test_running(self):
+        filler = PvrFiller.PvrFiller()
+        self.assertEqual(filler.parse_poll(DF + PvrFiller.RUNNING + "\n"), (488141824, True))
+
+    def test_job_done_line_after_df(self):
+        # The shell reports the background fill done after the df output
+        filler = PvrFiller.PvrFiller()
+        done = "[1]+  Done                    ( for k in 0 1 2 3; do ( n=$((1+k)); wait ) > /dev/null 2>&1\n"
+        self.assertEqual(filler.parse_poll(DF + done), (488141824, False))
+        self.assertEqual(filler.parse_poll(done + DF_WRAPPED), (488141824, False))
+
+
+if __name__ == "__main__":
+    unittest.main()